@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Any, Dict, List
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.profiling import authorized, profile_store
+
+router = APIRouter()
+
+def require_debug_token(x_debug_token: str = Header(None)):
+    """X-Debug-Token ヘッダーが PROFILING_TOKEN と一致するか確認（プロファイル無効時は 404）"""
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not authorized(x_debug_token):
+        raise HTTPException(status_code=403, detail="権限がありません")
+
+@router.get("/profiles", dependencies=[Depends(require_debug_token)])
+async def list_profiles() -> List[Dict[str, Any]]:
+    """保存済みのプロファイルの一覧（新しい順、サンプルとタイムラインを除く）"""
+    try:
+        return await run_in_threadpool(profile_store.list)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"プロファイル取得エラー: {str(e)}")
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_debug_token)])
+async def get_profile(profile_id: int) -> Dict[str, Any]:
+    """プロファイル（スタックのサンプルとストレージ操作のタイムライン）を取得"""
+    entry = await run_in_threadpool(profile_store.get, profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="プロファイルが見つかりません（上書き済みの可能性があります）")
+    return entry
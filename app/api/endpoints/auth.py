@@ -1,10 +1,9 @@
 from fastapi import APIRouter, HTTPException, Depends
 from datetime import datetime
 import logging
-from google.cloud.firestore_v1.base_query import FieldFilter
 from app.schemas.user import UserCreate, UserLogin, Token, UserResponse
-from app.core.database import db
-from app.core.auth import get_password_hash, verify_password, create_access_token
+from app.storage import EmailAlreadyExistsError, StorageBackend, get_storage
+from app.core.auth import get_password_hash_async, verify_password_async, create_access_token
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -13,23 +12,12 @@ logging.basicConfig(level=logging.INFO)
 router = APIRouter()
 
 @router.post("/signup", response_model=Token)
-async def signup(user: UserCreate):
+async def signup(user: UserCreate, storage: StorageBackend = Depends(get_storage)):
     """新規会員登録"""
     logger.info(f"Signup attempt for email: {user.email}")
     try:
-        users_collection = db.collection("users")
-        
-        # すでにメールアドレスが使われていないかチェック
-        logger.info("Checking if email already exists in Firestore...")
-        existing_users = users_collection.where(filter=FieldFilter("email", "==", user.email.strip())).limit(1).get()
-        logger.info("Firestore query for existing users completed.")
-        
-        if len(list(existing_users)) > 0:
-            logger.warning(f"Signup failed: Email {user.email} already exists.")
-            raise HTTPException(status_code=400, detail="このメールアドレスは既に登録されています")
-        
         now = datetime.now().isoformat()
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await get_password_hash_async(user.password)
         
         user_data = {
             "name": user.name.strip(),
@@ -41,17 +29,21 @@ async def signup(user: UserCreate):
             "updatedAt": now
         }
         
-        logger.info("Creating new user in Firestore...")
-        doc_ref = users_collection.document()
-        doc_ref.set(user_data)
-        logger.info(f"User created successfully with ID: {doc_ref.id}")
+        # メールアドレスの重複はユーザーと同時に作成する索引で判定する（同時登録でも一方のみ成功）
+        logger.info("Creating new user...")
+        try:
+            created = await storage.create_user(user_data)
+        except EmailAlreadyExistsError:
+            logger.warning(f"Signup failed: Email {user.email} already exists.")
+            raise HTTPException(status_code=400, detail="このメールアドレスは既に登録されています")
+        logger.info(f"User created successfully with ID: {created['id']}")
         
         user_response = UserResponse(
-            id=doc_ref.id,
+            id=created["id"],
             **{k: v for k, v in user_data.items() if k != "password"}
         )
         
-        access_token = create_access_token(data={"sub": doc_ref.id, "role": user_data["role"]})
+        access_token = create_access_token(data={"sub": created["id"], "role": user_data["role"]})
         
         return Token(
             access_token=access_token,
@@ -65,36 +57,42 @@ async def signup(user: UserCreate):
         raise HTTPException(status_code=500, detail=f"サインアップエラー: {str(e)}")
 
 @router.post("/login", response_model=Token)
-async def login(login_data: UserLogin):
+async def login(login_data: UserLogin, storage: StorageBackend = Depends(get_storage)):
     """ログイン"""
     logger.info(f"Login attempt for email: {login_data.email}")
     try:
-        users_collection = db.collection("users")
-        
-        # メールアドレスでユーザーを検索
-        logger.info("Searching for user in Firestore...")
-        query = users_collection.where(filter=FieldFilter("email", "==", login_data.email.strip())).limit(1).get()
-        users = list(query)
-        logger.info(f"Firestore query completed. Found {len(users)} user(s).")
+        # メールアドレスの索引からユーザーを取得
+        logger.info("Searching for user...")
+        user_data = await storage.find_user_by_email(login_data.email.strip())
+        logger.info(f"User query completed. Found: {user_data is not None}.")
         
-        if len(users) == 0:
+        if user_data is None:
             logger.warning(f"Login failed: User {login_data.email} not found.")
             raise HTTPException(status_code=401, detail="メールアドレスまたはパスワードが正しくありません")
         
-        user_doc = users[0]
-        user_data = user_doc.to_dict()
+        user_id = user_data.pop("id")
         
         # パスワードの検証
-        if not verify_password(login_data.password, user_data["password"]):
+        is_valid, new_hash = await verify_password_async(login_data.password, user_data["password"])
+        if not is_valid:
             logger.warning(f"Login failed: Incorrect password for {login_data.email}.")
             raise HTTPException(status_code=401, detail="メールアドレスまたはパスワードが正しくありません")
         
+        # ハッシュ設定（ラウンド数など）が変わっていれば透過的に再ハッシュして保存
+        if new_hash:
+            try:
+                await storage.update_user(user_id, {"password": new_hash})
+                logger.info(f"Password hash upgraded for user {user_id}.")
+            except Exception as e:
+                # 再ハッシュの失敗はログインを妨げない
+                logger.warning(f"Password rehash failed for user {user_id}: {str(e)}")
+        
         user_response = UserResponse(
-            id=user_doc.id,
+            id=user_id,
             **{k: v for k, v in user_data.items() if k != "password"}
         )
         
-        access_token = create_access_token(data={"sub": user_doc.id, "role": user_data["role"]})
+        access_token = create_access_token(data={"sub": user_id, "role": user_data["role"]})
         
         logger.info(f"User {login_data.email} logged in successfully.")
         return Token(
@@ -107,4 +105,3 @@ async def login(login_data: UserLogin):
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"ログインエラー: {str(e)}")
-
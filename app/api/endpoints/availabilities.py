@@ -1,17 +1,39 @@
-from fastapi import APIRouter, HTTPException, Depends
-from datetime import datetime, time, timedelta
-from typing import List
-from google.cloud.firestore_v1.base_query import FieldFilter
-from app.schemas.availability import AvailabilityCreate, AvailabilityResponse, AvailabilityBase
-from app.core.database import db
+from fastapi import APIRouter, HTTPException, Depends, File, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from datetime import date as date_type, datetime, timedelta
+from typing import AsyncIterator, Iterator, List, Tuple
+import asyncio
+import csv
+import io
+from app.schemas.availability import (
+    AvailabilityCreate, AvailabilityResponse, AvailabilityBase, AvailabilityWindow, AvailabilityDay,
+    AvailabilityTemplate, AvailabilityTemplateResult, AvailabilityImportResult
+)
+from app.storage import StorageBackend, get_storage
+from app.storage.base import SLOT_MINUTES, SlotAlreadyBookedError, is_slot_aligned, to_utc
 from app.core.auth import get_current_trainer
+from app.core.config import settings
+from app.core.serialization import list_response
+from app.services.availability_index import availability_index
+from app.services.availability_template import chunked, expand_template
+from app.services.export import AVAILABILITY_COLUMNS, EXPORT_FORMATS, iter_availabilities
+from app.services.read_model import read_model
+from app.services.slot_events import Subscriber, slot_events
 
 router = APIRouter()
 
+# 期間指定取得で射影に指定できるフィールド
+AVAILABILITY_FIELDS = ("trainerId", "startAt", "endAt", "isBooked")
+# CSV 取り込みの応答に含めるエラー行の上限
+IMPORT_MAX_ERRORS = 20
+
 @router.post("/", response_model=List[AvailabilityResponse])
 async def create_availabilities(
     data: AvailabilityCreate, 
-    current_trainer: dict = Depends(get_current_trainer)
+    response: Response,
+    current_trainer: dict = Depends(get_current_trainer),
+    storage: StorageBackend = Depends(get_storage)
 ):
     """稼働枠を一括登録（トレーナー専用）"""
     try:
@@ -19,92 +41,344 @@ async def create_availabilities(
         if data.trainerId != current_trainer["id"]:
              raise HTTPException(status_code=403, detail="他のトレーナーの枠は登録できません")
 
-        availabilities_collection = db.collection("availabilities")
-        results = []
-        
-        # 既存の枠を取得して重複チェック
-        start_times = [slot.startAt for slot in data.slots]
-        min_start = min(start_times)
-        max_start = max(start_times)
-        
-        existing_docs = availabilities_collection\
-            .where(filter=FieldFilter("trainerId", "==", data.trainerId))\
-            .where(filter=FieldFilter("startAt", ">=", min_start))\
-            .where(filter=FieldFilter("startAt", "<=", max_start))\
-            .stream()
-            
-        existing_starts = {doc.to_dict()["startAt"].isoformat() if isinstance(doc.to_dict()["startAt"], datetime) else doc.to_dict()["startAt"] for doc in existing_docs}
-
-        # バッチ処理で登録
-        batch = db.batch()
-        for slot in data.slots:
-            # 重複チェック (ISO文字列で比較)
-            slot_start_iso = slot.startAt.isoformat() if isinstance(slot.startAt, datetime) else slot.startAt
-            if slot_start_iso in existing_starts:
-                continue
+        if not data.slots:
+            return []
+        if not all(is_slot_aligned(slot.startAt) and is_slot_aligned(slot.endAt) for slot in data.slots):
+            raise HTTPException(status_code=400, detail=f"開始・終了時刻は{SLOT_MINUTES}分単位で指定してください")
 
-            doc_ref = availabilities_collection.document()
-            slot_data = {
-                "trainerId": data.trainerId,
-                "startAt": slot.startAt,
-                "endAt": slot.endAt,
-                "isBooked": False
-            }
-            batch.set(doc_ref, slot_data)
-            results.append(AvailabilityResponse(id=doc_ref.id, **slot_data))
-        
-        batch.commit()
-        return results
+        # 重複チェックとバッチ登録はストレージ側で行う
+        created = await storage.create_availabilities(
+            data.trainerId,
+            [(slot.startAt, slot.endAt) for slot in data.slots]
+        )
+        availability_index.on_created(created)
+        slot_events.on_created(created)
+        return list_response(AvailabilityResponse, created, response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"稼働枠登録エラー: {str(e)}")
+
+def _validate_template(data: AvailabilityTemplate) -> None:
+    if not data.weekdays or any(day < 0 or day > 6 for day in data.weekdays):
+        raise HTTPException(status_code=400, detail="曜日は0（月）〜6（日）で指定してください")
+    try:
+        # 展開側（_parse_time）と同じ HH:mm のみ受け付ける（秒付きの "09:00:00" などは不可）
+        start_time = datetime.strptime(data.startTime, "%H:%M").time()
+        end_time = datetime.strptime(data.endTime, "%H:%M").time()
+        start_date = date_type.fromisoformat(data.startDate)
+        end_date = date_type.fromisoformat(data.endDate)
+        for skip_date in data.skipDates:
+            date_type.fromisoformat(skip_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付・時刻の形式が正しくありません（YYYY-MM-DD / HH:mm）")
+    if start_time.minute % 30 or end_time.minute % 30:
+        raise HTTPException(status_code=400, detail="時刻は30分単位で指定してください")
+    if end_time <= start_time:
+        raise HTTPException(status_code=400, detail="endTime は startTime より後の時刻を指定してください")
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="endDate は startDate 以降の日付を指定してください")
+    if (end_date - start_date).days + 1 > settings.AVAILABILITY_TEMPLATE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"登録期間は{settings.AVAILABILITY_TEMPLATE_MAX_DAYS}日以内で指定してください")
+
+@router.post("/templates", response_model=AvailabilityTemplateResult)
+async def create_availabilities_from_template(
+    data: AvailabilityTemplate,
+    current_trainer: dict = Depends(get_current_trainer),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    繰り返しテンプレートから稼働枠を一括登録（トレーナー専用）
+
+    サーバー側で30分枠に展開し、一定件数ずつストレージに書き込む。
+    既に登録済みの枠はスキップし、件数のみを返す。
+    """
+    if data.trainerId != current_trainer["id"]:
+        raise HTTPException(status_code=403, detail="他のトレーナーの枠は登録できません")
+    _validate_template(data)
+
+    try:
+        created_count = 0
+        skipped_count = 0
+        for chunk in chunked(expand_template(data), settings.AVAILABILITY_TEMPLATE_CHUNK_SIZE):
+            created = await storage.create_availabilities(data.trainerId, chunk)
+            availability_index.on_created(created)
+            slot_events.on_created(created)
+            created_count += len(created)
+            skipped_count += len(chunk) - len(created)
+        return AvailabilityTemplateResult(created=created_count, skipped=skipped_count)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"稼働枠登録エラー: {str(e)}")
 
 @router.get("/", response_model=List[AvailabilityResponse])
-async def get_availabilities(date: str, trainer_id: str = None):
+async def get_availabilities(date: str, trainer_id: str = None, storage: StorageBackend = Depends(get_storage)):
     """指定日の稼働枠を取得（30分単位の生データ）"""
     try:
         # dateは YYYY-MM-DD 形式
         start_dt = datetime.fromisoformat(f"{date}T00:00:00")
         end_dt = start_dt + timedelta(days=1)
         
-        query = db.collection("availabilities")\
-            .where(filter=FieldFilter("startAt", ">=", start_dt))\
-            .where(filter=FieldFilter("startAt", "<", end_dt))
-            
-        if trainer_id:
-            query = query.where(filter=FieldFilter("trainerId", "==", trainer_id))
-            
-        docs = query.order_by("startAt").stream()
+        # 読み取りモデルが使えればそこから返す（範囲外・使えない場合は None）
+        slots = read_model.list_availabilities(start_dt, end_dt, trainer_id=trainer_id)
+        if slots is None:
+            slots = await storage.list_availabilities(start_dt, end_dt, trainer_id=trainer_id)
         
-        results = []
-        for doc in docs:
-            data = doc.to_dict()
-            results.append(AvailabilityResponse(id=doc.id, **data))
-            
-        return results
+        return list_response(AvailabilityResponse, slots)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"稼働枠取得エラー: {str(e)}")
+
+@router.get("/range", response_model=List[AvailabilityDay], response_model_exclude_none=True)
+async def get_availabilities_range(
+    start_date: str,
+    end_date: str,
+    trainer_id: str = None,
+    fields: str = None,
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    期間内（end_date を含む）の稼働枠を日別に取得
+
+    1 回の範囲クエリで取得する。fields（例: startAt,endAt,isBooked）を指定すると
+    そのフィールドのみ読み取る。
+    """
+    try:
+        start_dt = datetime.fromisoformat(f"{start_date}T00:00:00")
+        end_dt = datetime.fromisoformat(f"{end_date}T00:00:00") + timedelta(days=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付の形式が正しくありません（YYYY-MM-DD）")
+    if end_dt <= start_dt:
+        raise HTTPException(status_code=400, detail="end_date は start_date 以降の日付を指定してください")
+    if end_dt - start_dt > timedelta(days=settings.AVAILABILITY_RANGE_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"取得期間は{settings.AVAILABILITY_RANGE_MAX_DAYS}日以内で指定してください")
+    
+    projection = None
+    if fields:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        invalid = [field for field in projection if field not in AVAILABILITY_FIELDS]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"指定できないフィールドです: {', '.join(invalid)}")
+        # 日別にまとめるため startAt は常に取得する
+        if "startAt" not in projection:
+            projection.append("startAt")
+    
+    try:
+        slots = read_model.list_availabilities(start_dt, end_dt, trainer_id=trainer_id, fields=projection)
+        if slots is None:
+            slots = await storage.list_availabilities(start_dt, end_dt, trainer_id=trainer_id, fields=projection)
+        
+        days = {}
+        day = start_dt.date()
+        while day < end_dt.date():
+            days[day.isoformat()] = []
+            day += timedelta(days=1)
+        for data in slots:
+            days.setdefault(to_utc(data["startAt"]).date().isoformat(), []).append(data)
+        
+        return list_response(
+            AvailabilityDay,
+            [{"date": date, "slots": day_slots} for date, day_slots in days.items()],
+            exclude_none=True
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"稼働枠取得エラー: {str(e)}")
 
+@router.get("/export")
+async def export_availabilities(
+    start_date: str,
+    end_date: str,
+    export_format: str = Query("ndjson", alias="format"),
+    trainer_id: str = None,
+    storage: StorageBackend = Depends(get_storage)
+):
+    """期間内（end_date を含む、UTC）の稼働枠をエクスポート（NDJSON / CSV、1 日分ずつ読みながら書き出す）"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format は ndjson または csv を指定してください")
+    try:
+        first = date_type.fromisoformat(start_date)
+        last = date_type.fromisoformat(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付の形式が正しくありません（YYYY-MM-DD）")
+    if last < first:
+        raise HTTPException(status_code=400, detail="end_date は start_date 以降の日付を指定してください")
+    if (last - first).days + 1 > settings.AVAILABILITY_EXPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"出力期間は{settings.AVAILABILITY_EXPORT_MAX_DAYS}日以内で指定してください")
+
+    to_lines, media_type = EXPORT_FORMATS[export_format]
+    rows = iter_availabilities(storage, first, last, trainer_id=trainer_id)
+    filename = f"availabilities_{start_date}_{end_date}.{export_format}"
+    return StreamingResponse(
+        to_lines(rows, AVAILABILITY_COLUMNS),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _parse_import_rows(
+    lines: Iterator[str], trainer_id: str, errors: List[str]
+) -> Iterator[Tuple[datetime, datetime]]:
+    """CSV（startAt,endAt 列。trainerId 列は任意）の各行を (startAt, endAt) にする。不正な行は errors に追加して飛ばす"""
+    reader = csv.DictReader(lines)
+    if not reader.fieldnames or not {"startAt", "endAt"} <= set(reader.fieldnames):
+        raise HTTPException(status_code=400, detail="CSV には startAt, endAt 列が必要です")
+    for row in reader:
+        try:
+            if row.get("trainerId") and row["trainerId"] != trainer_id:
+                raise ValueError("他のトレーナーの枠は登録できません")
+            start_at = to_utc(datetime.fromisoformat(row["startAt"].strip().replace("Z", "+00:00")))
+            end_at = to_utc(datetime.fromisoformat(row["endAt"].strip().replace("Z", "+00:00")))
+            if end_at <= start_at:
+                raise ValueError("endAt は startAt より後の日時を指定してください")
+            if not (is_slot_aligned(start_at) and is_slot_aligned(end_at)):
+                raise ValueError(f"開始・終了時刻は{SLOT_MINUTES}分単位で指定してください")
+        except (ValueError, AttributeError) as e:
+            errors.append(f"{reader.line_num}行目: {e}")
+            continue
+        yield start_at, end_at
+
+@router.post("/import", response_model=AvailabilityImportResult)
+async def import_availabilities(
+    file: UploadFile = File(...),
+    current_trainer: dict = Depends(get_current_trainer),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    CSV から稼働枠を一括登録（トレーナー専用、ログイン中のトレーナーの枠として登録）
+
+    ファイルを 1 行ずつ読み（スレッドで実行）、一定件数ずつストレージに書き込む。既に登録済みの枠はスキップする。
+    """
+    trainer_id = current_trainer["id"]
+    errors: List[str] = []
+    lines = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        created_count = 0
+        skipped_count = 0
+        rows = _parse_import_rows(lines, trainer_id, errors)
+        chunks = chunked(rows, settings.AVAILABILITY_IMPORT_CHUNK_SIZE)
+        while True:
+            # 大きなファイルはディスクに退避されているため、読み取り・解析はスレッドで行う
+            chunk = await run_in_threadpool(next, chunks, None)
+            if chunk is None:
+                break
+            created = await storage.create_availabilities(trainer_id, chunk)
+            availability_index.on_created(created)
+            slot_events.on_created(created)
+            created_count += len(created)
+            skipped_count += len(chunk) - len(created)
+        return AvailabilityImportResult(
+            created=created_count,
+            skipped=skipped_count,
+            invalid=len(errors),
+            errors=errors[:IMPORT_MAX_ERRORS]
+        )
+    except HTTPException:
+        raise
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV は UTF-8 で保存してください")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"稼働枠登録エラー: {str(e)}")
+    finally:
+        lines.detach()
+
+async def _event_stream(subscriber: Subscriber) -> AsyncIterator[str]:
+    """購読者のキューから SSE を書き出す（切り離された場合は reset を送って終了する）"""
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(
+                    subscriber.queue.get(), timeout=settings.SLOT_EVENTS_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if message is None:
+                yield "event: reset\ndata: {}\n\n"
+                return
+            yield message
+    finally:
+        slot_events.unsubscribe(subscriber)
+
+@router.get("/stream")
+async def stream_availabilities(date: str, trainer_id: str = None):
+    """
+    指定日（UTC）の稼働枠の変更を Server-Sent Events で配信
+
+    予約・キャンセル・登録・削除のたびに `slot` イベント（id, trainerId, startAt, endAt, isBooked, removed）を送る。
+    取りこぼしを防ぐため、接続してから `GET /api/availabilities/` で現在の枠を取得する。
+    `reset` イベントを受け取った場合（読み出しが遅く切り離された）は再接続して取得し直す。
+    """
+    try:
+        day = date_type.fromisoformat(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付の形式が正しくありません（YYYY-MM-DD）")
+    subscriber = slot_events.subscribe(trainer_id, day)
+    if subscriber is None:
+        raise HTTPException(
+            status_code=503,
+            detail="接続数が上限に達しています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "5"}
+        )
+    return StreamingResponse(
+        _event_stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/windows", response_model=List[AvailabilityWindow])
+async def get_availability_windows(
+    course_minutes: int,
+    from_: str = Query(..., alias="from"),
+    to: str = Query(...),
+    trainer_id: str = None,
+    storage: StorageBackend = Depends(get_storage)
+):
+    """指定コース時間分の連続した空きがある開始時刻を検索（from, to は YYYY-MM-DD または ISO 日時。オフセットなしは UTC）"""
+    if course_minutes <= 0 or course_minutes % 30 != 0:
+        raise HTTPException(status_code=400, detail="コース時間は30分単位で指定してください")
+    try:
+        # オフセットの有無が混在しても比較できるよう UTC にそろえる（オフセットなしは UTC とみなす）
+        start_dt = to_utc(datetime.fromisoformat(from_))
+        end_dt = to_utc(datetime.fromisoformat(to))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日時の形式が正しくありません")
+    if end_dt <= start_dt:
+        raise HTTPException(status_code=400, detail="to は from より後の日時を指定してください")
+    if end_dt - start_dt > timedelta(days=settings.AVAILABILITY_WINDOW_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"検索期間は{settings.AVAILABILITY_WINDOW_MAX_DAYS}日以内で指定してください")
+    
+    try:
+        windows = await availability_index.find_windows(
+            storage, course_minutes, start_dt, end_dt, trainer_id=trainer_id
+        )
+        return [AvailabilityWindow(**window) for window in windows]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"空き時間検索エラー: {str(e)}")
+
 @router.delete("/{availability_id}")
 async def delete_availability(
     availability_id: str, 
-    current_trainer: dict = Depends(get_current_trainer)
+    current_trainer: dict = Depends(get_current_trainer),
+    storage: StorageBackend = Depends(get_storage)
 ):
     """稼働枠を削除"""
     try:
-        doc_ref = db.collection("availabilities").document(availability_id)
-        doc = doc_ref.get()
-        if not doc.exists:
+        data = await storage.get_availability(availability_id)
+        if data is None:
             raise HTTPException(status_code=404, detail="枠が見つかりません")
         
-        data = doc.to_dict()
         if data["trainerId"] != current_trainer["id"]:
             raise HTTPException(status_code=403, detail="権限がありません")
             
         if data["isBooked"]:
             raise HTTPException(status_code=400, detail="予約済みの枠は削除できません")
             
-            doc_ref.delete()
-            return {"status": "success", "id": availability_id}
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-
+        try:
+            # 上の確認の後に予約された場合もストレージ側で検出する
+            await storage.delete_availability(availability_id)
+        except SlotAlreadyBookedError:
+            raise HTTPException(status_code=400, detail="予約済みの枠は削除できません")
+        availability_index.on_deleted(data["trainerId"], data["startAt"])
+        slot_events.on_deleted(data["trainerId"], data["startAt"])
+        return {"status": "success", "id": availability_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,93 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from app.schemas.bootstrap import BootstrapResponse
+from app.storage import StorageBackend, get_storage
+from app.storage.base import cursor_values, reservation_order
+from app.core.auth import get_current_user
+from app.core.config import settings
+from app.core.pagination import encode_cursor
+from app.core.serialization import model_response
+from app.services.read_model import read_model
+from app.api.endpoints.reservations import RESERVATION_FIELDS
+from app.api.endpoints.users import USER_FIELDS
+
+router = APIRouter()
+
+async def _trainers(storage: StorageBackend) -> List[Dict[str, Any]]:
+    # 画面のトレーナー選択には全員が必要なため、ページに分けず全件返す
+    # 読み取りモデルが使えればそこから返す（使えない場合は None）
+    trainers = read_model.list_trainers(fields=USER_FIELDS)
+    if trainers is not None:
+        return trainers
+    trainers = []
+    after = None
+    while True:
+        page = await storage.list_users(
+            role="trainer", limit=settings.LIST_MAX_PAGE_SIZE, after=after, fields=USER_FIELDS
+        )
+        trainers.extend(page)
+        if len(page) < settings.LIST_MAX_PAGE_SIZE:
+            return trainers
+        after = page[-1]["id"]
+
+async def _reservations(storage: StorageBackend, current_user: dict) -> List[Dict[str, Any]]:
+    # トレーナーは自分宛の予約、一般会員は自分の予約（GET /api/reservations/ の最初のページと同じ）
+    if current_user.get("role") == "trainer":
+        owner = {"trainer_id": current_user["id"]}
+    else:
+        owner = {"user_id": current_user["id"]}
+    # 次のページの有無を判定するため 1 件多く取得する
+    return await storage.list_reservations(**owner, limit=settings.LIST_PAGE_SIZE + 1, fields=RESERVATION_FIELDS)
+
+async def _availabilities(
+    storage: StorageBackend, start_dt: datetime, trainer_id: Optional[str]
+) -> List[Dict[str, Any]]:
+    end_dt = start_dt + timedelta(days=1)
+    slots = read_model.list_availabilities(start_dt, end_dt, trainer_id=trainer_id)
+    if slots is None:
+        slots = await storage.list_availabilities(start_dt, end_dt, trainer_id=trainer_id)
+    return slots
+
+@router.get("", response_model=BootstrapResponse)
+async def get_bootstrap(
+    date: Optional[str] = None,
+    trainer_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    ダッシュボードの初期表示に必要なデータを 1 回で取得
+
+    認証は 1 回のみ行い、トレーナー一覧・予約（ロールに応じた最初のページ）・
+    date（YYYY-MM-DD）を指定した場合はその日の稼働枠を並行して読み取る。
+    所要時間は最も遅い読み取り 1 回分になる。
+    """
+    start_dt = None
+    if date is not None:
+        try:
+            start_dt = datetime.fromisoformat(f"{date}T00:00:00")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="日付の形式が正しくありません（YYYY-MM-DD）")
+
+    try:
+        reads = [_trainers(storage), _reservations(storage, current_user)]
+        if start_dt is not None:
+            reads.append(_availabilities(storage, start_dt, trainer_id))
+        trainers, reservations, *availabilities = await asyncio.gather(*reads)
+
+        next_cursor = None
+        if len(reservations) > settings.LIST_PAGE_SIZE:
+            reservations = reservations[:settings.LIST_PAGE_SIZE]
+            next_cursor = encode_cursor(cursor_values(reservations[-1], reservation_order(False)))
+
+        return model_response(BootstrapResponse, {
+            "user": current_user,
+            "trainers": trainers,
+            "reservations": reservations,
+            "reservationsNextCursor": next_cursor,
+            "availabilities": availabilities[0] if availabilities else None,
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"初期データ取得エラー: {str(e)}")
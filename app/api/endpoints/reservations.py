@@ -1,14 +1,28 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response, status
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime, timedelta, time
-from google.cloud.firestore_v1.base_query import FieldFilter
 from app.schemas.reservation import ReservationCreate, ReservationResponse
-from app.core.database import db
-from app.core.auth import get_current_user
-from google.cloud import firestore
+from app.storage import (
+    IdempotencyKeyMismatchError, SlotAlreadyBookedError, SlotUnavailableError, StorageBackend,
+    TransactionContentionError, get_storage
+)
+from app.storage.base import cancelled_result, cursor_values, parse_slot_id, reservation_order
+from app.core.auth import get_current_trainer, get_current_user
+from app.core.config import settings
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.core.serialization import list_response
+from app.services.availability_index import availability_index
+from app.services.booking_serializer import booking_serializer
+from app.services.idempotency import MAX_KEY_LENGTH, REPLAYED_HEADER, idempotency_keys
+from app.services.slot_events import slot_events
+from app.services.export import EXPORT_FORMATS, RESERVATION_COLUMNS, iter_reservations
 
 router = APIRouter()
 
+# 一覧取得で読み取るフィールド（slotIds など応答に含めないフィールドは転送しない）
+RESERVATION_FIELDS = [field for field in ReservationResponse.model_fields if field != "id"]
+
 def check_deadline(reservation_date_str: str):
     """予約・キャンセルの期限チェック (前日24時)"""
     # 予約日の前日 23:59:59 (実質24時)
@@ -21,13 +35,40 @@ def check_deadline(reservation_date_str: str):
             detail="予約・キャンセルの期限（前日24時）を過ぎています"
         )
 
+def validate_date_range(date_from: Optional[str], date_to: Optional[str]):
+    """date_from / date_to（YYYY-MM-DD）の形式チェック"""
+    try:
+        for value in (date_from, date_to):
+            if value is not None:
+                datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="日付の形式が正しくありません（YYYY-MM-DD）")
+
+IDEMPOTENCY_MISMATCH_DETAIL = "Idempotency-Key が内容の異なるリクエストで既に使用されています"
+
 @router.post("/", response_model=ReservationResponse)
 async def create_reservation(
     res: ReservationCreate, 
-    current_user: dict = Depends(get_current_user)
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH),
+    current_user: dict = Depends(get_current_user),
+    storage: StorageBackend = Depends(get_storage)
 ):
-    """予約を作成（トランザクション処理）"""
+    """
+    予約を作成（トランザクション処理）
+
+    Idempotency-Key ヘッダーを指定した場合、同じキーの再送には稼働枠を読まずに前回の結果を返す
+    （Idempotent-Replayed: true を付ける）。
+    """
     try:
+        record = None
+        if idempotency_key:
+            record = idempotency_keys.new_record(current_user["id"], "create", idempotency_key, res.model_dump())
+            replayed = await idempotency_keys.replay(storage, record)
+            if replayed is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+                return ReservationResponse(**replayed)
+
         # 期限チェック
         check_deadline(res.date)
         
@@ -45,139 +86,199 @@ async def create_reservation(
         # 連続スロットの開始から終了までの時間を計算
         end_dt = start_dt + timedelta(minutes=res.courseMinutes)
         
-        # トランザクション
-        transaction = db.transaction()
+        # 予約データ
+        now = datetime.now().isoformat()
+        res_data = {
+            "userId": current_user["id"],
+            "user_name": current_user["name"],
+            "trainerId": res.trainerId,
+            "date": res.date,
+            "startTime": res.startTime,
+            "endTime": end_dt.strftime("%H:%M"),
+            "courseMinutes": res.courseMinutes,
+            "status": "active",
+            "createdAt": now,
+            "updatedAt": now
+        }
         
-        @firestore.transactional
-        def create_in_transaction(transaction):
-            # 1. 指定された時間枠の Availability を取得
-            avail_query = db.collection("availabilities")\
-                .where(filter=FieldFilter("trainerId", "==", res.trainerId))\
-                .where(filter=FieldFilter("startAt", ">=", start_dt))\
-                .where(filter=FieldFilter("startAt", "<", end_dt))\
-                .order_by("startAt")
-            
-            avail_docs = list(avail_query.stream(transaction=transaction))
-            
-            # スロットが足りているかチェック
-            if len(avail_docs) < num_slots:
-                raise HTTPException(status_code=400, detail="指定された時間枠の空きがありません")
-            
-            # 全てのスロットが未予約かチェック
-            for doc in avail_docs:
-                if doc.to_dict().get("isBooked"):
-                    raise HTTPException(status_code=400, detail="既に予約されている時間枠が含まれています")
-            
-            # 2. Reservation ドキュメントの作成
-            now = datetime.now().isoformat()
-            res_ref = db.collection("reservations").document()
-            res_data = {
-                "userId": current_user["id"],
-                "user_name": current_user["name"],
-                "trainerId": res.trainerId,
-                "date": res.date,
-                "startTime": res.startTime,
-                "endTime": end_dt.strftime("%H:%M"),
-                "courseMinutes": res.courseMinutes,
-                "status": "active",
-                "createdAt": now,
-                "updatedAt": now
-            }
-            transaction.set(res_ref, res_data)
-            
-            # 3. Availability の更新
-            for doc in avail_docs:
-                transaction.update(doc.reference, {"isBooked": True})
-            
-            return res_ref.id, res_data
-
-        res_id, res_data = create_in_transaction(transaction)
+        # トランザクション（空き確認・予約作成・枠の確保）
+        # 同じトレーナー・日の予約はプロセス内で直列化して競合によるやり直しを減らす
+        try:
+            reservation = await booking_serializer.book(storage, res_data, start_dt, num_slots, record)
+        except SlotUnavailableError:
+            availability_index.invalidate(start_dt, num_slots)
+            raise HTTPException(status_code=400, detail="指定された時間枠の空きがありません")
+        except SlotAlreadyBookedError:
+            # 同じキーの先行リクエストが処理中に予約した場合は、その結果を返す
+            replayed = await idempotency_keys.replay(storage, record) if record else None
+            if replayed is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+                return ReservationResponse(**replayed)
+            availability_index.invalidate(start_dt, num_slots)
+            raise HTTPException(status_code=400, detail="既に予約されている時間枠が含まれています")
+        except TransactionContentionError:
+            raise HTTPException(
+                status_code=503,
+                detail="混み合っています。しばらくしてから再度お試しください",
+                headers={"Retry-After": "1"}
+            )
+        availability_index.on_booked(res.trainerId, start_dt, num_slots)
+        slot_events.on_booked(res.trainerId, start_dt, num_slots)
+        if record:
+            idempotency_keys.remember(record, reservation)
         
-        return ReservationResponse(id=res_id, **res_data)
+        return ReservationResponse(**reservation)
         
     except HTTPException:
         raise
+    except IdempotencyKeyMismatchError:
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_MISMATCH_DETAIL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"予約作成エラー: {str(e)}")
 
 @router.get("/", response_model=List[ReservationResponse])
-async def get_reservations(current_user: dict = Depends(get_current_user)):
-    """予約一覧を取得（ロールに応じてフィルタリング）個人またはトレーナーに関連するもの"""
+async def get_reservations(
+    response: Response,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = Query(settings.LIST_PAGE_SIZE, ge=1, le=settings.LIST_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    予約一覧を取得（ロールに応じてフィルタリング）個人またはトレーナーに関連するもの
+
+    createdAt 降順（date_from / date_to 指定時は date 降順）で limit 件ずつ返す。
+    続きがある場合は X-Next-Cursor ヘッダーの値を cursor に指定して次のページを取得する。
+    """
+    if status_filter is not None and status_filter not in ("active", "cancelled"):
+        raise HTTPException(status_code=400, detail="status は active または cancelled を指定してください")
+    validate_date_range(date_from, date_to)
+    order = reservation_order(bool(date_from or date_to))
+    try:
+        after = decode_cursor(cursor, len(order)) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor が正しくありません")
+
     try:
-        query = db.collection("reservations")
-        
         # ロールに応じてフィルタリング
         if current_user.get("role") == "trainer":
             # トレーナーは自分宛の予約をすべて取得
-            query = query.where(filter=FieldFilter("trainerId", "==", current_user["id"]))
+            owner = {"trainer_id": current_user["id"]}
         else:
             # 一般会員は自分の予約のみ
-            query = query.where(filter=FieldFilter("userId", "==", current_user["id"]))
-            
-        docs = query.order_by("createdAt", direction=firestore.Query.DESCENDING).stream()
+            owner = {"user_id": current_user["id"]}
         
-        results = []
-        for doc in docs:
-            data = doc.to_dict()
-            results.append(ReservationResponse(id=doc.id, **data))
+        # 次のページの有無を判定するため 1 件多く取得する
+        reservations = await storage.list_reservations(
+            **owner,
+            status=status_filter,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit + 1,
+            after=after,
+            fields=RESERVATION_FIELDS
+        )
+        if len(reservations) > limit:
+            reservations = reservations[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(cursor_values(reservations[-1], order))
             
-        return results
+        return list_response(ReservationResponse, reservations, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"予約取得エラー: {str(e)}")
 
+@router.get("/export")
+async def export_reservations(
+    export_format: str = Query("ndjson", alias="format"),
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    trainer_id: Optional[str] = None,
+    current_trainer: dict = Depends(get_current_trainer),
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    予約をエクスポート（トレーナー専用、NDJSON / CSV）
+
+    ストレージから一定件数ずつ読みながら書き出すため、件数によらずメモリ使用量は一定。
+    出力できるのは自分宛の予約のみ（trainer_id を省略した場合は自分の ID）。
+    """
+    if trainer_id is None:
+        trainer_id = current_trainer["id"]
+    elif trainer_id != current_trainer["id"]:
+        raise HTTPException(status_code=403, detail="他のトレーナーの予約はエクスポートできません")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format は ndjson または csv を指定してください")
+    validate_date_range(date_from, date_to)
+
+    to_lines, media_type = EXPORT_FORMATS[export_format]
+    rows = iter_reservations(storage, trainer_id=trainer_id, date_from=date_from, date_to=date_to)
+    filename = f"reservations_{date_from or 'all'}_{date_to or 'all'}.{export_format}"
+    return StreamingResponse(
+        to_lines(rows, RESERVATION_COLUMNS),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.post("/{reservation_id}/cancel")
 async def cancel_reservation(
     reservation_id: str, 
-    current_user: dict = Depends(get_current_user)
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=MAX_KEY_LENGTH),
+    current_user: dict = Depends(get_current_user),
+    storage: StorageBackend = Depends(get_storage)
 ):
-    """予約をキャンセル"""
-    try:
-        res_ref = db.collection("reservations").document(reservation_id)
-        res_doc = res_ref.get()
-        
-        if not res_doc.exists:
-            raise HTTPException(status_code=404, detail="予約が見つかりません")
-            
-        res_data = res_doc.to_dict()
-        
+    """予約をキャンセル（Idempotency-Key は予約の作成と同じ）"""
+    def validate(res_data: dict):
         # 権限チェック
         if res_data["userId"] != current_user["id"] and current_user.get("role") != "trainer":
             raise HTTPException(status_code=403, detail="権限がありません")
             
         # 期限チェック
         check_deadline(res_data["date"])
+
+    try:
+        record = None
+        if idempotency_key:
+            record = idempotency_keys.new_record(
+                current_user["id"], "cancel", idempotency_key, {"reservationId": reservation_id}
+            )
+            if await idempotency_keys.replay(storage, record) is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+                return {"status": "success", "message": "予約をキャンセルしました"}
+
+        # トランザクションでキャンセル処理（予約の読み取り・チェック、キャンセル、予約時に確保した Availability の解放）
+        updated_at = datetime.now().isoformat()
+        res_data = await storage.cancel_reservation(
+            reservation_id,
+            updated_at,
+            validate=validate,
+            idempotency=record
+        )
+        
+        if res_data is None:
+            raise HTTPException(status_code=404, detail="予約が見つかりません")
         
         if res_data["status"] == "cancelled":
+            # 同じキーの先行リクエストがキャンセルした場合（ストレージが記録を返した）は、枠を再度解放しない
+            if record and await idempotency_keys.replay(storage, record) is not None:
+                response.headers[REPLAYED_HEADER] = "true"
+                return {"status": "success", "message": "予約をキャンセルしました"}
             return {"message": "既にキャンセルされています"}
             
-        # トランザクションでキャンセル処理
-        transaction = db.transaction()
-        
-        @firestore.transactional
-        def cancel_in_transaction(transaction):
-            # 1. 予約をキャンセル状態に
-            transaction.update(res_ref, {
-                "status": "cancelled",
-                "updatedAt": datetime.now().isoformat()
-            })
-            
-            # 2. 関連する Availability を解放
-            start_dt = datetime.fromisoformat(f"{res_data['date']}T{res_data['startTime']}:00")
-            end_dt = start_dt + timedelta(minutes=res_data["courseMinutes"])
-            
-            avail_query = db.collection("availabilities")\
-                .where(filter=FieldFilter("trainerId", "==", res_data["trainerId"]))\
-                .where(filter=FieldFilter("startAt", ">=", start_dt))\
-                .where(filter=FieldFilter("startAt", "<", end_dt))
-            
-            avail_docs = avail_query.stream(transaction=transaction)
-            for doc in avail_docs:
-                transaction.update(doc.reference, {"isBooked": False})
-        
-        cancel_in_transaction(transaction)
+        starts = [parse_slot_id(doc_id)[1] for doc_id in res_data["slotIds"]]
+        for start_at in starts:
+            availability_index.on_released(res_data["trainerId"], start_at, 1)
+            slot_events.on_released(res_data["trainerId"], start_at, 1)
+        booking_serializer.release(res_data["trainerId"], starts)
+        if record:
+            idempotency_keys.remember(record, cancelled_result(res_data, updated_at))
         return {"status": "success", "message": "予約をキャンセルしました"}
         
     except HTTPException:
         raise
+    except IdempotencyKeyMismatchError:
+        raise HTTPException(status_code=422, detail=IDEMPOTENCY_MISMATCH_DETAIL)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"キャンセルエラー: {str(e)}")
@@ -1,38 +1,58 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from datetime import datetime
 from typing import List
 from app.schemas.user import UserCreate, UserUpdate, UserResponse
-from app.core.database import db
-
-from google.cloud.firestore_v1.base_query import FieldFilter
+from app.storage import EmailAlreadyExistsError, StorageBackend, get_storage
+from app.core.auth import invalidate_principal
+from app.core.config import settings
+from app.core.serialization import list_response
+from app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.services.read_model import read_model
 
 router = APIRouter()
 
+# 一覧取得で読み取るフィールド（パスワードハッシュは転送しない）
+USER_FIELDS = [field for field in UserResponse.model_fields if field != "id"]
+
 @router.get("/", response_model=List[UserResponse])
-async def get_users(role: str = None):
-    """ユーザー一覧を取得（ロールでフィルタリング可能）"""
+async def get_users(
+    response: Response,
+    role: str = None,
+    limit: int = Query(settings.LIST_PAGE_SIZE, ge=1, le=settings.LIST_MAX_PAGE_SIZE),
+    cursor: str = None,
+    storage: StorageBackend = Depends(get_storage)
+):
+    """
+    ユーザー一覧を取得（ロールでフィルタリング可能）
+
+    id 順に limit 件ずつ返す。続きがある場合は X-Next-Cursor ヘッダーの値を cursor に指定する。
+    """
     try:
-        query = db.collection("users")
-        if role:
-            query = query.where(filter=FieldFilter("role", "==", role))
-        
-        docs = query.stream()
-        results = []
-        for doc in docs:
-            data = doc.to_dict()
-            results.append(UserResponse(id=doc.id, **data))
-        return results
+        after = decode_cursor(cursor, 1)[0] if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor が正しくありません")
+    try:
+        # 次のページの有無を判定するため 1 件多く取得する
+        users = None
+        if role == "trainer":
+            # 読み取りモデルが使えればそこから返す（使えない場合は None）
+            users = read_model.list_trainers(limit=limit + 1, after=after, fields=USER_FIELDS)
+        if users is None:
+            users = await storage.list_users(role=role, limit=limit + 1, after=after, fields=USER_FIELDS)
+        if len(users) > limit:
+            users = users[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor([users[-1]["id"]])
+        return list_response(UserResponse, users, response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/", response_model=UserResponse)
-async def create_user(user: UserCreate):
+async def create_user(user: UserCreate, storage: StorageBackend = Depends(get_storage)):
     """ユーザーを作成"""
     try:
         if not user.name or not user.name.strip():
             raise HTTPException(status_code=400, detail="名前は必須です")
         
-        users_collection = db.collection("users")
         now = datetime.now().isoformat()
         role = user.role if user.role else "trainee"
         
@@ -45,13 +65,12 @@ async def create_user(user: UserCreate):
             "updatedAt": now
         }
         
-        doc_ref = users_collection.document()
-        doc_ref.set(user_data)
+        try:
+            created = await storage.create_user(user_data)
+        except EmailAlreadyExistsError:
+            raise HTTPException(status_code=400, detail="このメールアドレスは既に登録されています")
         
-        return UserResponse(
-            id=doc_ref.id,
-            **user_data
-        )
+        return UserResponse(**created)
     except HTTPException:
         raise
     except Exception as e:
@@ -64,19 +83,17 @@ async def create_user(user: UserCreate):
         raise HTTPException(status_code=500, detail=f"ユーザー作成エラー: {error_message}")
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str):
+async def get_user(user_id: str, storage: StorageBackend = Depends(get_storage)):
     """ユーザー情報を取得"""
     try:
-        doc_ref = db.collection("users").document(user_id)
-        doc = doc_ref.get()
+        user_data = await storage.get_user(user_id)
         
-        if not doc.exists:
+        if user_data is None:
             raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
         
-        user_data = doc.to_dict()
         role = user_data.get("role", "trainee")
         return UserResponse(
-            id=doc.id,
+            id=user_data["id"],
             name=user_data["name"],
             email=user_data.get("email", ""),
             phone=user_data.get("phone", ""),
@@ -90,13 +107,10 @@ async def get_user(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{user_id}", response_model=UserResponse)
-async def update_user(user_id: str, user_update: UserUpdate):
+async def update_user(user_id: str, user_update: UserUpdate, storage: StorageBackend = Depends(get_storage)):
     """ユーザー情報を更新"""
     try:
-        doc_ref = db.collection("users").document(user_id)
-        doc = doc_ref.get()
-        
-        if not doc.exists:
+        if await storage.get_user(user_id) is None:
             raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
         
         update_data = {}
@@ -112,14 +126,19 @@ async def update_user(user_id: str, user_update: UserUpdate):
             update_data["phone"] = user_update.phone.strip() if user_update.phone.strip() else ""
         
         update_data["updatedAt"] = datetime.now().isoformat()
-        doc_ref.update(update_data)
+        try:
+            updated_data = await storage.update_user(user_id, update_data)
+        except EmailAlreadyExistsError:
+            raise HTTPException(status_code=400, detail="このメールアドレスは既に登録されています")
+        invalidate_principal(user_id)
+        
+        if updated_data is None:
+            raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
         
-        updated_doc = doc_ref.get()
-        updated_data = updated_doc.to_dict()
         role = updated_data.get("role", "trainee")
         
         return UserResponse(
-            id=updated_doc.id,
+            id=updated_data["id"],
             name=updated_data["name"],
             email=updated_data.get("email", ""),
             phone=updated_data.get("phone", ""),
@@ -131,5 +150,3 @@ async def update_user(user_id: str, user_update: UserUpdate):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ユーザー更新エラー: {str(e)}")
-
-
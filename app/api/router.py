@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.endpoints import users, reservations, auth, availabilities
+from app.api.endpoints import users, reservations, auth, availabilities, admin, bootstrap
 
 api_router = APIRouter()
 
@@ -7,5 +7,7 @@ api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
 api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(reservations.router, prefix="/reservations", tags=["reservations"])
 api_router.include_router(availabilities.router, prefix="/availabilities", tags=["availabilities"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(bootstrap.router, prefix="/bootstrap", tags=["bootstrap"])
 
 
@@ -1,14 +1,31 @@
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 from jose import jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import os
-from app.core.database import db
+from app.core.config import settings
+from app.storage import StorageBackend, get_storage
+from app.core.cache import TTLCache
+from app.core.hashing import BoundedHashPool
 
 # パスワードハッシュ化の設定
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min/max を default と揃えることで、ラウンド数を変更した際に古いハッシュが needs_update 扱いになる
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
+
+# bcrypt はイベントループ外のワーカープールで実行する
+hash_pool = BoundedHashPool(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    executor=settings.PASSWORD_HASH_EXECUTOR,
+)
 
 # JWTの設定
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-keep-it-secret")
@@ -17,6 +34,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
+# 認証済みユーザー情報のキャッシュ（ユーザーID -> ユーザー情報）
+# プロフィール更新時は invalidate_principal で明示的に破棄する
+principal_cache = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """パスワードの検証"""
     # bcryptの制限（72byte）対策としてバイト列で切り詰め
@@ -29,6 +53,19 @@ def get_password_hash(password: str) -> str:
     password_bytes = password.encode('utf-8')[:72]
     return pwd_context.hash(password_bytes)
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """パスワードの検証（ハッシュが古い設定の場合は新しいハッシュも返す）"""
+    password_bytes = plain_password.encode('utf-8')[:72]
+    return pwd_context.verify_and_update(password_bytes, hashed_password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """パスワードの検証をワーカープールで実行する（混雑時は 503）"""
+    return await hash_pool.run(verify_and_update_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """パスワードのハッシュ化をワーカープールで実行する（混雑時は 503）"""
+    return await hash_pool.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """アクセストークンの作成"""
     to_encode = data.copy()
@@ -40,28 +77,44 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def token_subject(token: str) -> Optional[str]:
+    """署名・有効期限を検証したトークンのユーザーID（検証できない場合は None）"""
+    try:
+        user_id = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except Exception:
+        return None
+    return user_id if isinstance(user_id, str) else None
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    storage: StorageBackend = Depends(get_storage)
+):
     """トークンから現在のユーザーを取得する依存関係"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="認証情報が有効ではありません",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except Exception:
+    user_id = token_subject(token)
+    if user_id is None:
         raise credentials_exception
         
-    user_doc = db.collection("users").document(user_id).get()
-    if not user_doc.exists:
+    cached = principal_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+        
+    user_data = await storage.get_user(user_id)
+    if user_data is None:
         raise credentials_exception
         
-    user_data = user_doc.to_dict()
-    user_data["id"] = user_doc.id
-    return user_data
+    # パスワードハッシュはキャッシュに保持しない
+    user_data.pop("password", None)
+    principal_cache.set(user_id, user_data)
+    return dict(user_data)
+
+def invalidate_principal(user_id: str) -> None:
+    """ユーザー情報キャッシュを破棄（プロフィール更新時に呼び出す）"""
+    principal_cache.invalidate(user_id)
 
 async def get_current_trainer(current_user: dict = Depends(get_current_user)):
     """トレーナー権限チェック"""
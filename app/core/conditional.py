@@ -0,0 +1,174 @@
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core.auth import token_subject
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+# GET の応答に ETag を付けるパスと、その応答が依存するデータの範囲（スコープ）
+READ_SCOPES = {
+    "/api/availabilities": "availabilities",
+    "/api/reservations": "reservations",
+    "/api/users": "users",
+}
+# 世代を進める（データを変更しうる）メソッド。OPTIONS（CORS のプリフライト）・HEAD は含めない
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+# 更新系リクエストが変更しうるスコープ
+WRITE_SCOPES = {
+    "/api/availabilities": ("availabilities",),
+    "/api/reservations": ("reservations", "availabilities"),
+    "/api/users": ("users",),
+    # ログインは応答に含まれるデータを変更しない（パスワードの再ハッシュのみ）ため含めない
+    "/api/auth/signup": ("users",),
+}
+
+
+def _match(path: str, table: Dict[str, Any]) -> Optional[Any]:
+    for prefix, value in table.items():
+        if path == prefix or path.startswith(prefix + "/"):
+            return value
+    return None
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def compute_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ConditionalGetCache:
+    """
+    GET 応答の ETag（本文のハッシュ）をスコープの世代ごとに記録する
+
+    このプロセスで更新系リクエストが成功するとスコープの世代を進め、記録済みの ETag を無効にする。
+    記録が有効な間（ttl 秒）は、If-None-Match が一致すればエンドポイントを実行せずに 304 を返す。
+    他インスタンスでの更新は反映されないため、記録は ttl 秒で期限切れにし、以降は本文を作り直して比較する。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._etags = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Iterable[str]], None]] = []
+        self.not_modified = 0
+        self.short_circuits = 0
+
+    def key(self, scope: str, request: Request) -> Tuple[Any, ...]:
+        """
+        記録のキー（エンドポイントの実行前に取得する）
+
+        実行中に更新があった場合、実行前の世代で記録されるため、その ETag は使われない。
+        応答はユーザーごとに異なりうるため、認証ヘッダーもキーに含める。
+        """
+        return (
+            scope,
+            self._generations.get(scope, 0),
+            request.url.path,
+            request.url.query,
+            request.headers.get("authorization", ""),
+        )
+
+    def add_listener(self, listener: Callable[[Iterable[str]], None]) -> None:
+        """スコープの世代が進んだとき（このプロセスでの更新時）に呼ばれる関数を登録する"""
+        self._listeners.append(listener)
+
+    def bump(self, scopes: Iterable[str]) -> None:
+        with self._lock:
+            for scope in scopes:
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+        for listener in self._listeners:
+            listener(scopes)
+
+    def lookup(self, key: Tuple[Any, ...]) -> Optional[str]:
+        return self._etags.get(key)
+
+    def remember(self, key: Tuple[Any, ...], etag: str) -> None:
+        self._etags.set(key, etag)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generations.clear()
+        self._etags.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._etags.stats(),
+            "notModified": self.not_modified,
+            "shortCircuits": self.short_circuits,
+        }
+
+
+conditional_cache = ConditionalGetCache(
+    maxsize=settings.ETAG_CACHE_MAX_SIZE,
+    ttl=settings.ETAG_CACHE_TTL_SECONDS,
+)
+
+
+def _token_valid(authorization: str) -> bool:
+    """
+    304 を返してよい認証ヘッダーか（ヘッダーなし、または署名・有効期限を検証できたトークン）
+
+    304 はエンドポイント（認証の依存関係）を実行せずに返すため、期限切れなどのトークンは
+    ここで除外してエンドポイントに 401 を返させる。
+    """
+    if not authorization:
+        return True
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and token_subject(token) is not None
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+async def conditional_get(request: Request, call_next):
+    """
+    API の JSON 応答に ETag を付け、If-None-Match が一致すれば 304 を返すミドルウェア
+
+    ストリーミング応答（エクスポートなど）は対象外。
+    """
+    path = request.url.path
+    if request.method in WRITE_METHODS:
+        response = await call_next(request)
+        scopes = _match(path, WRITE_SCOPES)
+        if scopes and response.status_code < 400:
+            conditional_cache.bump(scopes)
+        return response
+    if request.method != "GET":
+        return await call_next(request)
+
+    scope = _match(path, READ_SCOPES)
+    if scope is None:
+        return await call_next(request)
+
+    if_none_match = request.headers.get("if-none-match")
+    key = conditional_cache.key(scope, request)
+    cached = conditional_cache.lookup(key)
+    if cached is not None and _etag_matches(if_none_match, cached) and _token_valid(key[-1]):
+        conditional_cache.not_modified += 1
+        conditional_cache.short_circuits += 1
+        return _not_modified(cached)
+
+    response = await call_next(request)
+    if response.status_code != 200 or not response.headers.get("content-type", "").startswith("application/json"):
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    etag = compute_etag(body)
+    conditional_cache.remember(key, etag)
+    if _etag_matches(if_none_match, etag):
+        conditional_cache.not_modified += 1
+        return _not_modified(etag)
+
+    headers = dict(response.headers)
+    headers["ETag"] = etag
+    headers["Cache-Control"] = "private, no-cache"
+    return Response(content=body, status_code=response.status_code, headers=headers)
@@ -10,6 +10,134 @@ class Settings:
         ).split(",")
     ]
 
+    # データストア: firestore / firestore_bitmap / memory / sqlite
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "firestore")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "gym_reserve.db")
+
+    # bcrypt ハッシュ計算用ワーカープール
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # thread / process
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+    # 変更するとログイン時に既存ハッシュが自動で再ハッシュされる
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+    # get_current_user のユーザー情報キャッシュ
+    PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+    PRINCIPAL_CACHE_MAX_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "1024"))
+
+    # 空き時間検索用インデックスの再ロード間隔（秒）
+    AVAILABILITY_INDEX_TTL_SECONDS: float = float(os.getenv("AVAILABILITY_INDEX_TTL_SECONDS", "30"))
+    # 稼働枠の期間指定取得で指定できる最大日数
+    AVAILABILITY_RANGE_MAX_DAYS: int = int(os.getenv("AVAILABILITY_RANGE_MAX_DAYS", "31"))
+    # 空き時間検索で指定できる最大日数
+    AVAILABILITY_WINDOW_MAX_DAYS: int = int(os.getenv("AVAILABILITY_WINDOW_MAX_DAYS", "62"))
+    # 繰り返しテンプレートで指定できる最大日数
+    AVAILABILITY_TEMPLATE_MAX_DAYS: int = int(os.getenv("AVAILABILITY_TEMPLATE_MAX_DAYS", "366"))
+    # 繰り返しテンプレートの展開結果を何枠ずつストレージに書き込むか
+    AVAILABILITY_TEMPLATE_CHUNK_SIZE: int = int(os.getenv("AVAILABILITY_TEMPLATE_CHUNK_SIZE", "200"))
+
+    # 予約の直列化: 直近に予約された枠を記録しておく秒数（この間は同じ枠への予約をストレージに問い合わせず失敗させる）
+    BOOKING_BOOKED_SLOT_TTL_SECONDS: float = float(os.getenv("BOOKING_BOOKED_SLOT_TTL_SECONDS", "5"))
+    # 予約トランザクションが競合でコミットできなかった場合の再試行回数とバックオフの基準秒数
+    BOOKING_MAX_RETRIES: int = int(os.getenv("BOOKING_MAX_RETRIES", "3"))
+    BOOKING_RETRY_BACKOFF_SECONDS: float = float(os.getenv("BOOKING_RETRY_BACKOFF_SECONDS", "0.05"))
+
+    # 予約・キャンセルの Idempotency-Key: 記録を保持する秒数（この間の同じキーの再送には前回の結果を返す）
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    # プロセス内にキャッシュする記録の件数（再送をストレージに問い合わせずに返す）
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+    # 期限切れの記録を削除する間隔（秒、0 は削除しない）と 1 回に削除する件数
+    IDEMPOTENCY_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL_SECONDS", "300"))
+    IDEMPOTENCY_SWEEP_BATCH_SIZE: int = int(os.getenv("IDEMPOTENCY_SWEEP_BATCH_SIZE", "400"))
+
+    # 予約・ユーザー一覧の 1 ページの件数（limit 省略時）と上限
+    LIST_PAGE_SIZE: int = int(os.getenv("LIST_PAGE_SIZE", "100"))
+    LIST_MAX_PAGE_SIZE: int = int(os.getenv("LIST_MAX_PAGE_SIZE", "500"))
+
+    # エクスポートでストレージから 1 回に読み取る件数
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+    # 稼働枠のエクスポートで指定できる最大日数
+    AVAILABILITY_EXPORT_MAX_DAYS: int = int(os.getenv("AVAILABILITY_EXPORT_MAX_DAYS", "366"))
+    # 稼働枠の CSV 取り込みで何枠ずつストレージに書き込むか
+    AVAILABILITY_IMPORT_CHUNK_SIZE: int = int(os.getenv("AVAILABILITY_IMPORT_CHUNK_SIZE", "200"))
+
+    # GET 応答の ETag の記録（If-None-Match が一致すればエンドポイントを実行せずに 304 を返す）
+    # 他インスタンスでの更新はこの秒数が経つまで反映されない
+    ETAG_CACHE_TTL_SECONDS: float = float(os.getenv("ETAG_CACHE_TTL_SECONDS", "5"))
+    ETAG_CACHE_MAX_SIZE: int = int(os.getenv("ETAG_CACHE_MAX_SIZE", "4096"))
+
+    # スナップショットリスナーによる読み取りモデル（firestore / firestore_bitmap のみ。トレーナー一覧と直近の稼働枠）
+    READ_MODEL_ENABLED: bool = os.getenv("READ_MODEL_ENABLED", "false").lower() == "true"
+    # 保持する稼働枠の日数（UTC の前日から）
+    READ_MODEL_DAYS: int = int(os.getenv("READ_MODEL_DAYS", "14"))
+    # リスナーが有効なことを最後に確認してからこの秒数を過ぎたら使わずに直接クエリする
+    READ_MODEL_MAX_STALENESS_SECONDS: float = float(os.getenv("READ_MODEL_MAX_STALENESS_SECONDS", "60"))
+    # リスナーの状態を確認する間隔（秒）
+    READ_MODEL_CHECK_INTERVAL_SECONDS: float = float(os.getenv("READ_MODEL_CHECK_INTERVAL_SECONDS", "15"))
+    # 保持するデータのおおよその上限（バイト）。超えた場合は直接クエリする
+    READ_MODEL_MAX_BYTES: int = int(os.getenv("READ_MODEL_MAX_BYTES", str(64 * 1024 * 1024)))
+    # このプロセスでの更新後、スナップショットが届くまで待つ最大秒数（その間は直接クエリする）
+    READ_MODEL_WRITE_GRACE_SECONDS: float = float(os.getenv("READ_MODEL_WRITE_GRACE_SECONDS", "2"))
+
+    # 稼働枠の変更の SSE 配信: 接続ごとの送信待ちイベントの上限（超えた接続は切り離す）
+    SLOT_EVENTS_QUEUE_SIZE: int = int(os.getenv("SLOT_EVENTS_QUEUE_SIZE", "64"))
+    # プロセスあたりの同時接続数の上限
+    SLOT_EVENTS_MAX_SUBSCRIBERS: int = int(os.getenv("SLOT_EVENTS_MAX_SUBSCRIBERS", "10000"))
+    # 接続維持のためのコメントを送る間隔（秒）
+    SLOT_EVENTS_KEEPALIVE_SECONDS: float = float(os.getenv("SLOT_EVENTS_KEEPALIVE_SECONDS", "15"))
+    # 重複配信の判定のために最後の状態を記録する枠数
+    SLOT_EVENTS_DEDUPE_SIZE: int = int(os.getenv("SLOT_EVENTS_DEDUPE_SIZE", "100000"))
+
+    # メールアドレスの索引（user_emails）にないユーザーを users のクエリで探す（索引の補完前の既存ユーザー用）
+    # app.tools.backfill_user_emails で補完した後は false にするとログインが索引の読み取りのみになる
+    USER_EMAIL_INDEX_FALLBACK: bool = os.getenv("USER_EMAIL_INDEX_FALLBACK", "true").lower() == "true"
+
+    # 起動時のウォームアップでストレージに読み取りを 1 回行い、接続を確立しておく（/ready はその完了後に 200）
+    STORAGE_WARMUP_READ: bool = os.getenv("STORAGE_WARMUP_READ", "true").lower() == "true"
+    # ウォームアップの読み取りのタイムアウト（秒）。超えた場合は失敗とし、次の /ready で再試行する
+    STORAGE_WARMUP_TIMEOUT_SECONDS: float = float(os.getenv("STORAGE_WARMUP_TIMEOUT_SECONDS", "10"))
+
+    # 高負荷なルートのレート制限（トークンバケット）と負荷遮断
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # "メソッド パス=毎秒のトークン数:バケットの容量" のカンマ区切り（パスの {name} は 1 セグメントに一致）
+    # 認証済みのリクエストはトークン（ユーザー）単位、それ以外はクライアントの IP 単位
+    RATE_LIMIT_RULES: str = os.getenv(
+        "RATE_LIMIT_RULES",
+        "POST /api/auth/login=0.5:20,"
+        "POST /api/auth/signup=0.1:10,"
+        "POST /api/reservations/=1:10,"
+        "POST /api/reservations/{reservation_id}/cancel=1:10",
+    )
+    # キーごとのバケットを保持する固定サイズの配列（幅 × 段数）。キーの数によらずメモリ使用量は一定
+    RATE_LIMIT_SKETCH_WIDTH: int = int(os.getenv("RATE_LIMIT_SKETCH_WIDTH", "8192"))
+    RATE_LIMIT_SKETCH_DEPTH: int = int(os.getenv("RATE_LIMIT_SKETCH_DEPTH", "2"))
+    # X-Forwarded-For のうち信頼するプロキシの段数（Cloud Run は 1、0 は接続元の IP を使う）
+    RATE_LIMIT_FORWARDED_HOPS: int = int(os.getenv("RATE_LIMIT_FORWARDED_HOPS", "1"))
+    # レート制限の対象ルートで同時に処理する件数の上限（超えた場合は 503、0 は無効）
+    LOAD_SHED_MAX_IN_FLIGHT: int = int(os.getenv("LOAD_SHED_MAX_IN_FLIGHT", "64"))
+
+    # /metrics（Prometheus 形式）とリクエスト・ストレージ操作の計測
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+    # リクエストのプロファイル（false の場合はミドルウェア・ストレージのラッパーを登録しない）
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    # X-Debug-Profile ヘッダー（計測の要求）と X-Debug-Token ヘッダー（結果の取得）に指定するトークン
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+    # ヘッダーなしで計測するリクエストの割合（0〜1）
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    # この秒数以上かかったリクエストを記録する（0 は無効。有効にするとすべてのリクエストを計測する）
+    PROFILING_SLOW_SECONDS: float = float(os.getenv("PROFILING_SLOW_SECONDS", "0"))
+    # スタックを記録する間隔（秒）
+    PROFILING_INTERVAL_SECONDS: float = float(os.getenv("PROFILING_INTERVAL_SECONDS", "0.005"))
+    # 計測結果の保存先と保存する件数（超えた分は古いものから上書き）
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", "/tmp/gym-reserve-profiles")
+    PROFILING_MAX_FILES: int = int(os.getenv("PROFILING_MAX_FILES", "200"))
+
+    # 静的ファイル: フィンガープリント付きの URL（/assets/名前.ハッシュ.拡張子）の Cache-Control max-age（秒）
+    STATIC_IMMUTABLE_MAX_AGE_SECONDS: int = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE_SECONDS", "31536000"))
+    # この大きさ（バイト）未満のファイルは圧縮しない
+    STATIC_COMPRESS_MIN_BYTES: int = int(os.getenv("STATIC_COMPRESS_MIN_BYTES", "512"))
+
 settings = Settings()
 
 
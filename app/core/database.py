@@ -1,21 +1,43 @@
+import threading
+from typing import Optional
+
 from google.cloud import firestore
-import os
 
-def get_db():
-    """
-    Firestore クライアントの初期化
-    """
+_db: Optional[firestore.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def _create_client() -> firestore.AsyncClient:
     try:
-        db = firestore.Client()
-        print("Firestore client initialized successfully")
+        db = firestore.AsyncClient()
+        print("Firestore async client initialized successfully")
         return db
     except Exception as e:
         print(f"⚠️  Error initializing Firestore client: {e}")
         print("⚠️  Firestore認証情報を設定してください:")
         print("    gcloud auth application-default login")
-        # 開発環境では、エラーを表示して続行（本番環境では適切に処理）
         raise e
 
-db = get_db()
+
+def get_db() -> firestore.AsyncClient:
+    """
+    Firestore 非同期クライアント（初回呼び出し時に初期化し、プロセス内で共有）
+
+    エンドポイントは async def で定義されているため、イベントループを
+    ブロックしない AsyncClient を使用する。
+    認証情報の探索を伴うため、インポート時ではなく初回利用時（通常は起動時のウォームアップ）に作成する。
+    認証情報がない場合もインポートは失敗せず、ここで例外になる。
+    """
+    global _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                _db = _create_client()
+    return _db
 
 
+def __getattr__(name: str):
+    # 互換性のため `from app.core.database import db` を初回アクセス時の初期化として扱う
+    if name == "db":
+        return get_db()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from app.core.metrics import metrics
+
+
+class BoundedHashPool:
+    """
+    bcrypt などの CPU 負荷の高い処理をイベントループ外で実行するワーカープール
+
+    - 同時実行数は max_workers で制限される
+    - 実行待ちの件数が max_queue を超えた場合は即座に 503 を返す（アドミッション制御）
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, executor: str = "thread"):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.executor_type = executor
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.last_queue_wait = 0.0
+
+    def _get_executor(self) -> Executor:
+        # 初回利用時にワーカーを起動する（インポート時のコストを避けるため）
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.executor_type == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers,
+                            thread_name_prefix="password-hash",
+                        )
+        return self._executor
+
+    @property
+    def in_flight(self) -> int:
+        """実行中 + 実行待ちの件数"""
+        return self._pending
+
+    @property
+    def queue_depth(self) -> int:
+        """ワーカーの空きを待っている件数"""
+        return max(0, self._pending - self.max_workers)
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="混み合っています。しばらくしてから再度お試しください",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """func(*args) をワーカープールで実行して結果を返す"""
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            submitted_at = time.monotonic()
+            started_at, result = await loop.run_in_executor(
+                self._get_executor(), _timed_call, func, args
+            )
+            # ワーカーに渡るまでの待ち時間を記録する
+            self.last_queue_wait = max(0.0, started_at - submitted_at)
+            metrics.observe("password_hash_queue_wait_seconds", (), self.last_queue_wait)
+            return result
+        finally:
+            self._release()
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _timed_call(func: Callable[..., Any], args: tuple) -> Tuple[float, Any]:
+    # プロセスプールでも使えるようにモジュールレベルで定義する
+    # (time.monotonic はプロセス間で共通のクロック)
+    return time.monotonic(), func(*args)
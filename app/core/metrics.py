@@ -0,0 +1,233 @@
+import contextvars
+import functools
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# レイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1 リクエストあたりのストレージ操作回数のヒストグラムの境界
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# ストレージのメソッドと操作の種類（read / query / write / transaction）
+STORAGE_OPERATIONS = {
+    "get_user": "read",
+    "find_user_by_email": "read",
+    "get_availability": "read",
+    "get_reservation": "read",
+    "get_idempotency_record": "read",
+    "list_users": "query",
+    "list_availabilities": "query",
+    "list_reservations": "query",
+    "create_user": "write",
+    "update_user": "write",
+    "create_availabilities": "write",
+    "delete_availability": "write",
+    "delete_expired_idempotency_records": "write",
+    "book_reservation": "transaction",
+    "cancel_reservation": "transaction",
+}
+
+Labels = Tuple[str, ...]
+
+# リクエスト中のストレージ操作の [回数, 秒]（ミドルウェアが設定し、ストレージのラッパーが加算する）
+_request_storage: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "request_storage", default=None
+)
+
+
+class Histogram:
+    """境界ごとの件数・合計・件数を持つヒストグラム（出力時に累積する）"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Prometheus のテキスト形式で出力するプロセス内のメトリクス
+
+    更新はすべてイベントループのスレッドから行うため、ロックを使わない（加算のみ）。
+    ラベルの組み合わせごとの値は初回のみ dict に登録する。
+    """
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        self.help: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+        # 出力時に値を読み取る指標（名前 -> (種類, 関数)）。他のオブジェクトが持つ件数を出力する
+        self.collectors: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def describe(self, name: str, text: str, labels: Tuple[str, ...] = ()) -> None:
+        self.help[name] = (text, labels)
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        series = self.counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def add_gauge(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        series = self.gauges.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        series = self.histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(buckets)
+        histogram.observe(value)
+
+    def collect(self, name: str, func: Callable[[], float], kind: str = "gauge") -> None:
+        self.collectors[name] = (kind, func)
+
+    # ---- 出力 ----
+
+    def _header(self, lines: List[str], name: str, kind: str) -> Tuple[str, ...]:
+        text, label_names = self.help.get(name, ("", ()))
+        if text:
+            lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        return label_names
+
+    @staticmethod
+    def _labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+        pairs = [f'{key}="{_escape(value)}"' for key, value in zip(names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in sorted(self.counters.items()):
+            names = self._header(lines, name, "counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{self._labels(names, labels)} {value}")
+        for name, series in sorted(self.gauges.items()):
+            names = self._header(lines, name, "gauge")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{self._labels(names, labels)} {value}")
+        for name, (kind, func) in sorted(self.collectors.items()):
+            self._header(lines, name, kind)
+            lines.append(f"{name} {func()}")
+        for name, series in sorted(self.histograms.items()):
+            names = self._header(lines, name, "histogram")
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    bucket_labels = self._labels(names, labels, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{self._labels(names, labels)} {histogram.sum}")
+                lines.append(f"{name}_count{self._labels(names, labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
+metrics.describe("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+metrics.describe("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+metrics.describe("http_requests_in_flight", "HTTP requests being processed", ("method",))
+metrics.describe("storage_operations_total", "Storage operations", ("backend", "operation", "kind"))
+metrics.describe("storage_operation_errors_total", "Storage operations that raised", ("backend", "operation", "kind"))
+metrics.describe("storage_operation_duration_seconds", "Storage operation latency", ("backend", "operation"))
+metrics.describe("storage_operations_per_request", "Storage operations per HTTP request", ("route",))
+metrics.describe("storage_seconds_per_request", "Time spent in storage per HTTP request", ("route",))
+metrics.describe("storage_transaction_attempts_total", "Optimistic transaction attempts", ())
+metrics.describe("storage_transaction_aborts_total", "Optimistic transaction attempts aborted by contention", ())
+metrics.describe("password_hash_queue_wait_seconds", "Time bcrypt jobs waited for a worker", ())
+
+
+# ---- ストレージの計測 ----
+
+def _timed(backend: str, operation: str, kind: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    labels = (backend, operation, kind)
+    duration_labels = (backend, operation)
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.inc("storage_operation_errors_total", labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.inc("storage_operations_total", labels)
+            metrics.observe("storage_operation_duration_seconds", duration_labels, elapsed)
+            current = _request_storage.get()
+            if current is not None:
+                current[0] += 1
+                current[1] += elapsed
+
+    return wrapper
+
+
+def instrument_storage(storage: Any) -> Any:
+    """ストレージの各操作を計測するラッパーをインスタンスの属性として設定する（クラスは変更しない）"""
+    for operation, kind in STORAGE_OPERATIONS.items():
+        setattr(storage, operation, _timed(storage.name, operation, kind, getattr(storage, operation)))
+    metrics.collect("storage_transaction_attempts_total", lambda: storage.transaction_attempts, "counter")
+    metrics.collect("storage_transaction_aborts_total", lambda: storage.transaction_aborts, "counter")
+    return storage
+
+
+# ---- HTTP の計測 ----
+
+class MetricsMiddleware:
+    """
+    ルート（パスのテンプレート）ごとのレイテンシ・ステータス・処理中の件数と、
+    リクエストあたりのストレージ操作の回数・時間を記録する ASGI ミドルウェア
+
+    ストリーミング応答（text/event-stream）は接続時間になるため、レイテンシには含めない。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        started = time.perf_counter()
+        storage = [0, 0.0]
+        token = _request_storage.set(storage)
+        response = {"status": 500, "stream": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for key, value in message.get("headers", ()):
+                    if key == b"content-type" and value.startswith(b"text/event-stream"):
+                        response["stream"] = True
+            await send(message)
+
+        metrics.add_gauge("http_requests_in_flight", (method,), 1)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.add_gauge("http_requests_in_flight", (method,), -1)
+            _request_storage.reset(token)
+            route = scope.get("route")
+            # 未登録のパスはラベルの種類が増えないようまとめる
+            path = getattr(route, "path", None) or "unmatched"
+            metrics.inc("http_requests_total", (method, path, str(response["status"])))
+            if not response["stream"]:
+                metrics.observe("http_request_duration_seconds", (method, path), time.perf_counter() - started)
+                metrics.observe("storage_operations_per_request", (path,), storage[0], COUNT_BUCKETS)
+                metrics.observe("storage_seconds_per_request", (path,), storage[1])
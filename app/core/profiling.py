@@ -0,0 +1,272 @@
+import asyncio
+import contextvars
+import functools
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import STORAGE_OPERATIONS
+
+# 計測を要求するヘッダー（値は PROFILING_TOKEN）
+PROFILE_HEADER = "x-debug-profile"
+# 記録するスタックの深さの上限
+MAX_STACK_DEPTH = 64
+
+# 計測中のリクエストのプロファイル（ストレージのラッパーがタイムラインに追記する）
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+
+class Profile:
+    """1 リクエスト分の計測結果（スタックのサンプルとストレージ操作のタイムライン）"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.samples: Counter = Counter()
+        self.timeline: List[Dict[str, Any]] = []
+
+    def to_dict(self, route: str, status: int, duration: float) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": route,
+            "status": status,
+            "trigger": self.trigger,
+            "startedAt": self.started_at.isoformat(),
+            "durationMs": round(duration * 1000, 3),
+            "sampleIntervalMs": settings.PROFILING_INTERVAL_SECONDS * 1000,
+            "storage": self.timeline,
+            # 折りたたみ形式（"外側;...;内側" -> サンプル数）。flamegraph.pl / speedscope で表示できる
+            "samples": dict(self.samples.most_common()),
+        }
+
+
+class StackSampler:
+    """
+    計測中のリクエストがある間だけ、イベントループのスレッドのスタックを一定間隔で記録するスレッド
+
+    イベントループは複数のリクエストを交互に処理するため、サンプルは同時に計測中の
+    すべてのリクエストに記録される（同時に処理していた他のリクエストの処理も含まれうる）。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: Dict[int, Profile] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._active[id(profile)] = profile
+            self._target = threading.get_ident()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def remove(self, profile: Profile) -> None:
+        with self._lock:
+            self._active.pop(id(profile), None)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            frame = sys._current_frames().get(self._target)
+            stack = _fold(frame) if frame is not None else None
+            # remove() の後に記録しないよう、記録はロック内で行う
+            with self._lock:
+                if not self._active:
+                    self._wakeup.clear()
+                    continue
+                if stack:
+                    for profile in self._active.values():
+                        profile.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+def _fold(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfileStore:
+    """
+    計測結果をディレクトリ内の固定数のファイル（リングバッファ）に保存する
+
+    ファイル名は連番を max_files で割った余りのため、上限を超えると最も古いものから上書きされる。
+    """
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max(1, max_files)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _path(self, slot: int) -> str:
+        return os.path.join(self.directory, f"profile-{slot:04d}.json")
+
+    def save(self, data: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._sequence == 0:
+                os.makedirs(self.directory, exist_ok=True)
+                self._sequence = self._next_sequence()
+            sequence = self._sequence
+            self._sequence += 1
+        data = {"id": sequence, **data}
+        path = self._path(sequence % self.max_files)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _next_sequence(self) -> int:
+        """既存のファイルの続きの連番（再起動後も古いものから上書きする）"""
+        latest = max((entry["id"] for entry in self._load_all()), default=0)
+        return latest + 1
+
+    def _load_all(self) -> List[Dict[str, Any]]:
+        entries = []
+        for slot in range(self.max_files):
+            try:
+                with open(self._path(slot), encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def list(self) -> List[Dict[str, Any]]:
+        """新しい順の一覧（サンプルとタイムラインを除く）"""
+        entries = sorted(self._load_all(), key=lambda entry: entry["id"], reverse=True)
+        return [
+            {
+                **{key: value for key, value in entry.items() if key not in ("samples", "storage")},
+                "storageCalls": len(entry.get("storage", [])),
+            }
+            for entry in entries
+        ]
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(profile_id % self.max_files), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("id") == profile_id else None
+
+
+profile_store = ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_FILES)
+
+
+def authorized(token: Optional[str]) -> bool:
+    """デバッグ用のトークンが一致するか（PROFILING_TOKEN が未設定の場合は常に False）"""
+    return bool(settings.PROFILING_TOKEN) and bool(token) and hmac.compare_digest(token, settings.PROFILING_TOKEN)
+
+
+# ---- ストレージのタイムライン ----
+
+def _traced(operation: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        profile = _current.get()
+        if profile is None:
+            return await func(*args, **kwargs)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            profile.timeline.append({
+                "operation": operation,
+                "startMs": round((started - profile.started) * 1000, 3),
+                "durationMs": round((time.perf_counter() - started) * 1000, 3),
+                "error": error,
+            })
+
+    return wrapper
+
+
+def trace_storage(storage: Any) -> Any:
+    """計測中のリクエストのストレージ操作をタイムラインに記録するラッパーを設定する"""
+    for operation in STORAGE_OPERATIONS:
+        setattr(storage, operation, _traced(operation, getattr(storage, operation)))
+    return storage
+
+
+# ---- ミドルウェア ----
+
+class ProfilingMiddleware:
+    """
+    以下のいずれかに該当するリクエストのスタックのサンプルとストレージ操作のタイムラインを記録する ASGI ミドルウェア
+
+    - `X-Debug-Profile` ヘッダーが PROFILING_TOKEN と一致する
+    - PROFILING_SAMPLE_RATE の確率で選ばれた
+    - 処理時間が PROFILING_SLOW_SECONDS 以上だった（この場合はすべてのリクエストを計測し、終了時に判定する）
+
+    PROFILING_ENABLED=false の場合は登録されないため、負荷はかからない。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.sampler = StackSampler(settings.PROFILING_INTERVAL_SECONDS)
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.slow_seconds = settings.PROFILING_SLOW_SECONDS
+
+    def _trigger(self, scope) -> Optional[str]:
+        for key, value in scope.get("headers", ()):
+            if key == PROFILE_HEADER.encode() and authorized(value.decode("latin-1")):
+                return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        if self.slow_seconds > 0:
+            return "slow"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trigger = self._trigger(scope)
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], trigger)
+        token = _current.set(profile)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        self.sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.sampler.remove(profile)
+            _current.reset(token)
+            duration = time.perf_counter() - profile.started
+            if trigger != "slow" or duration >= self.slow_seconds:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                data = profile.to_dict(route, status["code"], duration)
+                asyncio.get_running_loop().run_in_executor(None, profile_store.save, data)
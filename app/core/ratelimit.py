@@ -0,0 +1,206 @@
+import json
+import math
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.auth import token_subject
+from app.core.config import settings
+from app.core.metrics import metrics
+
+metrics.describe("rate_limit_rejected_total", "Requests rejected by the rate limiter", ("route",))
+metrics.describe("load_shed_total", "Requests rejected by load shedding", ("route",))
+
+
+class TokenBucketSketch:
+    """
+    キーごとのトークンバケットを固定サイズの配列（depth 段 × width 列）で近似する（Count-Min Sketch と同じ構造）
+
+    キーは段ごとに 1 つのセルに割り当てられ、そのうち最も少ない残量をキーの残量とみなす。
+    衝突したキー同士はトークンを共有するため、誤差は制限が厳しくなる側にのみ生じる（上限を超えて許可しない）。
+    更新はイベントループのスレッドからのみ行うため、ロックを使わない。
+    """
+
+    def __init__(self, rate: float, burst: float, width: int, depth: int):
+        self.rate = rate
+        self.burst = burst
+        self.width = max(1, width)
+        self.depth = max(1, depth)
+        self.tokens = [[float(burst)] * self.width for _ in range(self.depth)]
+        self.stamps = [[0.0] * self.width for _ in range(self.depth)]
+        # 段ごとに異なるハッシュにする（同じ 2 つのキーがすべての段で衝突しないように）
+        self.salts = [random.getrandbits(64) for _ in range(self.depth)]
+
+    def take(self, key: str, now: float) -> float:
+        """トークンを 1 つ消費する。許可した場合は 0、拒否した場合は次のトークンまでの秒数"""
+        cells = []
+        available = self.burst
+        for row in range(self.depth):
+            i = hash((self.salts[row], key)) % self.width
+            tokens = min(self.burst, self.tokens[row][i] + (now - self.stamps[row][i]) * self.rate)
+            self.tokens[row][i] = tokens
+            self.stamps[row][i] = now
+            cells.append(i)
+            if tokens < available:
+                available = tokens
+        if available < 1:
+            return (1 - available) / self.rate if self.rate > 0 else math.inf
+        for row, i in enumerate(cells):
+            self.tokens[row][i] -= 1
+        return 0.0
+
+
+class Rule:
+    """1 つのルートの予算"""
+
+    __slots__ = ("method", "path", "pattern", "sketch")
+
+    def __init__(self, method: str, path: str, rate: float, burst: float, width: int, depth: int):
+        self.method = method
+        self.path = path
+        self.pattern = None
+        if "{" in path:
+            self.pattern = re.compile("^" + re.sub(r"\\\{[^/]+?\\\}", "[^/]+", re.escape(path)) + "$")
+        self.sketch = TokenBucketSketch(rate, burst, width, depth)
+
+
+def parse_rules(text: str, width: int, depth: int) -> List[Rule]:
+    """RATE_LIMIT_RULES（"メソッド パス=毎秒のトークン数:容量" のカンマ区切り）を解析する"""
+    rules = []
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        route, _, budget = item.rpartition("=")
+        method, _, path = route.strip().partition(" ")
+        rate, _, burst = budget.partition(":")
+        if not method or not path or not rate or not burst:
+            raise ValueError(f"Invalid RATE_LIMIT_RULES entry: {item}")
+        rules.append(Rule(method.upper(), path.strip().rstrip("/") or "/", float(rate), float(burst), width, depth))
+    return rules
+
+
+class RateLimiter:
+    """
+    ルートごとのレート制限と、対象ルート全体の同時処理数による負荷遮断
+
+    - 対象ルートはパスの完全一致（辞書の参照）を先に試し、パラメータを含むルートのみ正規表現で判定する
+    - 同時処理数が上限に達している場合は、トークンを消費せずに 503 を返す
+    """
+
+    def __init__(self, rules: List[Rule], max_in_flight: int, forwarded_hops: int):
+        self._exact: Dict[Tuple[str, str], Rule] = {}
+        self._patterns: List[Rule] = []
+        for rule in rules:
+            if rule.pattern is None:
+                self._exact[(rule.method, rule.path)] = rule
+            else:
+                self._patterns.append(rule)
+        self.max_in_flight = max_in_flight
+        self.forwarded_hops = forwarded_hops
+        self.in_flight = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def match(self, method: str, path: str) -> Optional[Rule]:
+        path = path.rstrip("/") or "/"
+        rule = self._exact.get((method, path))
+        if rule is not None or not self._patterns:
+            return rule
+        for rule in self._patterns:
+            if rule.method == method and rule.pattern.match(path):
+                return rule
+        return None
+
+    def client_key(self, scope) -> str:
+        """
+        署名を検証できたトークンのリクエストはユーザーID、それ以外はクライアントの IP
+
+        ログイン・サインアップ（/api/auth/）は常に IP で数える。検証していない値をキーにすると、
+        リクエストごとに異なる Authorization ヘッダーを付けるだけで制限を回避できるため。
+        """
+        forwarded = None
+        token = None
+        for key, value in scope.get("headers", ()):
+            if key == b"authorization" and value[:7].lower() == b"bearer ":
+                token = value[7:].decode("latin-1")
+            elif key == b"x-forwarded-for":
+                forwarded = value
+        if token is not None and not scope["path"].startswith("/api/auth/"):
+            user_id = token_subject(token)
+            if user_id is not None:
+                return "user:" + user_id
+        if forwarded is not None and self.forwarded_hops > 0:
+            # 信頼するプロキシが追加した右端から数える（左側はクライアントが偽装できる）
+            hops = forwarded.decode("latin-1").split(",")
+            return "ip:" + hops[max(0, len(hops) - self.forwarded_hops)].strip()
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rules": len(self._exact) + len(self._patterns),
+            "inFlight": self.in_flight,
+            "maxInFlight": self.max_in_flight,
+            "rejected": self.rejected,
+            "shed": self.shed,
+        }
+
+
+rate_limiter = RateLimiter(
+    parse_rules(settings.RATE_LIMIT_RULES, settings.RATE_LIMIT_SKETCH_WIDTH, settings.RATE_LIMIT_SKETCH_DEPTH),
+    max_in_flight=settings.LOAD_SHED_MAX_IN_FLIGHT,
+    forwarded_hops=settings.RATE_LIMIT_FORWARDED_HOPS,
+)
+
+
+async def _reject(send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """
+    RATE_LIMIT_RULES のルートにレート制限（429）と負荷遮断（503）を適用する ASGI ミドルウェア
+
+    対象外のルートは辞書の参照 1 回で素通りする。CORS より内側に登録し、拒否した応答にも CORS ヘッダーを付ける。
+    """
+
+    def __init__(self, app, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter
+        rule = limiter.match(scope["method"], scope["path"])
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        if limiter.max_in_flight and limiter.in_flight >= limiter.max_in_flight:
+            limiter.shed += 1
+            metrics.inc("load_shed_total", (rule.path,))
+            await _reject(send, 503, "混み合っています。しばらくしてから再度お試しください", 1)
+            return
+        wait = rule.sketch.take(limiter.client_key(scope), time.monotonic())
+        if wait:
+            limiter.rejected += 1
+            metrics.inc("rate_limit_rejected_total", (rule.path,))
+            await _reject(send, 429, "リクエストが多すぎます。しばらくしてから再度お試しください", wait)
+            return
+
+        limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
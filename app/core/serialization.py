@@ -0,0 +1,46 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+
+@lru_cache(maxsize=None)
+def _adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def model_response(model: Type[BaseModel], data: Dict[str, Any], response: Optional[Response] = None) -> Response:
+    """dict を model として 1 回だけ検証し、JSON にした応答（list_response の単一のモデル版）"""
+    adapter = _adapter(model)
+    body = adapter.dump_json(adapter.validate_python(data))
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def list_response(
+    model: Type[BaseModel],
+    docs: Iterable[Dict[str, Any]],
+    response: Optional[Response] = None,
+    exclude_none: bool = False,
+) -> Response:
+    """
+    ストレージから読んだ dict のリストを model のリストとして 1 回だけ検証し、JSON にした応答
+
+    モデルを 1 件ずつ作って返すと、FastAPI が response_model でリスト全体を再度検証・変換してから
+    JSON にするため、件数が多い一覧では検証が 2 回・変換が 2 回かかる。ここでは検証と JSON への変換を
+    pydantic-core（Rust）で 1 回ずつ行い、Response を直接返して response_model の処理を省く
+    （response_model は OpenAPI のスキーマのために残す）。
+    model にないフィールド（slotIds など）は出力しない。
+
+    response にはエンドポイントが受け取った Response を渡す（設定済みのヘッダーを引き継ぐ）。
+    """
+    adapter = _list_adapter(model)
+    body = adapter.dump_json(adapter.validate_python(list(docs)), exclude_none=exclude_none)
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=body, media_type="application/json", headers=headers)
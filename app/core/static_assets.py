@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli が未インストールの場合は gzip のみ
+    brotli = None
+
+# HTML 内の /assets/ への参照（フィンガープリント付きの URL に書き換える）
+ASSET_REFERENCE = re.compile(r"/assets/([A-Za-z0-9_.\-/]+)")
+# 圧縮を優先する順
+ENCODINGS = ("br", "gzip")
+NO_CACHE = "no-cache"
+
+
+class Asset:
+    """メモリ上の静的ファイル（圧縮済みの本文をエンコーディングごとに持つ）"""
+
+    __slots__ = ("name", "media_type", "digest", "bodies", "etags")
+
+    def __init__(self, name: str, media_type: str, body: bytes, min_compress: int):
+        self.name = name
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.bodies: Dict[str, bytes] = {"identity": body}
+        if len(body) >= min_compress:
+            candidates = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(body, quality=11)
+            for encoding, compressed in candidates.items():
+                # 小さくならない場合は圧縮版を使わない
+                if len(compressed) < len(body):
+                    self.bodies[encoding] = compressed
+        # エンコーディングごとに本文が異なるため、ETag も分ける
+        self.etags = {
+            encoding: f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+    @property
+    def fingerprinted(self) -> str:
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest[:12]}{ext}"
+
+
+def _accepted(accept_encoding: str) -> List[str]:
+    """Accept-Encoding のうち q=0 でないもの"""
+    accepted = []
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        name, _, value = params.partition("=")
+        try:
+            if name.strip() == "q" and float(value) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.append(coding.strip().lower())
+    return accepted
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class StaticAssets:
+    """
+    静的ファイルを起動時にメモリに読み込み、gzip / brotli で圧縮した版とフィンガープリントを作っておく
+
+    - /assets/名前.ハッシュ.拡張子（フィンガープリント付き）は内容が変わると URL が変わるため、immutable で長期間キャッシュさせる
+    - HTML（エントリーポイント）と /assets/名前 は no-cache とし、ETag による再検証（304）で本文の再送を省く
+    - HTML 内の /assets/名前 への参照はフィンガープリント付きの URL に書き換える
+    リクエスト時はディスクの読み取りも圧縮も行わない。
+    """
+
+    def __init__(self, directory: str, max_age: int, min_compress: int):
+        self.directory = directory
+        self.max_age = max_age
+        self.min_compress = min_compress
+        self._assets: Dict[str, Asset] = {}
+        # フィンガープリント付きの名前 -> ファイル
+        self._fingerprinted: Dict[str, Asset] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.not_modified = 0
+
+    def load(self) -> None:
+        """ディレクトリ内のファイルを読み込む（2 回目以降は何もしない）"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            raw: Dict[str, bytes] = {}
+            for root, _, files in os.walk(self.directory):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                    with open(path, "rb") as f:
+                        raw[name] = f.read()
+
+            # 参照される側（HTML 以外）を先に作り、フィンガープリントを確定させてから HTML を書き換える
+            pages = [name for name in raw if name.endswith(".html")]
+            for name in raw:
+                if name not in pages:
+                    self._add(name, raw[name])
+            for name in pages:
+                self._add(name, self._rewrite(raw[name]))
+            self._loaded = True
+
+    def _add(self, name: str, body: bytes) -> None:
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        # text/* は Response が charset を付ける
+        if media_type in ("application/javascript", "application/json"):
+            media_type += "; charset=utf-8"
+        asset = Asset(name, media_type, body, self.min_compress)
+        self._assets[name] = asset
+        self._fingerprinted[asset.fingerprinted] = asset
+
+    def _rewrite(self, body: bytes) -> bytes:
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return body
+
+        def replace(match: "re.Match[str]") -> str:
+            asset = self._assets.get(match.group(1))
+            return f"/assets/{asset.fingerprinted}" if asset is not None else match.group(0)
+
+        return ASSET_REFERENCE.sub(replace, text).encode("utf-8")
+
+    def url(self, name: str) -> str:
+        """フィンガープリント付きの URL"""
+        self.load()
+        return f"/assets/{self._assets[name].fingerprinted}"
+
+    def lookup(self, path: str) -> Optional[Tuple[Asset, bool]]:
+        """/assets/ 以下のパスのファイルと、フィンガープリント付きか（存在しない場合は None）"""
+        self.load()
+        asset = self._fingerprinted.get(path)
+        if asset is not None:
+            return asset, True
+        asset = self._assets.get(path)
+        return (asset, False) if asset is not None else None
+
+    def response(self, request: Request, asset: Asset, immutable: bool = False) -> Response:
+        accepted = _accepted(request.headers.get("accept-encoding", ""))
+        encoding = next((e for e in ENCODINGS if e in asset.bodies and e in accepted), "identity")
+        etag = asset.etags[encoding]
+        headers = {
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Cache-Control": f"public, max-age={self.max_age}, immutable" if immutable else NO_CACHE,
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(asset.bodies[encoding], media_type=asset.media_type, headers=headers)
+
+    def stats(self) -> Dict[str, int]:
+        self.load()
+        return {
+            "files": len(self._assets),
+            "bytes": sum(len(body) for asset in self._assets.values() for body in asset.bodies.values()),
+            "notModified": self.not_modified,
+        }
+
+
+static_assets = StaticAssets(
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "static"),
+    max_age=settings.STATIC_IMMUTABLE_MAX_AGE_SECONDS,
+    min_compress=settings.STATIC_COMPRESS_MIN_BYTES,
+)
@@ -0,0 +1,57 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.storage import get_storage
+
+
+class Readiness:
+    """
+    起動時のウォームアップ（ストレージの作成と接続の確立）の状態
+
+    ウォームアップはバックグラウンドで行い、起動（ポートの待ち受け）を遅らせない。
+    /health はプロセスが動いているか、/ready はリクエストを処理する準備ができたかを返す。
+    失敗した場合は次の /ready で再試行する。
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.error: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.attempts = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def warm_up(self) -> None:
+        started = time.perf_counter()
+        self.attempts += 1
+        try:
+            # クライアントの作成（認証情報の探索）はブロックするため、スレッドで行う
+            storage = await asyncio.to_thread(get_storage)
+            if settings.STORAGE_WARMUP_READ:
+                await asyncio.wait_for(storage.warm_up(), settings.STORAGE_WARMUP_TIMEOUT_SECONDS)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            print(f"⚠️  Warm-up failed: {self.error}")
+        else:
+            self.ready = True
+            self.error = None
+        finally:
+            self.duration = time.perf_counter() - started
+
+    def start(self) -> None:
+        """ウォームアップを開始する（実行中・完了済みの場合は何もしない）"""
+        if self.ready or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.get_running_loop().create_task(self.warm_up())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "starting" if self.error is None else "error",
+            "error": self.error,
+            "attempts": self.attempts,
+            "durationMs": round(self.duration * 1000, 1) if self.duration is not None else None,
+        }
+
+
+readiness = Readiness()
@@ -1,13 +1,59 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-import os
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 
 from app.api.router import api_router
 from app.core.config import settings
+from app.core.auth import hash_pool, principal_cache
+from app.core.conditional import conditional_cache, conditional_get
+from app.core.metrics import MetricsMiddleware, metrics
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.ratelimit import RateLimitMiddleware, rate_limiter
+from app.core.static_assets import static_assets
+from app.core.warmup import readiness
+from app.storage import close_storage, get_storage
+from app.services.booking_serializer import booking_serializer
+from app.services.idempotency import REPLAYED_HEADER, idempotency_keys
+from app.services.read_model import read_model
+from app.services.slot_events import slot_events
 
-app = FastAPI(title=settings.PROJECT_NAME)
+# 応答の JSON は orjson で作る（一覧は list_response で検証・変換を 1 回にしている）
+app = FastAPI(title=settings.PROJECT_NAME, default_response_class=ORJSONResponse)
+
+@app.on_event("startup")
+async def start_warm_up():
+    # ストレージの接続はバックグラウンドで確立し、起動を待たせない（完了は /ready で確認する）
+    readiness.start()
+    # 期限切れの Idempotency-Key の記録を定期的に削除する
+    idempotency_keys.start(get_storage, lambda: readiness.ready)
+
+@app.on_event("startup")
+def load_static_assets():
+    # 静的ファイルの読み込み・圧縮をリクエストの前に済ませておく
+    static_assets.load()
+
+@app.on_event("startup")
+async def start_read_model():
+    # スナップショットリスナーは Firestore 系のストレージでのみ使う
+    if settings.READ_MODEL_ENABLED and settings.STORAGE_BACKEND in ("firestore", "firestore_bitmap"):
+        read_model.start(bitmap=settings.STORAGE_BACKEND == "firestore_bitmap")
+        conditional_cache.add_listener(read_model.mark_dirty)
+        # 他インスタンスでの稼働枠の変更も SSE で配信する
+        read_model.add_slot_listener(slot_events.publish_threadsafe)
+
+@app.on_event("shutdown")
+def shutdown_resources():
+    read_model.stop()
+    idempotency_keys.stop()
+    hash_pool.shutdown()
+    close_storage()
+
+# ETag / If-None-Match（CORS より内側で処理し、304 にも CORS ヘッダーを付ける）
+app.middleware("http")(conditional_get)
+
+# 高負荷なルートのレート制限・負荷遮断（CORS より内側で処理し、429 / 503 にも CORS ヘッダーを付ける）
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # CORS設定
 app.add_middleware(
@@ -16,8 +62,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", REPLAYED_HEADER],
 )
 
+# リクエストの計測（最も外側で処理し、他のミドルウェアの時間も含める）
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    metrics.collect("password_hash_in_flight", lambda: hash_pool.in_flight)
+    metrics.collect("password_hash_queue_depth", lambda: hash_pool.queue_depth)
+    metrics.collect("password_hash_rejected_total", lambda: hash_pool.rejected, "counter")
+    metrics.collect("slot_event_subscribers", lambda: slot_events.stats()["subscribers"])
+    metrics.collect("rate_limited_routes_in_flight", lambda: rate_limiter.in_flight)
+
+# リクエストのプロファイル（無効の場合は登録しない）
+if settings.PROFILING_ENABLED:
+    from app.core.profiling import ProfilingMiddleware
+    app.add_middleware(ProfilingMiddleware)
+
 # APIルーターの登録
 app.include_router(api_router, prefix="/api")
 
@@ -27,23 +88,58 @@ app.include_router(api_router, prefix="/api")
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "service": settings.PROJECT_NAME}
+    return {
+        "status": "ok",
+        "service": settings.PROJECT_NAME,
+        "principalCache": principal_cache.stats(),
+        "conditionalGet": conditional_cache.stats(),
+        "readModel": read_model.stats(),
+        "slotEvents": slot_events.stats(),
+        "warmUp": readiness.stats(),
+        "idempotency": idempotency_keys.stats(),
+        "rateLimit": rate_limiter.stats(),
+        "staticAssets": static_assets.stats(),
+        "booking": {
+            **booking_serializer.stats(),
+            "transactionAborts": get_storage().transaction_aborts if readiness.ready else 0,
+        },
+    }
+
+@app.get("/ready")
+async def ready_check():
+    """リクエストを処理する準備ができたか（ストレージのウォームアップの完了）。未完了の場合は 503"""
+    if readiness.ready:
+        return {"status": "ready"}
+    readiness.start()
+    return JSONResponse(status_code=503, content=readiness.stats(), headers={"Retry-After": "1"})
 
-# フロントエンドの配信
-static_path = os.path.join(os.path.dirname(__file__), "static")
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus のテキスト形式のメトリクス"""
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
-# StaticFilesをマウント
-app.mount("/assets", StaticFiles(directory=static_path), name="static")
+# フロントエンドの配信（起動時にメモリに読み込んだ圧縮済みのファイルを返す）
+@app.get("/assets/{path:path}", include_in_schema=False)
+async def serve_asset(path: str, request: Request):
+    found = static_assets.lookup(path)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    asset, immutable = found
+    return static_assets.response(request, asset, immutable)
 
 @app.get("/")
-async def serve_index():
-    return FileResponse(os.path.join(static_path, "index.html"))
+async def serve_index(request: Request):
+    asset, _ = static_assets.lookup("index.html")
+    return static_assets.response(request, asset)
 
 @app.get("/index.html")
-async def serve_index_html():
-    return await serve_index()
+async def serve_index_html(request: Request):
+    return await serve_index(request)
 
 @app.get("/login.html")
-async def serve_login():
-    return FileResponse(os.path.join(static_path, "login.html"))
+async def serve_login(request: Request):
+    asset, _ = static_assets.lookup("login.html")
+    return static_assets.response(request, asset)
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import List, Optional
 
@@ -23,6 +23,48 @@ class AvailabilityResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class AvailabilitySlot(BaseModel):
+    """稼働枠（期間指定取得用。fields で射影されなかった項目は省略）"""
+    id: str
+    trainerId: Optional[str] = None
+    startAt: Optional[datetime] = None
+    endAt: Optional[datetime] = None
+    isBooked: Optional[bool] = None
+
+class AvailabilityDay(BaseModel):
+    """日別の稼働枠"""
+    date: str  # YYYY-MM-DD
+    slots: List[AvailabilitySlot]
+
+class AvailabilityWindow(BaseModel):
+    """予約可能な開始時刻（空き時間検索の応答）"""
+    trainerId: str
+    startAt: datetime
+    endAt: datetime
+
+class AvailabilityTemplate(BaseModel):
+    """繰り返し稼働枠テンプレート（例: 毎週月・水 09:00〜12:00）"""
+    trainerId: str
+    weekdays: List[int]  # 0=月曜 ... 6=日曜
+    startTime: str  # HH:mm（ローカル時刻）
+    endTime: str  # HH:mm（ローカル時刻）
+    startDate: str  # YYYY-MM-DD
+    endDate: str  # YYYY-MM-DD（この日を含む）
+    skipDates: List[str] = []  # 祝日など登録しない日（YYYY-MM-DD）
+    utcOffsetMinutes: int = Field(540, ge=-720, le=840)  # ローカル時刻の UTC からのオフセット（既定は JST、-12:00〜+14:00）
+
+class AvailabilityTemplateResult(BaseModel):
+    """テンプレート登録結果"""
+    created: int
+    skipped: int
+
+class AvailabilityImportResult(BaseModel):
+    """CSV 取り込み結果"""
+    created: int
+    skipped: int
+    invalid: int
+    errors: List[str] = []  # 取り込めなかった行（先頭の一部のみ）
+
 class AvailabilityQuery(BaseModel):
     """稼働枠検索クエリ"""
     trainerId: Optional[str] = None
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from app.schemas.availability import AvailabilityResponse
+from app.schemas.reservation import ReservationResponse
+from app.schemas.user import UserResponse
+
+class BootstrapResponse(BaseModel):
+    """ダッシュボードの初期表示に必要なデータ（GET /api/bootstrap）"""
+    user: UserResponse
+    trainers: List[UserResponse]
+    reservations: List[ReservationResponse]
+    # 予約の続きのページ（GET /api/reservations/ の cursor に指定する）
+    reservationsNextCursor: Optional[str] = None
+    # date を指定した場合のみ、その日の稼働枠
+    availabilities: Optional[List[AvailabilityResponse]] = None
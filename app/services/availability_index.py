@@ -0,0 +1,206 @@
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.storage.base import SLOT_MINUTES, StorageBackend, to_utc
+
+# ビット番号 0 に対応する時刻（これより前の枠は扱わない）
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+SLOT_DELTA = timedelta(minutes=SLOT_MINUTES)
+
+
+def slot_number(dt: datetime) -> int:
+    """EPOCH からの枠番号（30分単位、切り捨て）"""
+    return (to_utc(dt) - EPOCH) // SLOT_DELTA
+
+
+def slot_start(number: int) -> datetime:
+    return EPOCH + SLOT_DELTA * number
+
+
+def run_starts(free: int, length: int) -> int:
+    """
+    free のビット列のうち、length 個以上連続する 1 の開始位置のビットを返す
+
+    Python の多倍長整数をビットベクトルとして扱い、シフトと AND をまとめて行う（ワード単位で並列処理される）。
+    倍々にシフト幅を広げるため、演算回数は O(log length)。
+    """
+    if length <= 0:
+        return 0
+    runs = free
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        runs &= runs >> step
+        covered += step
+    return runs
+
+
+def iter_bits(value: int) -> Iterable[int]:
+    """立っているビットの位置を昇順に列挙する"""
+    while value:
+        low = value & -value
+        yield low.bit_length() - 1
+        value ^= low
+
+
+class AvailabilityIndex:
+    """
+    トレーナーごとの稼働枠ビットセット（プロセス内の読み取り用インデックス）
+
+    - 必要な日（UTC）の範囲だけストレージから遅延ロードする
+    - 枠の登録・予約・キャンセル・削除時にエンドポイントから差分更新する
+    - 他インスタンスでの更新は反映されないため、ロード済みの日は ttl 秒で再ロードする
+      （予約可否の最終判断は常にストレージのトランザクションで行う）
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # trainerId -> [稼働枠ビット, 予約済みビット]
+        self._trainers: Dict[str, List[int]] = {}
+        # 日(UTC) -> ロード時刻
+        self._loaded_days: Dict[date, float] = {}
+
+    # ---- ロード ----
+
+    def _missing_days(self, first: date, last: date) -> List[Tuple[date, date]]:
+        """未ロード（または期限切れ）の日を連続区間ごとにまとめて返す"""
+        now = time.monotonic()
+        segments: List[Tuple[date, date]] = []
+        day = first
+        while day <= last:
+            loaded_at = self._loaded_days.get(day)
+            if loaded_at is None or now - loaded_at > self.ttl:
+                if segments and segments[-1][1] + timedelta(days=1) == day:
+                    segments[-1] = (segments[-1][0], day)
+                else:
+                    segments.append((day, day))
+            day += timedelta(days=1)
+        return segments
+
+    def _replace_days(self, first: date, last: date, slots: List[Dict[str, Any]]) -> None:
+        start = max(0, slot_number(datetime.combine(first, datetime.min.time(), tzinfo=timezone.utc)))
+        end = max(0, slot_number(datetime.combine(last + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)))
+        range_mask = ((1 << (end - start)) - 1) << start
+        with self._lock:
+            for bits in self._trainers.values():
+                bits[0] &= ~range_mask
+                bits[1] &= ~range_mask
+            for slot in slots:
+                number = slot_number(slot["startAt"])
+                if number < 0:
+                    continue
+                bits = self._trainers.setdefault(slot["trainerId"], [0, 0])
+                bits[0] |= 1 << number
+                if slot.get("isBooked"):
+                    bits[1] |= 1 << number
+            loaded_at = time.monotonic()
+            day = first
+            while day <= last:
+                self._loaded_days[day] = loaded_at
+                day += timedelta(days=1)
+
+    async def ensure_loaded(self, storage: StorageBackend, start_at: datetime, end_at: datetime) -> None:
+        """[start_at, end_at) を含む日のデータをロードする"""
+        first = to_utc(start_at).date()
+        last = (to_utc(end_at) - timedelta(microseconds=1)).date()
+        for seg_first, seg_last in self._missing_days(first, last):
+            seg_start = datetime.combine(seg_first, datetime.min.time(), tzinfo=timezone.utc)
+            seg_end = datetime.combine(seg_last + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc)
+            slots = await storage.list_availabilities(
+                seg_start, seg_end, fields=["trainerId", "startAt", "isBooked"]
+            )
+            self._replace_days(seg_first, seg_last, slots)
+
+    # ---- 差分更新 ----
+
+    def _is_loaded(self, dt: datetime) -> bool:
+        return to_utc(dt).date() in self._loaded_days
+
+    def _update(self, trainer_id: str, start_at: datetime, num_slots: int, open_: Optional[bool], booked: Optional[bool]) -> None:
+        with self._lock:
+            bits = self._trainers.setdefault(trainer_id, [0, 0])
+            for i in range(num_slots):
+                dt = to_utc(start_at) + SLOT_DELTA * i
+                number = slot_number(dt)
+                # 未ロードの日はロード時に反映されるため更新しない
+                if number < 0 or not self._is_loaded(dt):
+                    continue
+                bit = 1 << number
+                if open_ is not None:
+                    bits[0] = bits[0] | bit if open_ else bits[0] & ~bit
+                if booked is not None:
+                    bits[1] = bits[1] | bit if booked else bits[1] & ~bit
+
+    def on_created(self, slots: List[Dict[str, Any]]) -> None:
+        for slot in slots:
+            self._update(slot["trainerId"], slot["startAt"], 1, open_=True, booked=bool(slot.get("isBooked")))
+
+    def on_deleted(self, trainer_id: str, start_at: datetime) -> None:
+        self._update(trainer_id, start_at, 1, open_=False, booked=False)
+
+    def on_booked(self, trainer_id: str, start_at: datetime, num_slots: int) -> None:
+        self._update(trainer_id, start_at, num_slots, open_=None, booked=True)
+
+    def on_released(self, trainer_id: str, start_at: datetime, num_slots: int) -> None:
+        self._update(trainer_id, start_at, num_slots, open_=None, booked=False)
+
+    def invalidate(self, start_at: datetime, num_slots: int = 1) -> None:
+        """インデックスとストレージの不一致が分かった日を次回再ロードさせる"""
+        with self._lock:
+            for i in range(num_slots):
+                self._loaded_days.pop((to_utc(start_at) + SLOT_DELTA * i).date(), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._trainers.clear()
+            self._loaded_days.clear()
+
+    # ---- 検索 ----
+
+    async def find_windows(
+        self,
+        storage: StorageBackend,
+        course_minutes: int,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        [start_at, end_at) に開始でき、course_minutes 分の連続した空き枠がある開始時刻を返す
+
+        コースは end_at を超えてもよい（開始時刻のみ範囲で絞る）。
+        """
+        length = course_minutes // SLOT_MINUTES
+        course = SLOT_DELTA * length
+        await self.ensure_loaded(storage, start_at, end_at + course)
+
+        first = max(0, -(-(to_utc(start_at) - EPOCH) // SLOT_DELTA))
+        last = max(0, slot_number(end_at - timedelta(microseconds=1)) + 1)
+        window_mask = ((1 << max(0, last - first)) - 1) << first
+
+        with self._lock:
+            if trainer_id:
+                trainers = [(trainer_id, self._trainers.get(trainer_id, [0, 0]))]
+            else:
+                trainers = list(self._trainers.items())
+            snapshot = [(tid, bits[0] & ~bits[1]) for tid, bits in trainers]
+
+        results = []
+        for tid, free in snapshot:
+            starts = run_starts(free, length) & window_mask
+            for number in iter_bits(starts):
+                window_start = slot_start(number)
+                results.append({
+                    "trainerId": tid,
+                    "startAt": window_start,
+                    "endAt": window_start + course,
+                })
+        results.sort(key=lambda window: (window["startAt"], window["trainerId"]))
+        return results
+
+
+availability_index = AvailabilityIndex(ttl=settings.AVAILABILITY_INDEX_TTL_SECONDS)
@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List, Tuple
+
+from app.schemas.availability import AvailabilityTemplate
+from app.storage.base import SLOT_MINUTES
+
+
+def _parse_time(value: str) -> timedelta:
+    hours, minutes = value.split(":")
+    return timedelta(hours=int(hours), minutes=int(minutes))
+
+
+def expand_template(template: AvailabilityTemplate) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    繰り返しテンプレートを 30 分単位の (startAt, endAt) に展開する（UTC の aware datetime）
+
+    startTime / endTime は utcOffsetMinutes のローカル時刻として解釈する。
+    """
+    tz = timezone(timedelta(minutes=template.utcOffsetMinutes))
+    start_time = _parse_time(template.startTime)
+    end_time = _parse_time(template.endTime)
+    slot = timedelta(minutes=SLOT_MINUTES)
+    skip = set(template.skipDates)
+    weekdays = set(template.weekdays)
+
+    day = date.fromisoformat(template.startDate)
+    last = date.fromisoformat(template.endDate)
+    while day <= last:
+        if day.weekday() in weekdays and day.isoformat() not in skip:
+            midnight = datetime(day.year, day.month, day.day, tzinfo=tz)
+            current = midnight + start_time
+            end = midnight + end_time
+            while current + slot <= end:
+                yield current.astimezone(timezone.utc), (current + slot).astimezone(timezone.utc)
+                current += slot
+        day += timedelta(days=1)
+
+
+def chunked(items: Iterator[Tuple[datetime, datetime]], size: int) -> Iterator[List[Tuple[datetime, datetime]]]:
+    """イテレータを size 件ずつのリストに分割する"""
+    chunk: List[Tuple[datetime, datetime]] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,155 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.storage.base import (
+    SLOT_MINUTES,
+    SlotAlreadyBookedError,
+    StorageBackend,
+    TransactionContentionError,
+    to_utc,
+)
+
+SLOT_DELTA = timedelta(minutes=SLOT_MINUTES)
+
+
+class BookingSerializer:
+    """
+    予約トランザクションの前段でトレーナー・日（UTC）単位に予約処理を直列化する
+
+    - 同じ稼働枠を取り合う予約をプロセス内で 1 件ずつ流し、楽観的トランザクションの競合（やり直し）を減らす
+    - 直近に予約された枠を短時間だけ記録し、ストレージに問い合わせずに失敗させる
+    - 他インスタンスとの競合でコミットできなかった場合はバックオフして再試行する
+
+    直列化はプロセス内のみ。予約可否の最終判断は常にストレージのトランザクションで行う。
+    """
+
+    def __init__(self, booked_ttl: float = 5.0, max_retries: int = 3, backoff: float = 0.05):
+        self.booked_ttl = booked_ttl
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # trainerId -> {開始時刻(UTC): 記録の有効期限}
+        self._booked: Dict[str, Dict[datetime, float]] = {}
+        # (trainerId, 日(UTC)) -> [ロック, 待機中の数]
+        self._locks: Dict[Tuple[str, date], List[Any]] = {}
+        self.bookings = 0
+        self.fast_failures = 0
+        self.conflicts = 0
+        self.contentions = 0
+        self.retries = 0
+
+    @staticmethod
+    def _slots(start_at: datetime, num_slots: int) -> List[datetime]:
+        start_at = to_utc(start_at)
+        return [start_at + SLOT_DELTA * i for i in range(num_slots)]
+
+    def _known_booked(self, trainer_id: str, slots: List[datetime]) -> bool:
+        booked = self._booked.get(trainer_id)
+        if not booked:
+            return False
+        now = time.monotonic()
+        for slot, expires_at in list(booked.items()):
+            if expires_at < now:
+                del booked[slot]
+        if not booked:
+            del self._booked[trainer_id]
+            return False
+        return any(slot in booked for slot in slots)
+
+    @asynccontextmanager
+    async def _hold(self, keys: List[Tuple[str, date]]) -> AsyncIterator[None]:
+        """keys のロックを順番に取得する（デッドロックを避けるため常にソート順）"""
+        entries = []
+        for key in keys:
+            entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+            entry[1] += 1
+            entries.append((key, entry))
+        acquired = []
+        try:
+            for _, entry in entries:
+                await entry[0].acquire()
+                acquired.append(entry[0])
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            for key, entry in entries:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    async def book(
+        self,
+        storage: StorageBackend,
+        reservation_data: Dict[str, Any],
+        start_at: datetime,
+        num_slots: int,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """storage.book_reservation を直列化・再試行付きで呼び出す（引数・例外は book_reservation と同じ）"""
+        trainer_id = reservation_data["trainerId"]
+        slots = self._slots(start_at, num_slots)
+        if self._known_booked(trainer_id, slots):
+            self.fast_failures += 1
+            raise SlotAlreadyBookedError()
+
+        keys = sorted({(trainer_id, slot.date()) for slot in slots})
+        async with self._hold(keys):
+            # 待っている間に同じ枠が予約された場合
+            if self._known_booked(trainer_id, slots):
+                self.fast_failures += 1
+                raise SlotAlreadyBookedError()
+
+            attempt = 0
+            while True:
+                try:
+                    reservation = await storage.book_reservation(reservation_data, start_at, num_slots, idempotency)
+                    break
+                except SlotAlreadyBookedError:
+                    self.conflicts += 1
+                    raise
+                except TransactionContentionError:
+                    self.contentions += 1
+                    if attempt >= self.max_retries:
+                        raise
+                    attempt += 1
+                    self.retries += 1
+                    # 他インスタンスと同時に再試行しないよう揺らぎを入れた指数バックオフ
+                    await asyncio.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+            expires_at = time.monotonic() + self.booked_ttl
+            booked = self._booked.setdefault(trainer_id, {})
+            for slot in slots:
+                booked[slot] = expires_at
+            self.bookings += 1
+            return reservation
+
+    def release(self, trainer_id: str, starts: List[datetime]) -> None:
+        """キャンセルで解放された枠を記録から外す"""
+        booked = self._booked.get(trainer_id)
+        if not booked:
+            return
+        for start_at in starts:
+            booked.pop(to_utc(start_at), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bookings": self.bookings,
+            "fastFailures": self.fast_failures,
+            "conflicts": self.conflicts,
+            "contentions": self.contentions,
+            "retries": self.retries,
+            "activeKeys": len(self._locks),
+            "knownBookedSlots": sum(len(booked) for booked in self._booked.values()),
+        }
+
+
+booking_serializer = BookingSerializer(
+    booked_ttl=settings.BOOKING_BOOKED_SLOT_TTL_SECONDS,
+    max_retries=settings.BOOKING_MAX_RETRIES,
+    backoff=settings.BOOKING_RETRY_BACKOFF_SECONDS,
+)
@@ -0,0 +1,99 @@
+import csv
+import io
+import json
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.core.config import settings
+from app.storage.base import StorageBackend, cursor_values, reservation_order
+
+RESERVATION_COLUMNS = [
+    "id", "trainerId", "userId", "user_name", "date", "startTime", "endTime",
+    "courseMinutes", "status", "createdAt", "updatedAt",
+]
+AVAILABILITY_COLUMNS = ["id", "trainerId", "startAt", "endAt", "isBooked"]
+
+
+async def iter_reservations(
+    storage: StorageBackend,
+    trainer_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """予約を EXPORT_PAGE_SIZE 件ずつストレージから読み、1 件ずつ返す（メモリ上は常に 1 ページ分のみ）"""
+    order = reservation_order(bool(date_from or date_to))
+    fields = [column for column in RESERVATION_COLUMNS if column != "id"]
+    after = None
+    while True:
+        page = await storage.list_reservations(
+            trainer_id=trainer_id,
+            user_id=user_id,
+            date_from=date_from,
+            date_to=date_to,
+            limit=settings.EXPORT_PAGE_SIZE,
+            after=after,
+            fields=fields,
+        )
+        for data in page:
+            yield data
+        if len(page) < settings.EXPORT_PAGE_SIZE:
+            return
+        after = cursor_values(page[-1], order)
+
+
+async def iter_availabilities(
+    storage: StorageBackend,
+    first: date,
+    last: date,
+    trainer_id: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """first から last（含む、UTC）の稼働枠を 1 日分ずつストレージから読み、1 件ずつ返す"""
+    day = first
+    while day <= last:
+        start_at = datetime.combine(day, time(0, 0), tzinfo=timezone.utc)
+        slots = await storage.list_availabilities(
+            start_at,
+            start_at + timedelta(days=1),
+            trainer_id=trainer_id,
+            fields=[column for column in AVAILABILITY_COLUMNS if column != "id"],
+        )
+        for data in slots:
+            yield data
+        day += timedelta(days=1)
+
+
+def _value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def ndjson_lines(rows: AsyncIterator[Dict[str, Any]], columns: List[str]) -> AsyncIterator[str]:
+    """1 行 1 JSON（NDJSON）に変換する"""
+    async for row in rows:
+        yield json.dumps({column: _value(row.get(column)) for column in columns}, ensure_ascii=False) + "\n"
+
+
+async def csv_lines(rows: AsyncIterator[Dict[str, Any]], columns: List[str]) -> AsyncIterator[str]:
+    """ヘッダー付きの CSV に変換する"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> str:
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(columns)
+    yield flush()
+    async for row in rows:
+        writer.writerow([_value(row.get(column, "")) for column in columns])
+        yield flush()
+
+
+EXPORT_FORMATS = {
+    "ndjson": (ndjson_lines, "application/x-ndjson"),
+    "csv": (csv_lines, "text/csv; charset=utf-8"),
+}
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.storage.base import StorageBackend, idempotent_result, to_utc
+
+# 冪等キーの最大長（Header のバリデーションに使う）
+MAX_KEY_LENGTH = 255
+# 再送に対する応答に付けるヘッダー
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeys:
+    """
+    予約・キャンセルの Idempotency-Key の記録の参照と、期限切れの記録の削除
+
+    記録はストレージのトランザクション内で結果と同時に書き込む（book_reservation / cancel_reservation）。
+    再送はプロセス内のキャッシュ、なければストレージの記録から返し、稼働枠は読まない。
+    キーはユーザー・操作ごとに区別する（他のユーザーの記録は参照できない）。
+    """
+
+    def __init__(self, ttl: int, cache_size: int, sweep_interval: float, sweep_batch: int):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._task: Optional[asyncio.Task] = None
+        self.replays = 0
+        self.swept = 0
+
+    @staticmethod
+    def key_id(user_id: str, operation: str, key: str) -> str:
+        """記録の ID（ユーザー・操作・キーのハッシュ。キーをそのまま保存しない）"""
+        return hashlib.sha256(f"{user_id}\n{operation}\n{key}".encode()).hexdigest()
+
+    @staticmethod
+    def fingerprint(payload: Dict[str, Any]) -> str:
+        """リクエストの内容のハッシュ（同じキーで内容の異なるリクエストを検出する）"""
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def new_record(self, user_id: str, operation: str, key: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """ストレージに渡す記録（結果はストレージが `result` として追加する）"""
+        now = datetime.now(timezone.utc)
+        return {
+            "id": self.key_id(user_id, operation, key),
+            "operation": operation,
+            "userId": user_id,
+            "fingerprint": self.fingerprint(payload),
+            "createdAt": now.isoformat(),
+            "expiresAt": now + timedelta(seconds=self.ttl),
+        }
+
+    async def replay(self, storage: StorageBackend, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        同じキーの前回の結果（記録がない場合は None）
+
+        Raises:
+            IdempotencyKeyMismatchError: 同じキーで内容の異なるリクエスト
+        """
+        existing = self._cache.get(record["id"])
+        if existing is None:
+            existing = await storage.get_idempotency_record(record["id"])
+            if existing is not None:
+                self._remember(existing)
+        result = idempotent_result(existing, record)
+        if result is not None:
+            self.replays += 1
+        return result
+
+    def remember(self, record: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """処理した結果をキャッシュする（同じプロセスへの再送をストレージに問い合わせずに返す）"""
+        self._remember({**record, "result": result})
+
+    def _remember(self, record: Dict[str, Any]) -> None:
+        remaining = (to_utc(record["expiresAt"]) - datetime.now(timezone.utc)).total_seconds()
+        if remaining > 0:
+            self._cache.set(record["id"], record, ttl=min(remaining, self.ttl))
+
+    # ---- 期限切れの記録の削除 ----
+
+    async def sweep(self, storage: StorageBackend) -> int:
+        """期限切れの記録を削除する（1 回に sweep_batch 件ずつ、残りがなくなるまで）"""
+        total = 0
+        while True:
+            deleted = await storage.delete_expired_idempotency_records(datetime.now(timezone.utc), self.sweep_batch)
+            total += deleted
+            if deleted < self.sweep_batch:
+                break
+        self.swept += total
+        return total
+
+    async def _run(self, get_storage: Callable[[], StorageBackend], ready: Callable[[], bool]) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            # ストレージのウォームアップが終わるまでは行わない
+            if not ready():
+                continue
+            try:
+                await self.sweep(get_storage())
+            except Exception as e:
+                print(f"⚠️  Idempotency key sweep failed: {e}")
+
+    def start(self, get_storage: Callable[[], StorageBackend], ready: Callable[[], bool]) -> None:
+        """期限切れの記録の定期削除を開始する（イベントループ上で呼ぶ）"""
+        if self._task is not None or self.sweep_interval <= 0:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run(get_storage, ready))
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"replays": self.replays, "swept": self.swept, "cache": self._cache.stats()}
+
+
+idempotency_keys = IdempotencyKeys(
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+    cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    sweep_interval=settings.IDEMPOTENCY_SWEEP_INTERVAL_SECONDS,
+    sweep_batch=settings.IDEMPOTENCY_SWEEP_BATCH_SIZE,
+)
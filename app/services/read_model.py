@@ -0,0 +1,341 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.storage.base import project, to_utc
+
+logger = logging.getLogger(__name__)
+
+
+def _sizeof(value: Any) -> int:
+    """保持しているデータのおおよそのバイト数（dict / list は中身も含める）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_sizeof(key) + _sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+
+class _View:
+    """
+    1 つのクエリの結果（ドキュメントID -> 行のリスト）と、そのリスナーの状態
+
+    行のリストは通常 1 件（日単位ビットマスク形式では 1 ドキュメントが複数の枠になる）。
+    """
+
+    def __init__(self, name: str, to_rows: Callable[[str, Dict[str, Any]], List[Dict[str, Any]]]):
+        self.name = name
+        self.to_rows = to_rows
+        self.rows: Dict[str, List[Dict[str, Any]]] = {}
+        self.sizes: Dict[str, int] = {}
+        self.bytes = 0
+        self.watch = None
+        # 最初のスナップショットを受け取るまでは使わない
+        self.ready = False
+        # 最後にスナップショットを受け取った、またはリスナーが有効なことを確認した時刻
+        self.verified_at = 0.0
+        self.snapshot_at = 0.0
+        # このプロセスで更新があった時刻（その後のスナップショットを受け取るまで使わない）
+        self.dirty_at = 0.0
+
+    def reset(self) -> None:
+        self.rows.clear()
+        self.sizes.clear()
+        self.bytes = 0
+        self.ready = False
+
+    def apply(self, changes: Iterable[Any]) -> List[Tuple[Dict[str, Any], bool]]:
+        """
+        スナップショットの変更を反映し、追加・変更・削除された行を (行, 削除か) で返す
+
+        最初のスナップショット（全件の追加）では何も返さない。
+        """
+        changed = []
+        for change in changes:
+            doc_id = change.document.id
+            self.bytes -= self.sizes.pop(doc_id, 0)
+            old = {row["id"]: row for row in self.rows.pop(doc_id, [])}
+            rows = []
+            if change.type.name != "REMOVED":
+                rows = self.to_rows(doc_id, change.document.to_dict())
+                self.rows[doc_id] = rows
+                self.sizes[doc_id] = _sizeof(rows)
+                self.bytes += self.sizes[doc_id]
+            if not self.ready:
+                continue
+            for row in rows:
+                previous = old.pop(row["id"], None)
+                if previous is None or previous.get("isBooked") != row.get("isBooked"):
+                    changed.append((row, False))
+            changed.extend((row, True) for row in old.values())
+        now = time.monotonic()
+        self.snapshot_at = now
+        self.verified_at = now
+        self.ready = True
+        return changed
+
+    def usable(self, max_staleness: float, write_grace: float) -> bool:
+        now = time.monotonic()
+        if not self.ready or now - self.verified_at > max_staleness:
+            return False
+        # 自インスタンスの更新がスナップショットで届くまで待つ（届かない更新は write_grace 秒で諦める）
+        if self.dirty_at > self.snapshot_at and now - self.dirty_at < write_grace:
+            return False
+        return True
+
+
+class ReadModel:
+    """
+    Firestore のスナップショットリスナー（on_snapshot）で保持するプロセス内の読み取りモデル
+
+    - トレーナー一覧（users where role == trainer）
+    - 直近 days 日分（UTC、前日から）の稼働枠
+
+    リスナーが未接続・停止中、最後の確認から max_staleness 秒以上経過、保持サイズが max_bytes 超過、
+    またはこのプロセスでの更新がまだスナップショットで届いていない場合は None を返し、
+    呼び出し側はストレージを直接クエリする。
+
+    on_snapshot は同期クライアントでのみ使えるため、リスナー用に firestore.Client を別に作る
+    （スナップショットはライブラリのスレッドで届く）。
+    """
+
+    def __init__(
+        self,
+        days: int,
+        max_staleness: float,
+        check_interval: float,
+        max_bytes: int,
+        write_grace: float,
+    ):
+        self.days = days
+        self.max_staleness = max_staleness
+        self.check_interval = check_interval
+        self.max_bytes = max_bytes
+        self.write_grace = write_grace
+        self._lock = threading.Lock()
+        self._client = None
+        self._bitmap = False
+        self._window_start: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.trainers = _View("trainers", self._user_rows)
+        self.slots = _View("slots", self._slot_rows)
+        self.hits = 0
+        self.fallbacks = 0
+        self.restarts = 0
+        self._slot_listeners: List[Callable[[List[Tuple[Dict[str, Any], bool]]], None]] = []
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    # ---- 行への変換 ----
+
+    @staticmethod
+    def _user_rows(doc_id: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        data.pop("password", None)
+        return [{**data, "id": doc_id}]
+
+    def _slot_rows(self, doc_id: str, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if self._bitmap:
+            from app.storage.firestore_bitmap import expand_day
+            return expand_day(data)
+        return [{**data, "id": doc_id, "startAt": to_utc(data["startAt"]), "endAt": to_utc(data["endAt"])}]
+
+    # ---- リスナー ----
+
+    def _window(self) -> datetime:
+        today = datetime.now(timezone.utc).date()
+        return datetime.combine(today - timedelta(days=1), dt_time(0, 0), tzinfo=timezone.utc)
+
+    def add_slot_listener(self, listener: Callable[[List[Tuple[Dict[str, Any], bool]]], None]) -> None:
+        """稼働枠の変更（(枠, 削除か) のリスト）を受け取る関数を登録する（リスナーのスレッドで呼ばれる）"""
+        self._slot_listeners.append(listener)
+
+    def _callback(self, view: _View):
+        def on_snapshot(docs, changes, read_time):
+            with self._lock:
+                changed = view.apply(changes)
+            if changed and view is self.slots:
+                for listener in self._slot_listeners:
+                    listener(changed)
+        return on_snapshot
+
+    def _subscribe_trainers(self) -> None:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        query = self._client.collection("users").where(filter=FieldFilter("role", "==", "trainer"))
+        with self._lock:
+            self.trainers.reset()
+        self.trainers.watch = query.on_snapshot(self._callback(self.trainers))
+
+    def _subscribe_slots(self) -> None:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        start = self._window()
+        end = start + timedelta(days=self.days + 1)
+        if self._bitmap:
+            from app.storage.firestore_bitmap import DAYS_COLLECTION
+            query = self._client.collection(DAYS_COLLECTION)\
+                .where(filter=FieldFilter("dayStart", ">=", start))\
+                .where(filter=FieldFilter("dayStart", "<", end))
+        else:
+            query = self._client.collection("availabilities")\
+                .where(filter=FieldFilter("startAt", ">=", start))\
+                .where(filter=FieldFilter("startAt", "<", end))
+        with self._lock:
+            self.slots.reset()
+            self._window_start = start
+        self.slots.watch = query.on_snapshot(self._callback(self.slots))
+
+    def _close(self, view: _View) -> None:
+        if view.watch is not None:
+            view.watch.close()
+            view.watch = None
+
+    def _check(self) -> None:
+        """リスナーの状態を確認し、停止していれば張り直す。日付が変わったら稼働枠の範囲をずらす"""
+        now = time.monotonic()
+        for view, subscribe in ((self.trainers, self._subscribe_trainers), (self.slots, self._subscribe_slots)):
+            if view.watch is not None and view.watch.is_active:
+                if view.ready:
+                    view.verified_at = now
+                continue
+            logger.warning("read model listener %s is not active; resubscribing", view.name)
+            self.restarts += 1
+            self._close(view)
+            subscribe()
+        if self._window() != self._window_start:
+            self._close(self.slots)
+            self._subscribe_slots()
+
+    def _connect(self) -> None:
+        """クライアントを作成してリスナーを張る（認証情報の探索・接続を伴うためスレッドで呼ぶ）"""
+        from google.cloud import firestore
+        self._client = firestore.Client()
+        self._subscribe_trainers()
+        self._subscribe_slots()
+
+    async def _run(self) -> None:
+        # 接続できるまで一定間隔で再試行する（それまでは started が False のためストレージから読む）
+        while not self.started:
+            try:
+                await asyncio.to_thread(self._connect)
+            except Exception:
+                logger.exception("read model connect failed")
+                self._close(self.trainers)
+                self._close(self.slots)
+                self._client = None
+                await asyncio.sleep(self.check_interval)
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self._check)
+            except Exception:
+                logger.exception("read model check failed")
+
+    def start(self, bitmap: bool = False) -> None:
+        """リスナーを開始する（イベントループ上で呼ぶ。接続はバックグラウンドで行い、起動を待たせない）"""
+        if self._task is not None:
+            return
+        self._bitmap = bitmap
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._close(self.trainers)
+        self._close(self.slots)
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def mark_dirty(self, scopes: Iterable[str]) -> None:
+        """このプロセスでの更新（スナップショットが届くまで読み取りモデルを使わない）"""
+        now = time.monotonic()
+        if "users" in scopes:
+            self.trainers.dirty_at = now
+        if "availabilities" in scopes:
+            self.slots.dirty_at = now
+
+    # ---- 読み取り ----
+
+    def _usable(self, view: _View) -> bool:
+        if not self.started:
+            return False
+        if view.usable(self.max_staleness, self.write_grace) and self.trainers.bytes + self.slots.bytes <= self.max_bytes:
+            self.hits += 1
+            return True
+        self.fallbacks += 1
+        return False
+
+    def list_trainers(
+        self, limit: Optional[int] = None, after: Optional[str] = None, fields: Optional[List[str]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """トレーナー一覧を id 昇順で返す（使えない場合は None）"""
+        if not self._usable(self.trainers):
+            return None
+        with self._lock:
+            users = sorted(
+                (rows[0] for doc_id, rows in self.trainers.rows.items() if not after or doc_id > after),
+                key=lambda user: user["id"],
+            )
+        return [project(dict(user), fields) for user in users[:limit]]
+
+    def list_availabilities(
+        self,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """start_at <= startAt < end_at の稼働枠を startAt 昇順で返す（範囲外・使えない場合は None）"""
+        start_at, end_at = to_utc(start_at), to_utc(end_at)
+        window_start = self._window_start
+        if window_start is None or start_at < window_start or end_at > window_start + timedelta(days=self.days + 1):
+            return None
+        if not self._usable(self.slots):
+            return None
+        with self._lock:
+            slots = [
+                slot
+                for rows in self.slots.rows.values()
+                for slot in rows
+                if start_at <= slot["startAt"] < end_at
+                and (not trainer_id or slot["trainerId"] == trainer_id)
+            ]
+        slots.sort(key=lambda slot: slot["startAt"])
+        return [project(dict(slot), fields) for slot in slots]
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "restarts": self.restarts,
+            "bytes": self.trainers.bytes + self.slots.bytes,
+            "maxBytes": self.max_bytes,
+            "views": {
+                view.name: {
+                    "ready": view.ready,
+                    "documents": len(view.rows),
+                    "bytes": view.bytes,
+                    "ageSeconds": round(now - view.verified_at, 1) if view.ready else None,
+                }
+                for view in (self.trainers, self.slots)
+            },
+        }
+
+
+read_model = ReadModel(
+    days=settings.READ_MODEL_DAYS,
+    max_staleness=settings.READ_MODEL_MAX_STALENESS_SECONDS,
+    check_interval=settings.READ_MODEL_CHECK_INTERVAL_SECONDS,
+    max_bytes=settings.READ_MODEL_MAX_BYTES,
+    write_grace=settings.READ_MODEL_WRITE_GRACE_SECONDS,
+)
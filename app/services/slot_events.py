@@ -0,0 +1,175 @@
+import asyncio
+import json
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.storage.base import SLOT_MINUTES, slot_id, to_utc
+
+SLOT_DELTA = timedelta(minutes=SLOT_MINUTES)
+
+
+class Subscriber:
+    """1 つの SSE 接続。送信待ちのイベント（整形済みの文字列）を上限付きのキューに持つ"""
+
+    def __init__(self, key: Tuple[Optional[str], date], queue_size: int):
+        self.key = key
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class SlotEventHub:
+    """
+    稼働枠の変更（isBooked の変化・登録・削除）を (トレーナー, 日(UTC)) ごとの購読者に配信する
+
+    - 変更はこのプロセスでの更新（エンドポイント）と、読み取りモデルのスナップショットリスナー
+      （他インスタンスでの更新）の両方から届く。同じ内容の変更は 1 回だけ配信する
+    - イベントは 1 回だけ整形し、購読者のキューには同じ文字列を入れる
+    - キューが一杯の購読者（読み出しが遅い接続）は切り離し、reset イベントで再取得を促す
+    """
+
+    def __init__(self, queue_size: int, max_subscribers: int, dedupe_size: int):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers: Dict[Tuple[Optional[str], date], Set[Subscriber]] = {}
+        self._count = 0
+        # 枠ごとに最後に配信した状態（同じ変更の重複配信を防ぐ）
+        self._last = TTLCache(maxsize=dedupe_size, ttl=300)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    # ---- 購読 ----
+
+    def subscribe(self, trainer_id: Optional[str], day: date) -> Optional[Subscriber]:
+        """購読を開始する（購読者数が上限に達している場合は None）"""
+        if self._count >= self.max_subscribers:
+            return None
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber((trainer_id, day), self.queue_size)
+        self._subscribers.setdefault(subscriber.key, set()).add(subscriber)
+        self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.key)
+        if subscribers is None or subscriber not in subscribers:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.key]
+        self._count -= 1
+
+    def _drop(self, subscriber: Subscriber) -> None:
+        """読み出しが遅い購読者を切り離す（溜まったイベントを捨て、終了の印を入れる）"""
+        self.unsubscribe(subscriber)
+        subscriber.dropped = True
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+        self.dropped += 1
+
+    # ---- 配信 ----
+
+    def _changed(self, slot: Dict[str, Any], removed: bool) -> bool:
+        state = None if removed else bool(slot.get("isBooked"))
+        with self._lock:
+            if self._last.get(slot["id"]) == (state,):
+                return False
+            self._last.set(slot["id"], (state,))
+        return True
+
+    def publish(self, slots: Iterable[Dict[str, Any]], removed: bool = False) -> None:
+        """変更された枠を配信する（イベントループ上で呼ぶ）"""
+        for slot in slots:
+            start_at = to_utc(slot["startAt"])
+            day = start_at.date()
+            targets = [
+                subscriber
+                for key in ((slot["trainerId"], day), (None, day))
+                for subscriber in self._subscribers.get(key, ())
+            ]
+            # 購読者がいない枠は状態も記録しない
+            if not targets or not self._changed(slot, removed):
+                continue
+            message = self._format(slot, start_at, removed)
+            self.published += 1
+            for subscriber in targets:
+                try:
+                    subscriber.queue.put_nowait(message)
+                    self.delivered += 1
+                except asyncio.QueueFull:
+                    self._drop(subscriber)
+
+    def publish_threadsafe(self, changes: List[Tuple[Dict[str, Any], bool]]) -> None:
+        """他のスレッド（スナップショットリスナー）から配信する"""
+        loop = self._loop
+        if loop is None or not self._count or loop.is_closed():
+            return
+
+        def run() -> None:
+            for slot, removed in changes:
+                self.publish([slot], removed=removed)
+
+        loop.call_soon_threadsafe(run)
+
+    @staticmethod
+    def _format(slot: Dict[str, Any], start_at: datetime, removed: bool) -> str:
+        end_at = slot.get("endAt")
+        data = {
+            "id": slot["id"],
+            "trainerId": slot["trainerId"],
+            "startAt": start_at.isoformat(),
+            "endAt": to_utc(end_at).isoformat() if end_at else None,
+            "isBooked": bool(slot.get("isBooked")),
+            "removed": removed,
+        }
+        return f"event: slot\ndata: {json.dumps(data)}\n\n"
+
+    # ---- エンドポイントからの通知（AvailabilityIndex と同じ形） ----
+
+    @staticmethod
+    def _course(trainer_id: str, start_at: datetime, num_slots: int, booked: bool) -> List[Dict[str, Any]]:
+        slots = []
+        for i in range(num_slots):
+            slot_start = to_utc(start_at) + SLOT_DELTA * i
+            slots.append({
+                "id": slot_id(trainer_id, slot_start),
+                "trainerId": trainer_id,
+                "startAt": slot_start,
+                "endAt": slot_start + SLOT_DELTA,
+                "isBooked": booked,
+            })
+        return slots
+
+    def on_created(self, slots: List[Dict[str, Any]]) -> None:
+        self.publish(slots)
+
+    def on_deleted(self, trainer_id: str, start_at: datetime) -> None:
+        self.publish(self._course(trainer_id, start_at, 1, False), removed=True)
+
+    def on_booked(self, trainer_id: str, start_at: datetime, num_slots: int) -> None:
+        self.publish(self._course(trainer_id, start_at, num_slots, True))
+
+    def on_released(self, trainer_id: str, start_at: datetime, num_slots: int) -> None:
+        self.publish(self._course(trainer_id, start_at, num_slots, False))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": self._count,
+            "keys": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+slot_events = SlotEventHub(
+    queue_size=settings.SLOT_EVENTS_QUEUE_SIZE,
+    max_subscribers=settings.SLOT_EVENTS_MAX_SUBSCRIBERS,
+    dedupe_size=settings.SLOT_EVENTS_DEDUPE_SIZE,
+)
@@ -0,0 +1,80 @@
+import threading
+from typing import Optional
+
+from app.core.config import settings
+from app.storage.base import (
+    EmailAlreadyExistsError,
+    IdempotencyKeyMismatchError,
+    SlotAlreadyBookedError,
+    SlotUnavailableError,
+    StorageBackend,
+    TransactionContentionError,
+)
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def create_storage(backend: str) -> StorageBackend:
+    """
+    バックエンド名からストレージを生成する
+
+    - firestore: Firestore（本番）
+    - firestore_bitmap: Firestore（稼働枠をトレーナー・日単位のビットマスクで保持）
+    - memory: プロセス内メモリ（ローカル開発・負荷試験用）
+    - sqlite: SQLite WAL（単一ノード構成用、SQLITE_PATH で保存先を指定）
+    """
+    # 使わないバックエンドの依存（Firestore クライアントなど）を読み込まないよう遅延インポートする
+    if backend == "firestore":
+        from app.core.database import get_db
+        from app.storage.firestore import FirestoreStorage
+        return FirestoreStorage(get_db(), email_index_fallback=settings.USER_EMAIL_INDEX_FALLBACK)
+    if backend == "firestore_bitmap":
+        from app.core.database import get_db
+        from app.storage.firestore_bitmap import FirestoreBitmapStorage
+        return FirestoreBitmapStorage(get_db(), email_index_fallback=settings.USER_EMAIL_INDEX_FALLBACK)
+    if backend == "memory":
+        from app.storage.memory import MemoryStorage
+        return MemoryStorage()
+    if backend == "sqlite":
+        from app.storage.sqlite import SQLiteStorage
+        return SQLiteStorage(settings.SQLITE_PATH)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage() -> StorageBackend:
+    """ストレージの依存関係（STORAGE_BACKEND で選択、プロセス内で共有）"""
+    global _storage
+    if _storage is None:
+        # 起動時のウォームアップ（別スレッド）とリクエストが同時に作成しないようにする
+        with _storage_lock:
+            if _storage is None:
+                storage = create_storage(settings.STORAGE_BACKEND)
+                if settings.METRICS_ENABLED:
+                    from app.core.metrics import instrument_storage
+                    instrument_storage(storage)
+                if settings.PROFILING_ENABLED:
+                    from app.core.profiling import trace_storage
+                    trace_storage(storage)
+                _storage = storage
+    return _storage
+
+
+def close_storage() -> None:
+    global _storage
+    if _storage is not None:
+        _storage.close()
+        _storage = None
+
+
+__all__ = [
+    "EmailAlreadyExistsError",
+    "IdempotencyKeyMismatchError",
+    "SlotAlreadyBookedError",
+    "SlotUnavailableError",
+    "StorageBackend",
+    "TransactionContentionError",
+    "close_storage",
+    "create_storage",
+    "get_storage",
+]
@@ -0,0 +1,309 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 稼働枠の単位（分）
+SLOT_MINUTES = 30
+
+
+class SlotUnavailableError(Exception):
+    """指定された時間枠の空き（稼働枠）が足りない"""
+
+
+class SlotAlreadyBookedError(Exception):
+    """既に予約されている時間枠が含まれている"""
+
+
+class TransactionContentionError(Exception):
+    """他の更新との競合により、トランザクションを規定回数内にコミットできなかった"""
+
+
+class EmailAlreadyExistsError(Exception):
+    """メールアドレスが他のユーザーで既に使われている"""
+
+
+class IdempotencyKeyMismatchError(Exception):
+    """冪等キーが内容の異なる別のリクエストで既に使われている"""
+
+
+def to_utc(dt: datetime) -> datetime:
+    """naive な datetime は UTC とみなし、aware な datetime は UTC に変換する（Firestore と同じ扱い）"""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def is_slot_aligned(dt: datetime) -> bool:
+    """UTC で SLOT_MINUTES 分の境界（秒以下なし）にあるか"""
+    dt = to_utc(dt)
+    return (dt.hour * 60 + dt.minute) % SLOT_MINUTES == 0 and not dt.second and not dt.microsecond
+
+
+def slot_id(trainer_id: str, start_at: datetime) -> str:
+    """
+    稼働枠のドキュメントID（`{trainerId}_{開始時刻(UTC)}`）
+
+    ID から枠を特定できるため、予約時は範囲クエリではなく ID 指定の読み取りで済み、
+    枠の登録も事前読み取りなしの冪等な create になる。
+    """
+    return f"{trainer_id}_{to_utc(start_at).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def normalize_email(email: Optional[str]) -> str:
+    """一意性の判定に使うメールアドレス（前後の空白を除き小文字にする）"""
+    return (email or "").strip().lower()
+
+
+def idempotent_result(existing: Optional[Dict[str, Any]], record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    冪等キーの既存の記録から、前回の結果を取り出す
+
+    記録がない・期限切れの場合は None。同じキーで内容の異なるリクエスト（fingerprint が異なる）の場合は
+    IdempotencyKeyMismatchError を送出する。
+    """
+    if existing is None or to_utc(existing["expiresAt"]) <= datetime.now(timezone.utc):
+        return None
+    if existing.get("fingerprint") != record["fingerprint"]:
+        raise IdempotencyKeyMismatchError()
+    return existing["result"]
+
+
+def cancelled_result(reservation: Dict[str, Any], updated_at: str) -> Dict[str, Any]:
+    """キャンセル後の予約（冪等キーの記録用。再送時に「キャンセル済み」として扱われる）"""
+    return {**reservation, "status": "cancelled", "updatedAt": updated_at}
+
+
+def project(doc: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """doc を `id` と fields のみに絞る（fields が None なら全フィールド）"""
+    if fields is None:
+        return doc
+    return {key: doc[key] for key in ("id", *fields) if key in doc}
+
+
+def parse_slot_id(doc_id: str) -> Tuple[str, datetime]:
+    """slot_id を (trainerId, 開始時刻(UTC)) に分解する"""
+    trainer_id, _, stamp = doc_id.rpartition("_")
+    if not trainer_id:
+        raise ValueError(f"Invalid slot id: {doc_id}")
+    start_at = datetime.strptime(stamp, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    return trainer_id, start_at
+
+
+def course_slot_ids(trainer_id: str, start_at: datetime, num_slots: int) -> List[str]:
+    """start_at から連続する num_slots 個の稼働枠ID"""
+    return [
+        slot_id(trainer_id, start_at + timedelta(minutes=SLOT_MINUTES * i))
+        for i in range(num_slots)
+    ]
+
+
+def reservation_order(by_date: bool) -> Tuple[str, ...]:
+    """
+    予約一覧の並び順（すべて降順）
+
+    date で範囲指定する場合は date を先頭にする（Firestore では範囲条件のフィールドを最初に並べる必要がある）。
+    末尾の id で同じ値の予約の順序を確定させ、カーソル（cursor_values）で次ページの開始位置を一意に表せるようにする。
+    """
+    return ("date", "createdAt", "id") if by_date else ("createdAt", "id")
+
+
+def cursor_values(doc: Dict[str, Any], keys: Tuple[str, ...]) -> List[Any]:
+    """ページの最後のドキュメントから次ページの開始位置（並び順のキーの値）を取り出す"""
+    return [doc.get(key, "") for key in keys]
+
+
+def reservation_slot_ids(reservation: Dict[str, Any]) -> List[str]:
+    """
+    予約が確保している稼働枠ID
+
+    予約時に記録した slotIds を使う。slotIds を持たない旧データは date + startTime を UTC とみなして求める
+    （app.tools.backfill_reservation_slots で補完できる）。
+    """
+    if reservation.get("slotIds"):
+        return list(reservation["slotIds"])
+    start_at = datetime.fromisoformat(f"{reservation['date']}T{reservation['startTime']}:00")
+    return course_slot_ids(reservation["trainerId"], start_at, reservation["courseMinutes"] // SLOT_MINUTES)
+
+
+class StorageBackend(ABC):
+    """
+    データストアの抽象インターフェース
+
+    エンドポイントは Firestore などの具体的な実装ではなく、このインターフェースに
+    `Depends(get_storage)` 経由で依存する。
+    返り値のドキュメントはすべて `id` を含む dict。稼働枠の `startAt` / `endAt` は UTC の aware datetime。
+    """
+
+    name: str = "base"
+    # トランザクションの試行回数と、競合によりコミットをやり直した試行回数（楽観的トランザクションの実装のみ加算）
+    transaction_attempts: int = 0
+    transaction_aborts: int = 0
+
+    # ---- users ----
+
+    @abstractmethod
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """ユーザーを取得（存在しない場合は None）"""
+
+    @abstractmethod
+    async def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """
+        メールアドレスでユーザーを検索（存在しない場合は None）
+
+        メールアドレスの索引（normalize_email の値 -> ユーザーID）を引くため、大文字・小文字は区別しない。
+        """
+
+    @abstractmethod
+    async def list_users(
+        self,
+        role: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        ユーザー一覧を id 昇順で取得（ロールでフィルタリング可能）
+
+        after を指定した場合はその id より後のユーザーから limit 件返す。
+        fields を指定した場合は `id` とそのフィールドのみ返す（パスワードハッシュを転送しないための射影）。
+        """
+
+    @abstractmethod
+    async def create_user(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        ユーザーを作成（IDは自動採番）
+
+        メールアドレスの索引もユーザーと同時に（原子的に）作成する。
+
+        Raises:
+            EmailAlreadyExistsError: メールアドレスが既に使われている
+        """
+
+    @abstractmethod
+    async def update_user(self, user_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        ユーザーを部分更新して更新後のドキュメントを返す（存在しない場合は None）
+
+        data に email が含まれる場合は、メールアドレスの索引も同じトランザクションで付け替える。
+
+        Raises:
+            EmailAlreadyExistsError: 変更後のメールアドレスが他のユーザーで使われている
+        """
+
+    # ---- availabilities ----
+
+    @abstractmethod
+    async def list_availabilities(
+        self,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        start_at <= startAt < end_at の稼働枠を startAt 昇順で取得
+
+        fields を指定した場合は `id` とそのフィールドのみ返す（転送量削減のための射影）。
+        """
+
+    @abstractmethod
+    async def create_availabilities(
+        self, trainer_id: str, slots: List[Tuple[datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        """稼働枠を一括登録（ID は slot_id、同じ開始時刻の枠が既にあればスキップ）し、作成した枠を返す"""
+
+    @abstractmethod
+    async def get_availability(self, availability_id: str) -> Optional[Dict[str, Any]]:
+        """稼働枠を取得（存在しない場合は None）"""
+
+    @abstractmethod
+    async def delete_availability(self, availability_id: str) -> None:
+        """稼働枠を削除（予約済みの場合は SlotAlreadyBookedError。確認と削除は不可分に行う）"""
+
+    # ---- reservations ----
+
+    @abstractmethod
+    async def get_reservation(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        """予約を取得（存在しない場合は None）"""
+
+    @abstractmethod
+    async def list_reservations(
+        self,
+        trainer_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        予約一覧を reservation_order の順（createdAt 降順）で取得
+
+        status・date（date_from <= date <= date_to、YYYY-MM-DD）で絞り込み、
+        after（前ページ最後の予約の cursor_values）より後の予約から limit 件返す。
+        fields を指定した場合は `id` とそのフィールドのみ返す（並び順のキーは fields に含めること）。
+        """
+
+    # ---- idempotency keys ----
+
+    @abstractmethod
+    async def get_idempotency_record(self, key_id: str) -> Optional[Dict[str, Any]]:
+        """冪等キーの記録（`fingerprint`・`result`・`expiresAt` など）を取得（存在しない場合は None）"""
+
+    @abstractmethod
+    async def delete_expired_idempotency_records(self, now: datetime, limit: int) -> int:
+        """expiresAt が now 以前の冪等キーの記録を最大 limit 件削除し、削除した件数を返す"""
+
+    # ---- transactions ----
+
+    @abstractmethod
+    async def book_reservation(
+        self,
+        reservation_data: Dict[str, Any],
+        start_at: datetime,
+        num_slots: int,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        予約の作成と稼働枠の確保を 1 トランザクションで行う
+
+        start_at から連続する num_slots 個の稼働枠（course_slot_ids）をすべて確保し、
+        その ID を予約の `slotIds` に記録する（返り値にも含む）。
+        idempotency（冪等キーの記録、`id` は key_id）を指定した場合は、同じトランザクションで
+        返り値を `result` として記録する。既に有効な記録がある場合は稼働枠を変更せず、記録した結果を返す。
+
+        Raises:
+            SlotUnavailableError: 連続する稼働枠のいずれかが存在しない
+            SlotAlreadyBookedError: 予約済みの枠が含まれている
+            TransactionContentionError: 競合によりコミットできなかった（再試行可能）
+            IdempotencyKeyMismatchError: 冪等キーが内容の異なるリクエストで使われている
+        """
+
+    @abstractmethod
+    async def cancel_reservation(
+        self,
+        reservation_id: str,
+        updated_at: str,
+        validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        予約のキャンセルと稼働枠の解放を 1 トランザクションで行う
+
+        トランザクション内で予約を読み取り、validate(予約) を呼んだ後（例外を送出すると中断）、
+        予約の slotIds（reservation_slot_ids）の枠だけを ID 指定で解放する。
+        既にキャンセル済みの予約は変更しない。
+        idempotency は book_reservation と同じ（キャンセルした場合のみ、キャンセル後の予約を記録する）。
+
+        Returns:
+            キャンセル前の予約（`slotIds` は解放対象の枠ID）。存在しない場合は None。
+            同じ冪等キーの再送の場合は記録したキャンセル後の予約（`status` は "cancelled"）
+        """
+
+    async def warm_up(self) -> None:
+        """接続の確立など、最初のリクエストの前に済ませておく処理（起動時のウォームアップで呼ばれる）"""
+
+    def close(self) -> None:
+        """接続などのリソースを解放"""
@@ -0,0 +1,446 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import Aborted, AlreadyExists
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.storage.base import (
+    EmailAlreadyExistsError,
+    SlotAlreadyBookedError,
+    SlotUnavailableError,
+    StorageBackend,
+    TransactionContentionError,
+    cancelled_result,
+    course_slot_ids,
+    idempotent_result,
+    normalize_email,
+    reservation_order,
+    reservation_slot_ids,
+    slot_id,
+)
+
+# 稼働枠の一括登録で同時に発行する create の上限
+CREATE_CONCURRENCY = 20
+# メールアドレスの索引（ドキュメントID: 正規化したメールアドレス、フィールド: userId）
+EMAILS_COLLECTION = "user_emails"
+# 予約・キャンセルの冪等キーの記録（ドキュメントID: key_id）。expiresAt に TTL ポリシーを設定してもよい
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+
+
+def email_index_id(email: str) -> str:
+    """メールアドレスの索引のドキュメントID（ID に使えない "/" はエスケープする）"""
+    return normalize_email(email).replace("%", "%25").replace("/", "%2F")
+
+
+def _doc_to_dict(doc) -> Dict[str, Any]:
+    data = doc.to_dict()
+    data["id"] = doc.id
+    return data
+
+
+class FirestoreStorage(StorageBackend):
+    """Firestore（AsyncClient）によるストレージ実装"""
+
+    name = "firestore"
+
+    def __init__(self, client: firestore.AsyncClient, email_index_fallback: bool = True):
+        self.db = client
+        # 索引にないメールアドレスを users のクエリで探す（索引の補完前の既存ユーザー用）
+        self.email_index_fallback = email_index_fallback
+
+    async def _run_transaction(self, to_wrap: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        to_wrap をトランザクション内で実行する（競合時はライブラリが再試行する）
+
+        コミットの競合（Aborted）でやり直した回数を transaction_aborts に加算し、
+        規定回数内にコミットできなかった場合は TransactionContentionError にする。
+        """
+        attempts = 0
+
+        @firestore.async_transactional
+        async def counted(transaction):
+            nonlocal attempts
+            attempts += 1
+            return await to_wrap(transaction)
+
+        contended = False
+        try:
+            return await counted(self.db.transaction())
+        except ValueError as e:
+            if isinstance(e.__cause__, Aborted):
+                contended = True
+                raise TransactionContentionError() from e
+            raise
+        finally:
+            # 成功・業務エラー時は最後の試行を除いた回数、再試行を使い切った場合は全試行が競合
+            self.transaction_attempts += attempts
+            self.transaction_aborts += attempts if contended else max(0, attempts - 1)
+
+    async def warm_up(self) -> None:
+        # 存在しないドキュメントを 1 件読み、gRPC チャネルの接続と認証トークンの取得を済ませる
+        await self.db.collection("users").document("_warmup").get()
+
+    # ---- users ----
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.db.collection("users").document(user_id).get()
+        if not doc.exists:
+            return None
+        return _doc_to_dict(doc)
+
+    def _email_ref(self, email: str):
+        return self.db.collection(EMAILS_COLLECTION).document(email_index_id(email))
+
+    async def _query_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        docs = await self.db.collection("users")\
+            .where(filter=FieldFilter("email", "==", email))\
+            .limit(1)\
+            .get()
+        for doc in docs:
+            return _doc_to_dict(doc)
+        return None
+
+    async def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        if not normalize_email(email):
+            return None
+        index = await self._email_ref(email).get()
+        if index.exists:
+            return await self.get_user(index.get("userId"))
+        if self.email_index_fallback:
+            return await self._query_user_by_email(email.strip())
+        return None
+
+    async def list_users(
+        self,
+        role: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        query = self.db.collection("users")
+        if role:
+            query = query.where(filter=FieldFilter("role", "==", role))
+        query = query.order_by(FieldPath.document_id())
+        if after:
+            query = query.start_after({FieldPath.document_id(): after})
+        if fields:
+            query = query.select(fields)
+        if limit:
+            query = query.limit(limit)
+        return [_doc_to_dict(doc) async for doc in query.stream()]
+
+    async def create_user(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        doc_ref = self.db.collection("users").document()
+        if not normalize_email(data.get("email")):
+            await doc_ref.set(data)
+            return {"id": doc_ref.id, **data}
+
+        if self.email_index_fallback and await self._query_user_by_email(data["email"].strip()) is not None:
+            raise EmailAlreadyExistsError()
+        # 索引の create（既に存在すれば失敗）とユーザーの作成を 1 つのバッチで原子的に書き込む
+        batch = self.db.batch()
+        batch.create(self._email_ref(data["email"]), {"userId": doc_ref.id})
+        batch.set(doc_ref, data)
+        try:
+            await batch.commit()
+        except AlreadyExists as e:
+            raise EmailAlreadyExistsError() from e
+        return {"id": doc_ref.id, **data}
+
+    async def update_user(self, user_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        doc_ref = self.db.collection("users").document(user_id)
+        if "email" not in data:
+            doc = await doc_ref.get()
+            if not doc.exists:
+                return None
+            await doc_ref.update(data)
+            updated = doc.to_dict()
+            updated.update(data)
+            updated["id"] = doc.id
+            return updated
+
+        new_email = normalize_email(data["email"])
+        if self.email_index_fallback and new_email:
+            existing = await self._query_user_by_email(data["email"].strip())
+            if existing is not None and existing["id"] != user_id:
+                raise EmailAlreadyExistsError()
+
+        async def update(transaction):
+            doc = await doc_ref.get(transaction=transaction)
+            if not doc.exists:
+                return None
+            current = doc.to_dict()
+            old_email = normalize_email(current.get("email"))
+            # 読み取りをすべて書き込みより前に行う
+            new_index = await self._email_ref(new_email).get(transaction=transaction) if new_email else None
+            old_index = None
+            if old_email and old_email != new_email:
+                old_index = await self._email_ref(old_email).get(transaction=transaction)
+
+            if new_index is not None:
+                if new_index.exists and new_index.get("userId") != user_id:
+                    raise EmailAlreadyExistsError()
+                if not new_index.exists:
+                    transaction.create(new_index.reference, {"userId": user_id})
+            if old_index is not None and old_index.exists and old_index.get("userId") == user_id:
+                transaction.delete(old_index.reference)
+            transaction.update(doc_ref, data)
+            current.update(data)
+            current["id"] = doc.id
+            return current
+
+        return await self._run_transaction(update)
+
+    # ---- availabilities ----
+
+    async def list_availabilities(
+        self,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        query = self.db.collection("availabilities")\
+            .where(filter=FieldFilter("startAt", ">=", start_at))\
+            .where(filter=FieldFilter("startAt", "<", end_at))
+
+        if trainer_id:
+            query = query.where(filter=FieldFilter("trainerId", "==", trainer_id))
+        if fields:
+            query = query.select(fields)
+
+        docs = query.order_by("startAt").stream()
+        return [_doc_to_dict(doc) async for doc in docs]
+
+    async def create_availabilities(
+        self, trainer_id: str, slots: List[Tuple[datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        availabilities_collection = self.db.collection("availabilities")
+        semaphore = asyncio.Semaphore(CREATE_CONCURRENCY)
+
+        async def create_slot(start_at: datetime, end_at: datetime) -> Optional[Dict[str, Any]]:
+            doc_ref = availabilities_collection.document(slot_id(trainer_id, start_at))
+            slot_data = {
+                "trainerId": trainer_id,
+                "startAt": start_at,
+                "endAt": end_at,
+                "isBooked": False
+            }
+            async with semaphore:
+                try:
+                    # ID が決まっているため create が重複チェックを兼ねる（事前読み取り不要）
+                    await doc_ref.create(slot_data)
+                except AlreadyExists:
+                    return None
+            return {"id": doc_ref.id, **slot_data}
+
+        # 同じ開始時刻がリクエスト内で重複している場合は最初のものだけ登録
+        unique_slots = {slot_id(trainer_id, start_at): (start_at, end_at) for start_at, end_at in reversed(slots)}
+        created = await asyncio.gather(*[
+            create_slot(start_at, end_at) for start_at, end_at in unique_slots.values()
+        ])
+        results = [slot for slot in created if slot is not None]
+        results.sort(key=lambda slot: slot["startAt"])
+        return results
+
+    async def get_availability(self, availability_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.db.collection("availabilities").document(availability_id).get()
+        if not doc.exists:
+            return None
+        return _doc_to_dict(doc)
+
+    async def delete_availability(self, availability_id: str) -> None:
+        ref = self.db.collection("availabilities").document(availability_id)
+
+        async def delete(transaction):
+            snapshot = await ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return
+            if snapshot.to_dict().get("isBooked"):
+                raise SlotAlreadyBookedError()
+            transaction.delete(ref)
+
+        await self._run_transaction(delete)
+
+    # ---- reservations ----
+
+    async def get_reservation(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.db.collection("reservations").document(reservation_id).get()
+        if not doc.exists:
+            return None
+        return _doc_to_dict(doc)
+
+    async def list_reservations(
+        self,
+        trainer_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        query = self.db.collection("reservations")
+        if trainer_id:
+            query = query.where(filter=FieldFilter("trainerId", "==", trainer_id))
+        if user_id:
+            query = query.where(filter=FieldFilter("userId", "==", user_id))
+        if status:
+            query = query.where(filter=FieldFilter("status", "==", status))
+        if date_from:
+            query = query.where(filter=FieldFilter("date", ">=", date_from))
+        if date_to:
+            query = query.where(filter=FieldFilter("date", "<=", date_to))
+
+        # 必要な複合インデックスは firestore.indexes.json を参照
+        order = [
+            FieldPath.document_id() if key == "id" else key
+            for key in reservation_order(bool(date_from or date_to))
+        ]
+        for field in order:
+            query = query.order_by(field, direction=firestore.Query.DESCENDING)
+        if after:
+            query = query.start_after(dict(zip(order, after)))
+        if fields:
+            query = query.select(fields)
+        if limit:
+            query = query.limit(limit)
+
+        return [_doc_to_dict(doc) async for doc in query.stream()]
+
+    # ---- idempotency keys ----
+
+    async def get_idempotency_record(self, key_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.db.collection(IDEMPOTENCY_COLLECTION).document(key_id).get()
+        if not doc.exists:
+            return None
+        return _doc_to_dict(doc)
+
+    async def delete_expired_idempotency_records(self, now: datetime, limit: int) -> int:
+        query = (
+            self.db.collection(IDEMPOTENCY_COLLECTION)
+            .where(filter=FieldFilter("expiresAt", "<=", now))
+            .select([])
+            .limit(limit)
+        )
+        refs = [doc.reference async for doc in query.stream()]
+        if refs:
+            batch = self.db.batch()
+            for ref in refs:
+                batch.delete(ref)
+            await batch.commit()
+        return len(refs)
+
+    async def _read_idempotency(self, transaction, idempotency: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """トランザクション内で冪等キーの記録を読み、有効な記録があれば前回の結果を返す（書き込みより先に呼ぶ）"""
+        if idempotency is None:
+            return None
+        ref = self.db.collection(IDEMPOTENCY_COLLECTION).document(idempotency["id"])
+        snapshot = await ref.get(transaction=transaction)
+        return idempotent_result(snapshot.to_dict() if snapshot.exists else None, idempotency)
+
+    def _write_idempotency(self, transaction, idempotency: Optional[Dict[str, Any]], result: Dict[str, Any]) -> None:
+        if idempotency is None:
+            return
+        ref = self.db.collection(IDEMPOTENCY_COLLECTION).document(idempotency["id"])
+        record = {key: value for key, value in idempotency.items() if key != "id"}
+        transaction.set(ref, {**record, "result": result})
+
+    # ---- transactions ----
+
+    async def book_reservation(
+        self,
+        reservation_data: Dict[str, Any],
+        start_at: datetime,
+        num_slots: int,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        db = self.db
+        slot_ids = course_slot_ids(reservation_data["trainerId"], start_at, num_slots)
+        # キャンセル時に同じ枠を ID 指定で解放できるよう、確保した枠IDを予約に記録する
+        reservation_data = {**reservation_data, "slotIds": slot_ids}
+
+        avail_refs = [db.collection("availabilities").document(doc_id) for doc_id in slot_ids]
+
+        async def create_in_transaction(transaction):
+            # 0. 同じ冪等キーで既に予約済みの場合は、枠を読まずに前回の結果を返す
+            replay = await self._read_idempotency(transaction, idempotency)
+            if replay is not None:
+                return replay
+
+            # 1. 指定された時間枠の Availability を ID 指定で取得（範囲クエリを使わない）
+            avail_docs = [doc async for doc in db.get_all(avail_refs, transaction=transaction)]
+
+            # スロットがすべて存在するかチェック
+            if len(avail_docs) < num_slots or not all(doc.exists for doc in avail_docs):
+                raise SlotUnavailableError()
+
+            # 全てのスロットが未予約かチェック
+            for doc in avail_docs:
+                if doc.to_dict().get("isBooked"):
+                    raise SlotAlreadyBookedError()
+
+            # 2. Reservation ドキュメントの作成
+            res_ref = db.collection("reservations").document()
+            transaction.set(res_ref, reservation_data)
+
+            # 3. Availability の更新
+            for doc in avail_docs:
+                transaction.update(doc.reference, {"isBooked": True})
+
+            reservation = {"id": res_ref.id, **reservation_data}
+            self._write_idempotency(transaction, idempotency, reservation)
+            return reservation
+
+        return await self._run_transaction(create_in_transaction)
+
+    async def cancel_reservation(
+        self,
+        reservation_id: str,
+        updated_at: str,
+        validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        db = self.db
+        res_ref = db.collection("reservations").document(reservation_id)
+
+        async def cancel_in_transaction(transaction):
+            replay = await self._read_idempotency(transaction, idempotency)
+            if replay is not None:
+                return replay
+
+            # 1. 予約と、予約時に確保した Availability を ID 指定で取得
+            # (トランザクション内では読み取りを書き込みより先に行う必要がある)
+            snapshot = await res_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            reservation = _doc_to_dict(snapshot)
+            if validate is not None:
+                validate(reservation)
+            if reservation.get("status") == "cancelled":
+                return reservation
+
+            slot_ids = reservation_slot_ids(reservation)
+            avail_refs = [db.collection("availabilities").document(doc_id) for doc_id in slot_ids]
+            avail_docs = [doc async for doc in db.get_all(avail_refs, transaction=transaction)]
+
+            # 2. 予約をキャンセル状態に
+            transaction.update(res_ref, {
+                "status": "cancelled",
+                "updatedAt": updated_at
+            })
+
+            # 3. Availability を解放（削除済みの枠は除く）
+            for doc in avail_docs:
+                if doc.exists:
+                    transaction.update(doc.reference, {"isBooked": False})
+
+            reservation["slotIds"] = slot_ids
+            self._write_idempotency(transaction, idempotency, cancelled_result(reservation, updated_at))
+            return reservation
+
+        return await self._run_transaction(cancel_in_transaction)
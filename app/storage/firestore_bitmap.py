@@ -0,0 +1,321 @@
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from app.storage.base import (
+    SLOT_MINUTES,
+    SlotAlreadyBookedError,
+    SlotUnavailableError,
+    cancelled_result,
+    parse_slot_id,
+    project,
+    reservation_slot_ids,
+    slot_id,
+    to_utc,
+)
+from app.storage.firestore import CREATE_CONCURRENCY, FirestoreStorage, _doc_to_dict
+
+# 1日あたりの枠数（30分単位で 48）
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+DAYS_COLLECTION = "availability_days"
+
+
+def day_doc_id(trainer_id: str, day: date) -> str:
+    """トレーナー・日（UTC）単位のドキュメントID"""
+    return f"{trainer_id}_{day.strftime('%Y%m%d')}"
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time(0, 0), tzinfo=timezone.utc)
+
+
+def slot_position(start_at: datetime) -> Tuple[date, int]:
+    """開始時刻を (日(UTC), 日内の枠番号) に変換する"""
+    start_at = to_utc(start_at)
+    offset = start_at - day_start(start_at.date())
+    index, remainder = divmod(offset, timedelta(minutes=SLOT_MINUTES))
+    if remainder:
+        raise ValueError(f"Slot start is not aligned to {SLOT_MINUTES} minutes: {start_at.isoformat()}")
+    return start_at.date(), index
+
+
+def expand_day(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """日単位ドキュメントを AvailabilityResponse 互換の枠リストに展開する"""
+    trainer_id = data["trainerId"]
+    base = day_start(date.fromisoformat(data["date"]))
+    open_mask = data.get("openMask", 0)
+    booked_mask = data.get("bookedMask", 0)
+    slot_meta = data.get("slotMeta") or {}
+    slots = []
+    for index in range(SLOTS_PER_DAY):
+        bit = 1 << index
+        if not open_mask & bit:
+            continue
+        start_at = base + timedelta(minutes=SLOT_MINUTES * index)
+        slot = {
+            "id": slot_id(trainer_id, start_at),
+            "trainerId": trainer_id,
+            "startAt": start_at,
+            "endAt": start_at + timedelta(minutes=SLOT_MINUTES),
+            "isBooked": bool(booked_mask & bit),
+        }
+        # 枠ごとの追加情報（標準と異なる endAt など）
+        slot.update(slot_meta.get(str(index), {}))
+        slots.append(slot)
+    return slots
+
+
+def group_by_day(trainer_id: str, starts: Iterable[datetime]) -> Dict[str, Tuple[date, int]]:
+    """開始時刻を日単位ドキュメントIDごとのビットマスクにまとめる"""
+    grouped: Dict[str, Tuple[date, int]] = {}
+    for start_at in starts:
+        day, index = slot_position(start_at)
+        doc_id = day_doc_id(trainer_id, day)
+        _, mask = grouped.get(doc_id, (day, 0))
+        grouped[doc_id] = (day, mask | (1 << index))
+    return grouped
+
+
+class FirestoreBitmapStorage(FirestoreStorage):
+    """
+    稼働枠をトレーナー・日単位の 1 ドキュメント（48 ビットのマスク）で保持する Firestore 実装
+
+    - `openMask`: 稼働枠が存在する枠のビット
+    - `bookedMask`: 予約済みの枠のビット
+    - `slotMeta`: 枠番号（文字列）ごとの追加情報（任意）
+
+    予約は 1 ドキュメントのビット演算による check-and-set になり、読み書き回数が枠数に依存しない。
+    ユーザー・予約の扱いは FirestoreStorage と同じ。
+    """
+
+    name = "firestore_bitmap"
+
+    def _day_ref(self, doc_id: str):
+        return self.db.collection(DAYS_COLLECTION).document(doc_id)
+
+    # ---- availabilities ----
+
+    async def list_availabilities(
+        self,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        start_at, end_at = to_utc(start_at), to_utc(end_at)
+        query = self.db.collection(DAYS_COLLECTION)\
+            .where(filter=FieldFilter("dayStart", ">=", day_start(start_at.date())))\
+            .where(filter=FieldFilter("dayStart", "<", end_at))
+
+        if trainer_id:
+            query = query.where(filter=FieldFilter("trainerId", "==", trainer_id))
+
+        results = []
+        async for doc in query.stream():
+            results.extend(
+                slot for slot in expand_day(doc.to_dict())
+                if start_at <= slot["startAt"] < end_at
+            )
+        results.sort(key=lambda slot: slot["startAt"])
+        # 日単位ドキュメントは丸ごと読むため、射影は展開後に行う
+        return [project(slot, fields) for slot in results]
+
+    async def create_availabilities(
+        self, trainer_id: str, slots: List[Tuple[datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        requested = {to_utc(start_at): to_utc(end_at) for start_at, end_at in reversed(slots)}
+        grouped = group_by_day(trainer_id, requested)
+        semaphore = asyncio.Semaphore(CREATE_CONCURRENCY)
+
+        async def open_day(doc_id: str, day: date, mask: int) -> int:
+            ref = self._day_ref(doc_id)
+            transaction = self.db.transaction()
+            base = day_start(day)
+            # 標準（30分）と異なる終了時刻は枠ごとの追加情報として保持
+            slot_meta = {
+                str(index): {"endAt": requested[start_at]}
+                for index, start_at in (
+                    (i, base + timedelta(minutes=SLOT_MINUTES * i)) for i in range(SLOTS_PER_DAY)
+                )
+                if mask & (1 << index)
+                and requested[start_at] != start_at + timedelta(minutes=SLOT_MINUTES)
+            }
+
+            @firestore.async_transactional
+            async def open_in_transaction(transaction):
+                snapshot = await ref.get(transaction=transaction)
+                current = snapshot.to_dict() if snapshot.exists else {}
+                open_mask = current.get("openMask", 0)
+                new_bits = mask & ~open_mask
+                if new_bits:
+                    day_data = {
+                        "trainerId": trainer_id,
+                        "date": day.isoformat(),
+                        "dayStart": base,
+                        "openMask": open_mask | new_bits,
+                        "bookedMask": current.get("bookedMask", 0),
+                    }
+                    new_meta = {k: v for k, v in slot_meta.items() if new_bits & (1 << int(k))}
+                    if new_meta:
+                        day_data["slotMeta"] = new_meta
+                    transaction.set(ref, day_data, merge=True)
+                return new_bits
+
+            async with semaphore:
+                return await open_in_transaction(transaction)
+
+        created_masks = await asyncio.gather(*[
+            open_day(doc_id, day, mask) for doc_id, (day, mask) in grouped.items()
+        ])
+
+        results = []
+        for (doc_id, (day, _)), new_bits in zip(grouped.items(), created_masks):
+            base = day_start(day)
+            for index in range(SLOTS_PER_DAY):
+                if not new_bits & (1 << index):
+                    continue
+                start_at = base + timedelta(minutes=SLOT_MINUTES * index)
+                results.append({
+                    "id": slot_id(trainer_id, start_at),
+                    "trainerId": trainer_id,
+                    "startAt": start_at,
+                    "endAt": requested[start_at],
+                    "isBooked": False
+                })
+        results.sort(key=lambda slot: slot["startAt"])
+        return results
+
+    async def get_availability(self, availability_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            trainer_id, start_at = parse_slot_id(availability_id)
+            day, index = slot_position(start_at)
+        except ValueError:
+            return None
+        doc = await self._day_ref(day_doc_id(trainer_id, day)).get()
+        if not doc.exists:
+            return None
+        for slot in expand_day(doc.to_dict()):
+            if slot["id"] == availability_id:
+                return slot
+        return None
+
+    async def delete_availability(self, availability_id: str) -> None:
+        trainer_id, start_at = parse_slot_id(availability_id)
+        day, index = slot_position(start_at)
+        ref = self._day_ref(day_doc_id(trainer_id, day))
+        transaction = self.db.transaction()
+
+        @firestore.async_transactional
+        async def close_in_transaction(transaction):
+            snapshot = await ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return
+            data = snapshot.to_dict()
+            if data.get("bookedMask", 0) & (1 << index):
+                raise SlotAlreadyBookedError()
+            transaction.update(ref, {
+                "openMask": data.get("openMask", 0) & ~(1 << index),
+                f"slotMeta.`{index}`": firestore.DELETE_FIELD,
+            })
+
+        await close_in_transaction(transaction)
+
+    # ---- transactions ----
+
+    async def _update_masks(self, transaction, grouped: Dict[str, Tuple[date, int]], booked: bool) -> None:
+        """日単位ドキュメントの bookedMask をまとめて更新する（トランザクション内）"""
+        if not grouped:
+            return
+        refs = [self._day_ref(doc_id) for doc_id in grouped]
+        snapshots = {doc.id: doc async for doc in self.db.get_all(refs, transaction=transaction)}
+
+        updates = []
+        for doc_id, (_, mask) in grouped.items():
+            snapshot = snapshots.get(doc_id)
+            data = snapshot.to_dict() if snapshot is not None and snapshot.exists else None
+            if booked:
+                # 全ての枠が存在し、かつ未予約であることを確認
+                if data is None or (data.get("openMask", 0) & mask) != mask:
+                    raise SlotUnavailableError()
+                if data.get("bookedMask", 0) & mask:
+                    raise SlotAlreadyBookedError()
+                updates.append((snapshot.reference, data.get("bookedMask", 0) | mask))
+            elif data is not None:
+                updates.append((snapshot.reference, data.get("bookedMask", 0) & ~mask))
+
+        for ref, booked_mask in updates:
+            transaction.update(ref, {"bookedMask": booked_mask})
+
+    async def book_reservation(
+        self,
+        reservation_data: Dict[str, Any],
+        start_at: datetime,
+        num_slots: int,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        db = self.db
+        trainer_id = reservation_data["trainerId"]
+        start_at = to_utc(start_at)
+        starts = [start_at + timedelta(minutes=SLOT_MINUTES * i) for i in range(num_slots)]
+        try:
+            grouped = group_by_day(trainer_id, starts)
+        except ValueError:
+            raise SlotUnavailableError()
+        reservation_data = {**reservation_data, "slotIds": [slot_id(trainer_id, start) for start in starts]}
+
+        async def create_in_transaction(transaction):
+            replay = await self._read_idempotency(transaction, idempotency)
+            if replay is not None:
+                return replay
+            # 通常は 1 ドキュメント（UTC の日付をまたぐ場合のみ 2 ドキュメント）の読み書き
+            await self._update_masks(transaction, grouped, booked=True)
+            res_ref = db.collection("reservations").document()
+            transaction.set(res_ref, reservation_data)
+            reservation = {"id": res_ref.id, **reservation_data}
+            self._write_idempotency(transaction, idempotency, reservation)
+            return reservation
+
+        return await self._run_transaction(create_in_transaction)
+
+    async def cancel_reservation(
+        self,
+        reservation_id: str,
+        updated_at: str,
+        validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        db = self.db
+        res_ref = db.collection("reservations").document(reservation_id)
+
+        async def cancel_in_transaction(transaction):
+            replay = await self._read_idempotency(transaction, idempotency)
+            if replay is not None:
+                return replay
+            snapshot = await res_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            reservation = _doc_to_dict(snapshot)
+            if validate is not None:
+                validate(reservation)
+            if reservation.get("status") == "cancelled":
+                return reservation
+
+            slot_ids = reservation_slot_ids(reservation)
+            try:
+                grouped = group_by_day(reservation["trainerId"], [parse_slot_id(doc_id)[1] for doc_id in slot_ids])
+            except ValueError:
+                grouped = {}
+            await self._update_masks(transaction, grouped, booked=False)
+            transaction.update(res_ref, {
+                "status": "cancelled",
+                "updatedAt": updated_at
+            })
+            reservation["slotIds"] = slot_ids
+            self._write_idempotency(transaction, idempotency, cancelled_result(reservation, updated_at))
+            return reservation
+
+        return await self._run_transaction(cancel_in_transaction)
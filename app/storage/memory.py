@@ -0,0 +1,287 @@
+import copy
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.storage.base import (
+    EmailAlreadyExistsError,
+    SlotAlreadyBookedError,
+    SlotUnavailableError,
+    StorageBackend,
+    cancelled_result,
+    course_slot_ids,
+    cursor_values,
+    idempotent_result,
+    normalize_email,
+    project,
+    reservation_order,
+    reservation_slot_ids,
+    slot_id,
+    to_utc,
+)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:20]
+
+
+class MemoryStorage(StorageBackend):
+    """
+    プロセス内メモリによるストレージ実装（スレッドセーフ）
+
+    GCP プロジェクトなしでのローカル開発・負荷試験・プロファイリング用。プロセス終了でデータは消える。
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        # メールアドレスの索引（正規化したメールアドレス -> ユーザーID）
+        self._emails: Dict[str, str] = {}
+        self._availabilities: Dict[str, Dict[str, Any]] = {}
+        self._reservations: Dict[str, Dict[str, Any]] = {}
+        # 冪等キーの記録（key_id -> 記録）
+        self._idempotency: Dict[str, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _out(doc_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        # 呼び出し側での変更が保存データに影響しないようコピーして返す
+        return {**copy.deepcopy(data), "id": doc_id}
+
+    # ---- users ----
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._users.get(user_id)
+            return self._out(user_id, data) if data is not None else None
+
+    async def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user_id = self._emails.get(normalize_email(email))
+            if user_id is None:
+                return None
+            return self._out(user_id, self._users[user_id])
+
+    async def list_users(
+        self,
+        role: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            found = [
+                self._out(user_id, data)
+                for user_id, data in sorted(self._users.items())
+                if (not role or data.get("role") == role)
+                and (not after or user_id > after)
+            ]
+        return [project(data, fields) for data in found[:limit]]
+
+    async def create_user(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        user_id = _new_id()
+        email = normalize_email(data.get("email"))
+        with self._lock:
+            if email and email in self._emails:
+                raise EmailAlreadyExistsError()
+            self._users[user_id] = copy.deepcopy(data)
+            if email:
+                self._emails[email] = user_id
+            return self._out(user_id, data)
+
+    async def update_user(self, user_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            current = self._users.get(user_id)
+            if current is None:
+                return None
+            if "email" in data:
+                old_email = normalize_email(current.get("email"))
+                new_email = normalize_email(data["email"])
+                if new_email and self._emails.get(new_email, user_id) != user_id:
+                    raise EmailAlreadyExistsError()
+                if old_email and self._emails.get(old_email) == user_id:
+                    del self._emails[old_email]
+                if new_email:
+                    self._emails[new_email] = user_id
+            current.update(copy.deepcopy(data))
+            return self._out(user_id, current)
+
+    # ---- availabilities ----
+
+    def _slots_in_range(
+        self, start_at: datetime, end_at: datetime, trainer_id: Optional[str]
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        start_at, end_at = to_utc(start_at), to_utc(end_at)
+        found = [
+            (doc_id, data)
+            for doc_id, data in self._availabilities.items()
+            if start_at <= data["startAt"] < end_at
+            and (not trainer_id or data["trainerId"] == trainer_id)
+        ]
+        found.sort(key=lambda item: item[1]["startAt"])
+        return found
+
+    async def list_availabilities(
+        self,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                project(self._out(doc_id, data), fields)
+                for doc_id, data in self._slots_in_range(start_at, end_at, trainer_id)
+            ]
+
+    async def create_availabilities(
+        self, trainer_id: str, slots: List[Tuple[datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        results = []
+        with self._lock:
+            for start_at, end_at in slots:
+                doc_id = slot_id(trainer_id, start_at)
+                if doc_id in self._availabilities:
+                    continue
+                slot_data = {
+                    "trainerId": trainer_id,
+                    "startAt": to_utc(start_at),
+                    "endAt": to_utc(end_at),
+                    "isBooked": False
+                }
+                self._availabilities[doc_id] = slot_data
+                results.append(self._out(doc_id, slot_data))
+        return results
+
+    async def get_availability(self, availability_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._availabilities.get(availability_id)
+            return self._out(availability_id, data) if data is not None else None
+
+    async def delete_availability(self, availability_id: str) -> None:
+        with self._lock:
+            data = self._availabilities.get(availability_id)
+            if data is not None and data["isBooked"]:
+                raise SlotAlreadyBookedError()
+            self._availabilities.pop(availability_id, None)
+
+    # ---- reservations ----
+
+    async def get_reservation(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._reservations.get(reservation_id)
+            return self._out(reservation_id, data) if data is not None else None
+
+    async def list_reservations(
+        self,
+        trainer_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        order = reservation_order(bool(date_from or date_to))
+        with self._lock:
+            found = [
+                self._out(res_id, data)
+                for res_id, data in self._reservations.items()
+                if (not trainer_id or data.get("trainerId") == trainer_id)
+                and (not user_id or data.get("userId") == user_id)
+                and (not status or data.get("status") == status)
+                and (not date_from or data.get("date", "") >= date_from)
+                and (not date_to or data.get("date", "") <= date_to)
+            ]
+        found.sort(key=lambda data: cursor_values(data, order), reverse=True)
+        if after:
+            found = [data for data in found if cursor_values(data, order) < list(after)]
+        return [project(data, fields) for data in found[:limit]]
+
+    # ---- idempotency keys ----
+
+    async def get_idempotency_record(self, key_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._idempotency.get(key_id)
+            return self._out(key_id, data) if data is not None else None
+
+    async def delete_expired_idempotency_records(self, now: datetime, limit: int) -> int:
+        with self._lock:
+            expired = [key_id for key_id, data in self._idempotency.items() if to_utc(data["expiresAt"]) <= now]
+            for key_id in expired[:limit]:
+                del self._idempotency[key_id]
+            return len(expired[:limit])
+
+    def _replay(self, idempotency: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if idempotency is None:
+            return None
+        result = idempotent_result(self._idempotency.get(idempotency["id"]), idempotency)
+        return copy.deepcopy(result) if result is not None else None
+
+    def _record(self, idempotency: Optional[Dict[str, Any]], result: Dict[str, Any]) -> None:
+        if idempotency is not None:
+            record = {key: value for key, value in idempotency.items() if key != "id"}
+            self._idempotency[idempotency["id"]] = {**record, "result": copy.deepcopy(result)}
+
+    # ---- transactions ----
+
+    async def book_reservation(
+        self,
+        reservation_data: Dict[str, Any],
+        start_at: datetime,
+        num_slots: int,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        doc_ids = course_slot_ids(reservation_data["trainerId"], start_at, num_slots)
+        with self._lock:
+            replay = self._replay(idempotency)
+            if replay is not None:
+                return replay
+            slots = [self._availabilities.get(doc_id) for doc_id in doc_ids]
+            if any(data is None for data in slots):
+                raise SlotUnavailableError()
+            if any(data.get("isBooked") for data in slots):
+                raise SlotAlreadyBookedError()
+
+            res_id = _new_id()
+            reservation_data = {**reservation_data, "slotIds": doc_ids}
+            self._reservations[res_id] = copy.deepcopy(reservation_data)
+            for data in slots:
+                data["isBooked"] = True
+            result = self._out(res_id, reservation_data)
+            self._record(idempotency, result)
+            return result
+
+    async def cancel_reservation(
+        self,
+        reservation_id: str,
+        updated_at: str,
+        validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            replay = self._replay(idempotency)
+            if replay is not None:
+                return replay
+            reservation = self._reservations.get(reservation_id)
+            if reservation is None:
+                return None
+            result = self._out(reservation_id, reservation)
+            if validate is not None:
+                validate(result)
+            if reservation.get("status") == "cancelled":
+                return result
+
+            slot_ids = reservation_slot_ids(reservation)
+            reservation["status"] = "cancelled"
+            reservation["updatedAt"] = updated_at
+            for doc_id in slot_ids:
+                data = self._availabilities.get(doc_id)
+                if data is not None:
+                    data["isBooked"] = False
+            result["slotIds"] = slot_ids
+            self._record(idempotency, cancelled_result(result, updated_at))
+            return result
@@ -0,0 +1,474 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.storage.base import (
+    EmailAlreadyExistsError,
+    SlotAlreadyBookedError,
+    SlotUnavailableError,
+    StorageBackend,
+    cancelled_result,
+    course_slot_ids,
+    idempotent_result,
+    normalize_email,
+    project,
+    reservation_order,
+    reservation_slot_ids,
+    slot_id,
+    to_utc,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT,
+    role TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
+
+-- メールアドレスの索引（正規化したメールアドレス -> ユーザーID、一意性を主キーで保証する）
+CREATE TABLE IF NOT EXISTS user_emails (
+    email TEXT PRIMARY KEY,
+    userId TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS availabilities (
+    id TEXT PRIMARY KEY,
+    trainerId TEXT NOT NULL,
+    startAt TEXT NOT NULL,
+    endAt TEXT NOT NULL,
+    isBooked INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_availabilities_trainer_start ON availabilities(trainerId, startAt);
+CREATE INDEX IF NOT EXISTS idx_availabilities_start ON availabilities(startAt);
+
+CREATE TABLE IF NOT EXISTS reservations (
+    id TEXT PRIMARY KEY,
+    userId TEXT,
+    trainerId TEXT,
+    createdAt TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reservations_trainer ON reservations(trainerId, createdAt);
+CREATE INDEX IF NOT EXISTS idx_reservations_user ON reservations(userId, createdAt);
+
+-- 予約・キャンセルの冪等キーの記録（data: 記録の JSON、expiresAt は期限切れの削除用）
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    id TEXT PRIMARY KEY,
+    expiresAt TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expiresAt);
+"""
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:20]
+
+
+def _ts(dt: datetime) -> str:
+    # 文字列の大小比較が時刻順と一致するよう、UTC・固定長で保存する
+    return to_utc(dt).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def _availability_row(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "trainerId": row["trainerId"],
+        "startAt": _parse_ts(row["startAt"]),
+        "endAt": _parse_ts(row["endAt"]),
+        "isBooked": bool(row["isBooked"]),
+    }
+
+
+def _json_row(row: sqlite3.Row) -> Dict[str, Any]:
+    data = json.loads(row["data"])
+    data["id"] = row["id"]
+    return data
+
+
+def _idempotency_row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    data = _json_row(row)
+    data["expiresAt"] = _parse_ts(row["expiresAt"])
+    return data
+
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite（WAL モード）によるストレージ実装
+
+    小規模店舗向けの単一ノード構成や、オフラインでのベンチマーク用。
+    sqlite3 はブロッキング API のため、クエリはワーカースレッドで実行する。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        has_email_index = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_emails'"
+        ).fetchone()
+        self._conn.executescript(SCHEMA)
+        if not has_email_index:
+            self._backfill_email_index()
+
+    def _backfill_email_index(self) -> None:
+        """索引の導入前に作成されたデータベースの既存ユーザーを索引に登録する（重複は先のユーザーを残す）"""
+        rows = self._conn.execute("SELECT id, email FROM users ORDER BY id").fetchall()
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO user_emails (email, userId) VALUES (?, ?)",
+            [(normalize_email(row["email"]), row["id"]) for row in rows if normalize_email(row["email"])],
+        )
+
+    async def _run(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        def call():
+            with self._lock:
+                return func(self._conn)
+        return await asyncio.to_thread(call)
+
+    async def _run_in_transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        def call(conn: sqlite3.Connection):
+            # 書き込みロックを先に取得し、読み取りから書き込みまでを直列化する
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await self._run(call)
+
+    # ---- users ----
+
+    async def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        def query(conn):
+            row = conn.execute("SELECT id, data FROM users WHERE id = ?", (user_id,)).fetchone()
+            return _json_row(row) if row else None
+        return await self._run(query)
+
+    async def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        def query(conn):
+            row = conn.execute(
+                "SELECT users.id, users.data FROM user_emails JOIN users ON users.id = user_emails.userId"
+                " WHERE user_emails.email = ?",
+                (normalize_email(email),),
+            ).fetchone()
+            return _json_row(row) if row else None
+        return await self._run(query)
+
+    async def list_users(
+        self,
+        role: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        def query(conn):
+            sql = "SELECT id, data FROM users WHERE 1 = 1"
+            params: list = []
+            if role:
+                sql += " AND role = ?"
+                params.append(role)
+            if after:
+                sql += " AND id > ?"
+                params.append(after)
+            sql += " ORDER BY id"
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+            # data 列は JSON のため射影は読み取り後に行う
+            return [project(_json_row(row), fields) for row in conn.execute(sql, params)]
+        return await self._run(query)
+
+    async def create_user(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        user_id = _new_id()
+        email = normalize_email(data.get("email"))
+
+        def insert(conn):
+            if email:
+                try:
+                    conn.execute("INSERT INTO user_emails (email, userId) VALUES (?, ?)", (email, user_id))
+                except sqlite3.IntegrityError as e:
+                    raise EmailAlreadyExistsError() from e
+            conn.execute(
+                "INSERT INTO users (id, email, role, data) VALUES (?, ?, ?, ?)",
+                (user_id, data.get("email"), data.get("role"), json.dumps(data)),
+            )
+        await self._run_in_transaction(insert)
+        return {"id": user_id, **data}
+
+    async def update_user(self, user_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        def update(conn):
+            row = conn.execute("SELECT id, data FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row is None:
+                return None
+            current = json.loads(row["data"])
+            if "email" in data:
+                old_email = normalize_email(current.get("email"))
+                new_email = normalize_email(data["email"])
+                if new_email:
+                    owner = conn.execute("SELECT userId FROM user_emails WHERE email = ?", (new_email,)).fetchone()
+                    if owner is not None and owner["userId"] != user_id:
+                        raise EmailAlreadyExistsError()
+                if old_email != new_email:
+                    conn.execute("DELETE FROM user_emails WHERE email = ? AND userId = ?", (old_email, user_id))
+                if new_email:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO user_emails (email, userId) VALUES (?, ?)", (new_email, user_id)
+                    )
+            current.update(data)
+            conn.execute(
+                "UPDATE users SET email = ?, role = ?, data = ? WHERE id = ?",
+                (current.get("email"), current.get("role"), json.dumps(current), user_id),
+            )
+            return {"id": user_id, **current}
+        return await self._run_in_transaction(update)
+
+    # ---- availabilities ----
+
+    async def list_availabilities(
+        self,
+        start_at: datetime,
+        end_at: datetime,
+        trainer_id: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        def query(conn):
+            sql = "SELECT * FROM availabilities WHERE startAt >= ? AND startAt < ?"
+            params: list = [_ts(start_at), _ts(end_at)]
+            if trainer_id:
+                sql += " AND trainerId = ?"
+                params.append(trainer_id)
+            sql += " ORDER BY startAt"
+            return [project(_availability_row(row), fields) for row in conn.execute(sql, params)]
+        return await self._run(query)
+
+    async def create_availabilities(
+        self, trainer_id: str, slots: List[Tuple[datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        def insert(conn):
+            results = []
+            for start_at, end_at in slots:
+                doc_id = slot_id(trainer_id, start_at)
+                # ID が決まっているため INSERT OR IGNORE が重複チェックを兼ねる
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO availabilities (id, trainerId, startAt, endAt, isBooked) VALUES (?, ?, ?, ?, 0)",
+                    (doc_id, trainer_id, _ts(start_at), _ts(end_at)),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                results.append({
+                    "id": doc_id,
+                    "trainerId": trainer_id,
+                    "startAt": to_utc(start_at),
+                    "endAt": to_utc(end_at),
+                    "isBooked": False
+                })
+            return results
+        return await self._run_in_transaction(insert)
+
+    async def get_availability(self, availability_id: str) -> Optional[Dict[str, Any]]:
+        def query(conn):
+            row = conn.execute("SELECT * FROM availabilities WHERE id = ?", (availability_id,)).fetchone()
+            return _availability_row(row) if row else None
+        return await self._run(query)
+
+    async def delete_availability(self, availability_id: str) -> None:
+        def delete(conn):
+            row = conn.execute("SELECT isBooked FROM availabilities WHERE id = ?", (availability_id,)).fetchone()
+            if row is not None and row[0]:
+                raise SlotAlreadyBookedError()
+            conn.execute("DELETE FROM availabilities WHERE id = ?", (availability_id,))
+        await self._run_in_transaction(delete)
+
+    # ---- reservations ----
+
+    async def get_reservation(self, reservation_id: str) -> Optional[Dict[str, Any]]:
+        def query(conn):
+            row = conn.execute("SELECT id, data FROM reservations WHERE id = ?", (reservation_id,)).fetchone()
+            return _json_row(row) if row else None
+        return await self._run(query)
+
+    async def list_reservations(
+        self,
+        trainer_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[List[Any]] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        columns = {
+            "date": "json_extract(data, '$.date')",
+            "createdAt": "createdAt",
+            "id": "id",
+        }
+        order = [columns[key] for key in reservation_order(bool(date_from or date_to))]
+
+        def query(conn):
+            sql = "SELECT id, data FROM reservations WHERE 1 = 1"
+            params: list = []
+            if trainer_id:
+                sql += " AND trainerId = ?"
+                params.append(trainer_id)
+            if user_id:
+                sql += " AND userId = ?"
+                params.append(user_id)
+            if status:
+                sql += " AND json_extract(data, '$.status') = ?"
+                params.append(status)
+            if date_from:
+                sql += " AND json_extract(data, '$.date') >= ?"
+                params.append(date_from)
+            if date_to:
+                sql += " AND json_extract(data, '$.date') <= ?"
+                params.append(date_to)
+            if after:
+                sql += f" AND ({', '.join(order)}) < ({', '.join('?' * len(order))})"
+                params.extend(after)
+            sql += " ORDER BY " + ", ".join(f"{column} DESC" for column in order)
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+            return [project(_json_row(row), fields) for row in conn.execute(sql, params)]
+        return await self._run(query)
+
+    # ---- idempotency keys ----
+
+    @staticmethod
+    def _select_idempotency(conn: sqlite3.Connection, key_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT id, expiresAt, data FROM idempotency_keys WHERE id = ?", (key_id,)).fetchone()
+        return _idempotency_row(row)
+
+    async def get_idempotency_record(self, key_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(lambda conn: self._select_idempotency(conn, key_id))
+
+    async def delete_expired_idempotency_records(self, now: datetime, limit: int) -> int:
+        def delete(conn):
+            cursor = conn.execute(
+                "DELETE FROM idempotency_keys WHERE id IN "
+                "(SELECT id FROM idempotency_keys WHERE expiresAt <= ? LIMIT ?)",
+                (_ts(now), limit),
+            )
+            return cursor.rowcount
+        return await self._run(delete)
+
+    def _replay(self, conn: sqlite3.Connection, idempotency: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if idempotency is None:
+            return None
+        return idempotent_result(self._select_idempotency(conn, idempotency["id"]), idempotency)
+
+    @staticmethod
+    def _record(conn: sqlite3.Connection, idempotency: Optional[Dict[str, Any]], result: Dict[str, Any]) -> None:
+        if idempotency is None:
+            return
+        record = {key: value for key, value in idempotency.items() if key not in ("id", "expiresAt")}
+        conn.execute(
+            "INSERT OR REPLACE INTO idempotency_keys (id, expiresAt, data) VALUES (?, ?, ?)",
+            (idempotency["id"], _ts(idempotency["expiresAt"]), json.dumps({**record, "result": result})),
+        )
+
+    # ---- transactions ----
+
+    async def book_reservation(
+        self,
+        reservation_data: Dict[str, Any],
+        start_at: datetime,
+        num_slots: int,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        res_id = _new_id()
+        doc_ids = course_slot_ids(reservation_data["trainerId"], start_at, num_slots)
+        reservation_data = {**reservation_data, "slotIds": doc_ids}
+
+        def book(conn):
+            replay = self._replay(conn, idempotency)
+            if replay is not None:
+                return replay
+            placeholders = ", ".join("?" * len(doc_ids))
+            rows = conn.execute(
+                f"SELECT id, isBooked FROM availabilities WHERE id IN ({placeholders})",
+                doc_ids,
+            ).fetchall()
+            if len(rows) < len(doc_ids):
+                raise SlotUnavailableError()
+            if any(row["isBooked"] for row in rows):
+                raise SlotAlreadyBookedError()
+
+            conn.execute(
+                "INSERT INTO reservations (id, userId, trainerId, createdAt, data) VALUES (?, ?, ?, ?, ?)",
+                (
+                    res_id,
+                    reservation_data.get("userId"),
+                    reservation_data.get("trainerId"),
+                    reservation_data.get("createdAt"),
+                    json.dumps(reservation_data),
+                ),
+            )
+            conn.executemany(
+                "UPDATE availabilities SET isBooked = 1 WHERE id = ?",
+                [(row["id"],) for row in rows],
+            )
+            reservation = {"id": res_id, **reservation_data}
+            self._record(conn, idempotency, reservation)
+            return reservation
+        return await self._run_in_transaction(book)
+
+    async def cancel_reservation(
+        self,
+        reservation_id: str,
+        updated_at: str,
+        validate: Optional[Callable[[Dict[str, Any]], None]] = None,
+        idempotency: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        def cancel(conn):
+            replay = self._replay(conn, idempotency)
+            if replay is not None:
+                return replay
+            row = conn.execute("SELECT id, data FROM reservations WHERE id = ?", (reservation_id,)).fetchone()
+            if row is None:
+                return None
+            reservation = _json_row(row)
+            if validate is not None:
+                validate(reservation)
+            if reservation.get("status") == "cancelled":
+                return reservation
+
+            slot_ids = reservation_slot_ids(reservation)
+            data = json.loads(row["data"])
+            data["status"] = "cancelled"
+            data["updatedAt"] = updated_at
+            conn.execute("UPDATE reservations SET data = ? WHERE id = ?", (json.dumps(data), reservation_id))
+            conn.executemany(
+                "UPDATE availabilities SET isBooked = 0 WHERE id = ?",
+                [(doc_id,) for doc_id in slot_ids],
+            )
+            reservation["slotIds"] = slot_ids
+            self._record(conn, idempotency, cancelled_result(reservation, updated_at))
+            return reservation
+        return await self._run_in_transaction(cancel)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
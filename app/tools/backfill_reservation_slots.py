@@ -0,0 +1,94 @@
+"""
+slotIds を持たない既存の予約に、予約時に確保した稼働枠IDを補完する
+
+使い方:
+    python -m app.tools.backfill_reservation_slots --dry-run
+    python -m app.tools.backfill_reservation_slots --utc-offset-minutes 540
+
+旧データの date + startTime は画面のローカル時刻のため、UTC とみなした場合と
+--utc-offset-minutes のローカル時刻とみなした場合の両方で、連続する枠がすべて予約済みになっている方を採用する。
+どちらにも当てはまらない予約は補完せず一覧を表示する（キャンセル時は従来どおり UTC とみなして解放される）。
+キャンセル済みの予約は解放する枠がないため対象外。
+STORAGE_BACKEND（firestore / firestore_bitmap）の稼働枠を参照する。
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.core.database import db
+from app.storage import StorageBackend, get_storage
+from app.storage.base import SLOT_MINUTES, course_slot_ids
+
+# 1 バッチあたりの書き込み数（Firestore の上限は 500）
+BATCH_SIZE = 400
+
+
+async def resolve_slot_ids(
+    storage: StorageBackend, data: Dict[str, Any], utc_offset_minutes: int
+) -> Optional[List[str]]:
+    """予約の枠IDを推定する（該当なしは None）"""
+    local = datetime.fromisoformat(f"{data['date']}T{data['startTime']}:00")
+    candidates = [
+        local.replace(tzinfo=timezone.utc),
+        local.replace(tzinfo=timezone(timedelta(minutes=utc_offset_minutes))),
+    ]
+    num_slots = data["courseMinutes"] // SLOT_MINUTES
+    for start_at in candidates:
+        slot_ids = course_slot_ids(data["trainerId"], start_at, num_slots)
+        slots = await asyncio.gather(*[storage.get_availability(doc_id) for doc_id in slot_ids])
+        if all(slot is not None and slot.get("isBooked") for slot in slots):
+            return slot_ids
+    return None
+
+
+async def backfill(dry_run: bool, utc_offset_minutes: int) -> None:
+    storage = get_storage()
+    batch = db.batch()
+    pending = 0
+    updated = 0
+    skipped = 0
+    unresolved = []
+
+    async for doc in db.collection("reservations").stream():
+        data = doc.to_dict()
+        if data.get("slotIds") or data.get("status") == "cancelled":
+            skipped += 1
+            continue
+
+        slot_ids = await resolve_slot_ids(storage, data, utc_offset_minutes)
+        if slot_ids is None:
+            unresolved.append(doc.id)
+            continue
+
+        batch.update(doc.reference, {"slotIds": slot_ids})
+        updated += 1
+        pending += 1
+        if pending >= BATCH_SIZE:
+            if not dry_run:
+                await batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending and not dry_run:
+        await batch.commit()
+
+    for reservation_id in unresolved:
+        print(f"unresolved: {reservation_id}")
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}updated: {updated}, skipped: {skipped}, unresolved: {len(unresolved)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="予約に確保済みの稼働枠IDを補完")
+    parser.add_argument("--dry-run", action="store_true", help="書き込みを行わず件数のみ表示")
+    parser.add_argument(
+        "--utc-offset-minutes", type=int, default=540,
+        help="旧データの date / startTime のローカル時刻の UTC からのオフセット（デフォルト: 540 = JST）"
+    )
+    args = parser.parse_args()
+    asyncio.run(backfill(args.dry_run, args.utc_offset_minutes))
+
+
+if __name__ == "__main__":
+    main()
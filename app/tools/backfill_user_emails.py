@@ -0,0 +1,78 @@
+"""
+既存ユーザーのメールアドレスの索引（user_emails/{正規化したメールアドレス} -> userId）を作成する
+
+使い方:
+    python -m app.tools.backfill_user_emails --dry-run
+    python -m app.tools.backfill_user_emails
+
+既に索引があるメールアドレスは変更しない。正規化（前後の空白を除き小文字）すると同じになる
+メールアドレスを複数のユーザーが使っている場合は、作成日時が最も古いユーザーを索引に登録し、
+残りを一覧表示する（該当ユーザーは索引経由ではログインできないため、メールアドレスの変更が必要）。
+完了後は USER_EMAIL_INDEX_FALLBACK=false にすると、ログインが索引の読み取りのみになる。
+"""
+import argparse
+import asyncio
+from typing import Dict, List, Tuple
+
+from app.core.database import db
+from app.storage.base import normalize_email
+from app.storage.firestore import EMAILS_COLLECTION, email_index_id
+
+# 1 バッチあたりの書き込み数（Firestore の上限は 500）
+BATCH_SIZE = 400
+
+
+async def backfill(dry_run: bool) -> None:
+    # 正規化したメールアドレス -> (作成日時, ユーザーID) のリスト
+    owners: Dict[str, List[Tuple[str, str]]] = {}
+    no_email = 0
+    async for doc in db.collection("users").select(["email", "createdAt"]).stream():
+        data = doc.to_dict()
+        email = normalize_email(data.get("email"))
+        if not email:
+            no_email += 1
+            continue
+        owners.setdefault(email, []).append((data.get("createdAt", ""), doc.id))
+
+    created = 0
+    existing = 0
+    duplicates = []
+    emails = sorted(owners)
+    for i in range(0, len(emails), BATCH_SIZE):
+        chunk = emails[i:i + BATCH_SIZE]
+        refs = [db.collection(EMAILS_COLLECTION).document(email_index_id(email)) for email in chunk]
+        found = {doc.id for doc in [doc async for doc in db.get_all(refs)] if doc.exists}
+
+        batch = db.batch()
+        pending = 0
+        for email, ref in zip(chunk, refs):
+            users = sorted(owners[email])
+            duplicates.extend((email, user_id) for _, user_id in users[1:])
+            if ref.id in found:
+                existing += 1
+                continue
+            # 他の処理が先に作成した場合はバッチ全体が失敗するため、再実行すればよい
+            batch.create(ref, {"userId": users[0][1]})
+            created += 1
+            pending += 1
+        if pending and not dry_run:
+            await batch.commit()
+
+    for email, user_id in duplicates:
+        print(f"duplicate: {email} {user_id}")
+    prefix = "[dry-run] " if dry_run else ""
+    print(
+        f"{prefix}created: {created}, existing: {existing}, "
+        f"duplicates: {len(duplicates)}, no email: {no_email}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="既存ユーザーのメールアドレスの索引を作成")
+    parser.add_argument("--dry-run", action="store_true", help="書き込みを行わず件数のみ表示")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+一覧の応答の作成にかかる時間を、従来の方法と list_response で比較する
+
+使い方:
+    python -m app.tools.bench_serialization
+    python -m app.tools.bench_serialization --rows 5000 --runs 20
+
+従来: ドキュメントごとにモデルを作成 → FastAPI が response_model でリスト全体を再検証・変換 → JSONResponse（標準の json）
+現在: list_response（検証と JSON への変換を pydantic-core で 1 回ずつ）
+参考: 従来の変換結果を ORJSONResponse で JSON にした場合（既定の応答クラス）
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.core.serialization import list_response
+from app.schemas.reservation import ReservationResponse
+
+
+def make_rows(count: int) -> List[Dict[str, Any]]:
+    """トレーナーの予約一覧を想定したドキュメント（応答に含めない slotIds も持つ）"""
+    return [
+        {
+            "id": f"reservation{i:06d}",
+            "userId": f"user{i % 500:04d}",
+            "user_name": "山田 太郎",
+            "trainerId": "trainer0001",
+            "date": "2026-10-20",
+            "startTime": "09:00",
+            "endTime": "10:00",
+            "courseMinutes": 60,
+            "status": "active",
+            "createdAt": "2026-10-18T09:00:00.000000",
+            "updatedAt": "2026-10-18T09:00:00.000000",
+            "slotIds": ["trainer0001_20261020T000000Z", "trainer0001_20261020T003000Z"],
+        }
+        for i in range(count)
+    ]
+
+
+def measure(func: Callable[[], bytes], runs: int) -> float:
+    """1 回あたりの時間（ミリ秒、中央値）"""
+    func()
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="一覧の応答の作成時間を比較")
+    parser.add_argument("--rows", type=int, default=2000, help="1 応答あたりの件数")
+    parser.add_argument("--runs", type=int, default=20, help="計測回数")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    field = create_response_field(name="Response_bench", type_=List[ReservationResponse])
+    loop = asyncio.new_event_loop()
+
+    def legacy(response_class) -> bytes:
+        models = [ReservationResponse(**data) for data in rows]
+        content = loop.run_until_complete(
+            serialize_response(field=field, response_content=models, is_coroutine=True)
+        )
+        return response_class(content).body
+
+    cases = {
+        "legacy (json)": lambda: legacy(JSONResponse),
+        "legacy (orjson)": lambda: legacy(ORJSONResponse),
+        "list_response": lambda: list_response(ReservationResponse, rows).body,
+    }
+    # 出力される JSON が同じであることを確認する
+    assert orjson.loads(cases["legacy (json)"]()) == orjson.loads(cases["list_response"]())
+
+    results = {name: measure(func, args.runs) for name, func in cases.items()}
+    baseline = results["legacy (json)"]
+    for name, elapsed in results.items():
+        print(f"{name:16s} {elapsed:8.2f} ms  x{baseline / elapsed:.1f}")
+    print(f"rows: {args.rows}, runs: {args.runs}")
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
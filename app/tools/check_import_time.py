@@ -0,0 +1,73 @@
+"""
+`import app.main` にかかる時間を計測し、予算を超えた場合は終了コード 1 で終了する
+
+使い方:
+    python -m app.tools.check_import_time
+    python -m app.tools.check_import_time --budget-ms 800 --runs 5 --top 15
+
+毎回新しいプロセスで `python -X importtime -c "import app.main"` を実行し、
+所要時間の中央値と、最も遅かった回の累積時間の上位モジュールを表示する。
+コールドスタートを速く保つため、google.cloud.firestore などの重いライブラリは
+app.main のインポート時ではなく初回利用時（起動後のウォームアップ）に読み込む。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 所要時間（中央値）の上限（ミリ秒）。tests/test_import_time.py も同じ値を使う
+DEFAULT_BUDGET_MS = 1000
+
+
+def measure() -> Tuple[float, List[Tuple[int, str]]]:
+    """1 回分の (秒, [(累積マイクロ秒, モジュール名)]) を返す"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise SystemExit("import app.main failed")
+    modules = []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        modules.append((int(cumulative), name.strip()))
+    return elapsed, modules
+
+
+def firestore_modules(modules: List[Tuple[int, str]]) -> List[str]:
+    """インポートされた google.cloud.firestore 系のモジュール（起動時に読み込むべきでないもの）"""
+    return [name for _, name in modules if name.split(".")[0] == "google" and "firestore" in name]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="app.main のインポート時間を計測")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="所要時間（中央値）の上限（ミリ秒）")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument("--top", type=int, default=15, help="表示するモジュール数")
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(max(1, args.runs))]
+    median_ms = statistics.median(elapsed for elapsed, _ in runs) * 1000
+    _, slowest = max(runs, key=lambda run: run[0])
+    for cumulative, name in sorted(slowest, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:9.1f} ms  {name}")
+    heavy = firestore_modules(slowest)
+    if heavy:
+        print(f"warning: firestore is imported by app.main ({heavy[0]})")
+    print(f"median: {median_ms:.1f} ms (runs: {len(runs)}, budget: {args.budget_ms:.0f} ms)")
+    if median_ms > args.budget_ms:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+既存の availabilities（1枠1ドキュメント）を availability_days（トレーナー・日単位のビットマスク）に変換する
+
+使い方:
+    python -m app.tools.convert_to_day_bitmaps --dry-run
+    python -m app.tools.convert_to_day_bitmaps
+
+変換後に STORAGE_BACKEND=firestore_bitmap で起動する。元の availabilities は削除しないため、
+firestore に戻せばそのまま切り戻せる（切り替え後に作成・予約された枠は反映されない）。
+30分単位に揃っていない枠は変換できないためスキップする。
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+from typing import Any, Dict
+
+from app.core.database import db
+from app.storage.base import SLOT_MINUTES, to_utc
+from app.storage.firestore_bitmap import DAYS_COLLECTION, day_doc_id, day_start, slot_position
+
+# 1 バッチあたりの書き込み数（Firestore の上限は 500）
+BATCH_SIZE = 400
+
+
+async def convert(dry_run: bool) -> None:
+    days: Dict[str, Dict[str, Any]] = {}
+    converted = 0
+    skipped = 0
+
+    async for doc in db.collection("availabilities").stream():
+        data = doc.to_dict()
+        start_at = to_utc(data["startAt"])
+        try:
+            day, index = slot_position(start_at)
+        except ValueError:
+            print(f"skip (not aligned): {doc.id} {start_at.isoformat()}")
+            skipped += 1
+            continue
+
+        doc_id = day_doc_id(data["trainerId"], day)
+        day_data = days.setdefault(doc_id, {
+            "trainerId": data["trainerId"],
+            "date": day.isoformat(),
+            "dayStart": day_start(day),
+            "openMask": 0,
+            "bookedMask": 0,
+            "slotMeta": {},
+        })
+        bit = 1 << index
+        day_data["openMask"] |= bit
+        if data.get("isBooked"):
+            day_data["bookedMask"] |= bit
+        end_at = data.get("endAt")
+        if end_at is not None and to_utc(end_at) != start_at + timedelta(minutes=SLOT_MINUTES):
+            day_data["slotMeta"][str(index)] = {"endAt": end_at}
+        converted += 1
+
+    collection = db.collection(DAYS_COLLECTION)
+    batch = db.batch()
+    pending = 0
+    for doc_id, day_data in days.items():
+        ref = collection.document(doc_id)
+        # 既に日単位ドキュメントがある場合はマスクを OR で統合
+        existing = await ref.get()
+        if existing.exists:
+            current = existing.to_dict()
+            day_data["openMask"] |= current.get("openMask", 0)
+            day_data["bookedMask"] |= current.get("bookedMask", 0)
+            day_data["slotMeta"] = {**(current.get("slotMeta") or {}), **day_data["slotMeta"]}
+        if not day_data["slotMeta"]:
+            del day_data["slotMeta"]
+        batch.set(ref, day_data)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            if not dry_run:
+                await batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending and not dry_run:
+        await batch.commit()
+
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}slots: {converted}, day documents: {len(days)}, skipped: {skipped}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="稼働枠を日単位ビットマスク形式に変換")
+    parser.add_argument("--dry-run", action="store_true", help="書き込みを行わず件数のみ表示")
+    args = parser.parse_args()
+    asyncio.run(convert(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+既存の availabilities ドキュメントを `{trainerId}_{開始時刻(UTC)}` 形式の ID に移行する
+
+使い方:
+    python -m app.tools.migrate_slot_ids --dry-run
+    python -m app.tools.migrate_slot_ids
+
+移行中に作成された予約は旧 ID の枠を参照できないため、予約受付を止めた状態で実行すること。
+同じ開始時刻の枠が複数ある場合は 1 つに統合し、いずれかが予約済みなら予約済みとして残す。
+"""
+import argparse
+import asyncio
+from typing import Any, Dict
+
+from app.core.database import db
+from app.storage.base import slot_id
+
+# 1 バッチあたりの書き込み数（Firestore の上限は 500）
+BATCH_SIZE = 400
+
+
+async def migrate(dry_run: bool) -> None:
+    collection = db.collection("availabilities")
+    batch = db.batch()
+    pending = 0
+    migrated = 0
+    merged = 0
+    unchanged = 0
+    # このプロセスで書き込んだ新しい ID（未コミット分の重複検出用）
+    written: Dict[str, Dict[str, Any]] = {}
+
+    async for doc in collection.stream():
+        data = doc.to_dict()
+        new_id = slot_id(data["trainerId"], data["startAt"])
+        if doc.id == new_id:
+            unchanged += 1
+            continue
+
+        new_ref = collection.document(new_id)
+        existing = written.get(new_id)
+        if existing is None:
+            snapshot = await new_ref.get()
+            existing = snapshot.to_dict() if snapshot.exists else None
+
+        if existing is None:
+            batch.set(new_ref, data)
+            written[new_id] = data
+            migrated += 1
+        else:
+            # 同じ開始時刻の枠が既にある場合は統合（予約済みを優先）
+            if data.get("isBooked") and not existing.get("isBooked"):
+                batch.update(new_ref, {"isBooked": True})
+                existing["isBooked"] = True
+                pending += 1
+            written[new_id] = existing
+            merged += 1
+
+        batch.delete(doc.reference)
+        pending += 2
+
+        if pending >= BATCH_SIZE:
+            if not dry_run:
+                await batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    if pending and not dry_run:
+        await batch.commit()
+
+    prefix = "[dry-run] " if dry_run else ""
+    print(f"{prefix}migrated: {migrated}, merged: {merged}, unchanged: {unchanged}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="稼働枠ドキュメントIDの移行")
+    parser.add_argument("--dry-run", action="store_true", help="書き込みを行わず件数のみ表示")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
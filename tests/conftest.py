@@ -0,0 +1,81 @@
+"""
+API のテスト共通の設定
+
+GCP なしで実行できるよう、インメモリのストレージ（STORAGE_BACKEND=memory）で app.main を読み込む。
+設定はインポート時に読まれるため、環境変数は app をインポートする前に設定する。
+"""
+import os
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+@pytest.fixture(scope="session")
+def client() -> TestClient:
+    return TestClient(app)
+
+
+def signup(client: TestClient, role: str = "trainee") -> Dict[str, Any]:
+    """ユーザーを作成し、user と認証ヘッダー（headers）を返す（テストごとに別のメールアドレス）"""
+    body = {"name": role, "email": f"{uuid.uuid4().hex}@example.com", "password": "password", "role": role}
+    res = client.post("/api/auth/signup", json=body)
+    assert res.status_code == 200, res.text
+    data = res.json()
+    return {"user": data["user"], "headers": {"Authorization": f"Bearer {data['access_token']}"}}
+
+
+@pytest.fixture
+def trainer(client: TestClient) -> Dict[str, Any]:
+    return signup(client, "trainer")
+
+
+@pytest.fixture
+def member(client: TestClient) -> Dict[str, Any]:
+    return signup(client)
+
+
+@pytest.fixture
+def day() -> str:
+    """予約期限（前日24時）に掛からない日付"""
+    return (date.today() + timedelta(days=5)).isoformat()
+
+
+def slot_times(day: str, hour: int = 9, count: int = 4) -> List[Dict[str, str]]:
+    """day の hour 時（UTC）から 30 分単位で count 個の稼働枠"""
+    start = datetime.fromisoformat(day).replace(hour=hour, tzinfo=timezone.utc)
+    return [
+        {
+            "startAt": (start + timedelta(minutes=30 * i)).isoformat(),
+            "endAt": (start + timedelta(minutes=30 * (i + 1))).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def open_slots(client: TestClient, trainer: Dict[str, Any], day: str, hour: int = 9, count: int = 4) -> List[Dict[str, Any]]:
+    res = client.post(
+        "/api/availabilities/",
+        json={"trainerId": trainer["user"]["id"], "slots": slot_times(day, hour, count)},
+        headers=trainer["headers"],
+    )
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def reservation_body(trainer: Dict[str, Any], day: str, start_time: str = "09:00", course_minutes: int = 60) -> Dict[str, Any]:
+    return {
+        "trainerId": trainer["user"]["id"],
+        "date": day,
+        "startTime": start_time,
+        "courseMinutes": course_minutes,
+        "startAt": f"{day}T{start_time}:00.000Z",
+    }
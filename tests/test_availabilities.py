@@ -0,0 +1,75 @@
+"""稼働枠の登録・削除・テンプレート・空き時間検索のテスト"""
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+from app.storage import get_storage
+from app.storage.base import SlotAlreadyBookedError
+
+from conftest import open_slots, reservation_body
+
+
+def test_create_rejects_unaligned_slots(client, trainer, day):
+    res = client.post(
+        "/api/availabilities/",
+        json={
+            "trainerId": trainer["user"]["id"],
+            "slots": [{"startAt": f"{day}T09:10:00+00:00", "endAt": f"{day}T09:40:00+00:00"}],
+        },
+        headers=trainer["headers"],
+    )
+    assert res.status_code == 400
+
+
+def test_delete_booked_slot_returns_400(client, trainer, member, day):
+    slots = open_slots(client, trainer, day)
+    assert client.post("/api/reservations/", json=reservation_body(trainer, day), headers=member["headers"]).status_code == 200
+
+    res = client.delete(f"/api/availabilities/{slots[0]['id']}", headers=trainer["headers"])
+    assert res.status_code == 400
+    # エンドポイントの確認の後に予約された場合も、ストレージの削除が予約済みの枠を拒否する
+    with pytest.raises(SlotAlreadyBookedError):
+        asyncio.run(get_storage().delete_availability(slots[1]["id"]))
+
+    res = client.delete(f"/api/availabilities/{slots[2]['id']}", headers=trainer["headers"])
+    assert res.status_code == 200
+
+
+@pytest.mark.parametrize("extra, status", [
+    ({}, 200),
+    ({"startTime": "09:00:00"}, 400),
+    ({"startTime": "09:15"}, 400),
+    ({"utcOffsetMinutes": 100000}, 422),
+])
+def test_template_validation(client, trainer, day, extra, status):
+    body = {
+        "trainerId": trainer["user"]["id"],
+        "weekdays": list(range(7)),
+        "startTime": "09:00",
+        "endTime": "10:00",
+        "startDate": day,
+        "endDate": day,
+        **extra,
+    }
+    res = client.post("/api/availabilities/templates", json=body, headers=trainer["headers"])
+    assert res.status_code == status, res.text
+
+
+@pytest.mark.parametrize("start, end", [
+    ("{day}T00:00:00+00:00", "{next_day}"),
+    ("{day}", "{next_day}T00:00:00+09:00"),
+    ("{day}", "{next_day}"),
+])
+def test_windows_accepts_mixed_offsets(client, trainer, day, start, end):
+    open_slots(client, trainer, day)
+    next_day = (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+    params = {
+        "course_minutes": 60,
+        "from": start.format(day=day, next_day=next_day),
+        "to": end.format(day=day, next_day=next_day),
+        "trainer_id": trainer["user"]["id"],
+    }
+    res = client.get("/api/availabilities/windows", params=params)
+    assert res.status_code == 200, res.text
+    assert [w["startAt"][11:16] for w in res.json()] == ["09:00", "09:30", "10:00"]
@@ -0,0 +1,22 @@
+"""`import app.main` の所要時間の予算（コールドスタート）のテスト"""
+import os
+import statistics
+
+from app.tools.check_import_time import DEFAULT_BUDGET_MS, firestore_modules, measure
+
+# 計測回数（中央値で判定する）
+RUNS = 3
+
+
+def test_import_time_within_budget():
+    # 遅い CI などでは IMPORT_TIME_BUDGET_MS で上限を変更できる
+    budget_ms = float(os.getenv("IMPORT_TIME_BUDGET_MS", DEFAULT_BUDGET_MS))
+    runs = [measure() for _ in range(RUNS)]
+    median_ms = statistics.median(elapsed for elapsed, _ in runs) * 1000
+    assert median_ms <= budget_ms, f"import app.main took {median_ms:.1f} ms (budget: {budget_ms:.0f} ms)"
+
+
+def test_firestore_is_not_imported_at_startup():
+    # Firestore のクライアントは初回利用時（起動後のウォームアップ）に読み込む
+    _, modules = measure()
+    assert firestore_modules(modules) == []
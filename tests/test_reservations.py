@@ -0,0 +1,182 @@
+"""予約の作成・キャンセル・冪等キー・ページングのテスト"""
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.services.idempotency import REPLAYED_HEADER, idempotency_keys
+from app.storage import get_storage
+
+from conftest import open_slots, reservation_body, signup
+
+
+def book(client, member, trainer, day, start_time="09:00", course_minutes=60, headers=None):
+    return client.post(
+        "/api/reservations/",
+        json=reservation_body(trainer, day, start_time, course_minutes),
+        headers={**member["headers"], **(headers or {})},
+    )
+
+
+# ---- 予約 ----
+
+def test_book_reserves_consecutive_slots(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    res = book(client, member, trainer, day)
+    assert res.status_code == 200, res.text
+    assert res.json()["status"] == "active"
+
+    slots = client.get(f"/api/availabilities/?date={day}&trainer_id={trainer['user']['id']}").json()
+    booked = {slot["startAt"][11:16] for slot in slots if slot["isBooked"]}
+    assert booked == {"09:00", "09:30"}
+
+
+def test_book_conflict_returns_400(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    assert book(client, member, trainer, day).status_code == 200
+
+    # 同じ枠・一部が重なる枠は SlotAlreadyBookedError -> 400
+    other = signup(client)
+    for start_time in ("09:00", "09:30"):
+        res = book(client, other, trainer, day, start_time)
+        assert res.status_code == 400
+        assert res.json()["detail"] == "既に予約されている時間枠が含まれています"
+
+
+def test_book_without_availability_returns_400(client, trainer, member, day):
+    open_slots(client, trainer, day, count=2)
+    # 10:00 以降は稼働枠がない（SlotUnavailableError）
+    res = book(client, member, trainer, day, "09:30")
+    assert res.status_code == 400
+    assert res.json()["detail"] == "指定された時間枠の空きがありません"
+
+
+# ---- キャンセル ----
+
+def test_cancel_releases_slots(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    reservation = book(client, member, trainer, day).json()
+
+    res = client.post(f"/api/reservations/{reservation['id']}/cancel", headers=member["headers"])
+    assert res.status_code == 200
+    assert res.json()["status"] == "success"
+
+    res = client.post(f"/api/reservations/{reservation['id']}/cancel", headers=member["headers"])
+    assert res.json() == {"message": "既にキャンセルされています"}
+
+    # 解放した枠は他の会員が予約できる
+    assert book(client, signup(client), trainer, day).status_code == 200
+
+
+def test_cancel_by_other_member_is_forbidden(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    reservation = book(client, member, trainer, day).json()
+    res = client.post(f"/api/reservations/{reservation['id']}/cancel", headers=signup(client)["headers"])
+    assert res.status_code == 403
+
+
+def test_cancel_unknown_reservation_returns_404(client, member):
+    res = client.post("/api/reservations/missing/cancel", headers=member["headers"])
+    assert res.status_code == 404
+
+
+def test_cancel_after_deadline_returns_400(client, trainer, member):
+    # 期限（前日24時）を過ぎた予約は API からは作れないため、ストレージに直接作成する
+    storage = get_storage()
+    yesterday = date.today() - timedelta(days=1)
+    start_at = datetime(yesterday.year, yesterday.month, yesterday.day, 9, tzinfo=timezone.utc)
+    now = datetime.now().isoformat()
+
+    async def create():
+        await storage.create_availabilities(trainer["user"]["id"], [(start_at, start_at + timedelta(minutes=30))])
+        return await storage.book_reservation({
+            "userId": member["user"]["id"],
+            "user_name": member["user"]["name"],
+            "trainerId": trainer["user"]["id"],
+            "date": yesterday.isoformat(),
+            "startTime": "09:00",
+            "endTime": "09:30",
+            "courseMinutes": 30,
+            "status": "active",
+            "createdAt": now,
+            "updatedAt": now,
+        }, start_at, 1)
+
+    reservation = asyncio.run(create())
+    res = client.post(f"/api/reservations/{reservation['id']}/cancel", headers=member["headers"])
+    assert res.status_code == 400
+    assert "期限" in res.json()["detail"]
+
+
+# ---- Idempotency-Key ----
+
+def test_create_replays_with_same_key(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    key = {"Idempotency-Key": "create-1"}
+    first = book(client, member, trainer, day, headers=key)
+    second = book(client, member, trainer, day, headers=key)
+    assert first.status_code == second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert REPLAYED_HEADER not in first.headers
+    assert second.headers[REPLAYED_HEADER] == "true"
+
+
+def test_create_with_reused_key_and_different_body_returns_422(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    key = {"Idempotency-Key": "create-2"}
+    assert book(client, member, trainer, day, headers=key).status_code == 200
+    res = book(client, member, trainer, day, "10:00", headers=key)
+    assert res.status_code == 422
+
+
+def test_cancel_replays_with_same_key(client, trainer, member, day):
+    open_slots(client, trainer, day)
+    first_id = book(client, member, trainer, day, "09:00", 30).json()["id"]
+    second_id = book(client, member, trainer, day, "09:30", 30).json()["id"]
+    headers = {**member["headers"], "Idempotency-Key": "cancel-1"}
+
+    assert client.post(f"/api/reservations/{first_id}/cancel", headers=headers).json()["status"] == "success"
+    res = client.post(f"/api/reservations/{first_id}/cancel", headers=headers)
+    assert res.json()["status"] == "success"
+    assert res.headers[REPLAYED_HEADER] == "true"
+
+    # 同じキーで別の予約をキャンセルしようとした場合
+    assert client.post(f"/api/reservations/{second_id}/cancel", headers=headers).status_code == 422
+
+
+def test_cancel_replayed_by_storage_is_recorded_as_cancelled(client, trainer, member, day):
+    # 同じキーの同時の再送がストレージまで届いた場合も、記録はキャンセル後の予約になっている
+    open_slots(client, trainer, day)
+    reservation = book(client, member, trainer, day).json()
+    storage = get_storage()
+    record = idempotency_keys.new_record(
+        member["user"]["id"], "cancel", "cancel-2", {"reservationId": reservation["id"]}
+    )
+    updated_at = datetime.now().isoformat()
+
+    first = asyncio.run(storage.cancel_reservation(reservation["id"], updated_at, idempotency=record))
+    replay = asyncio.run(storage.cancel_reservation(reservation["id"], updated_at, idempotency=record))
+    assert first["status"] == "active"
+    assert replay["status"] == "cancelled"
+    assert replay["updatedAt"] == updated_at
+
+
+# ---- ページング ----
+
+def test_reservations_are_paged_with_cursor(client, trainer, member, day):
+    open_slots(client, trainer, day, count=3)
+    ids = {book(client, member, trainer, day, start_time, 30).json()["id"] for start_time in ("09:00", "09:30", "10:00")}
+
+    first = client.get("/api/reservations/?limit=2", headers=member["headers"])
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    cursor = first.headers[NEXT_CURSOR_HEADER]
+
+    second = client.get("/api/reservations/", params={"limit": 2, "cursor": cursor}, headers=member["headers"])
+    assert len(second.json()) == 1
+    assert NEXT_CURSOR_HEADER not in second.headers
+    assert {r["id"] for r in first.json() + second.json()} == ids
+
+
+def test_invalid_cursor_returns_400(client, member):
+    res = client.get("/api/reservations/?cursor=invalid", headers=member["headers"])
+    assert res.status_code == 400